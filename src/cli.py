@@ -0,0 +1,171 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+import yaml
+
+# subcommand -> (first stage, last stage) of the pipeline it runs
+STAGE_COMMANDS = {
+    "download": ("download", "download"),
+    "explore": ("explore", "explore"),
+    "dedup": ("dedup", "dedup"),
+    "process": ("process", "image_cache"),
+    "train": ("train", "train"),
+    "export": ("export", "export"),
+    "eval": ("evaluate", "evaluate"),
+}
+
+# Modules the light subcommands import on their code path, and what they must not pull in
+IMPORT_BUDGET_MODULES = {
+    "download": ["src.pipeline.stages", "src.data_processing.data_downloader"],
+    "process": ["src.pipeline.stages", "src.data_processing.data_processor"],
+    "explore": ["src.pipeline.stages", "src.data_exploration.data_explorer"],
+    "dedup": ["src.pipeline.stages", "src.data_processing.dedup"],
+}
+HEAVY_MODULES = ("torch", "ultralytics", "mlflow", "tensorflow", "matplotlib", "seaborn", "gdown")
+
+
+def load_config(path):
+    with open(path, "r") as f:
+        return yaml.safe_load(f)
+
+
+def run_stages(args):
+    """Run the pipeline, or the stages of one subcommand; up-to-date stages are skipped unless --force."""
+    from src.pipeline.stages import build_pipeline
+
+    config = load_config(args.config)
+    pipeline = build_pipeline(config, workers=args.workers or config.get("pipeline", {}).get("workers", 2))
+    if args.command in STAGE_COMMANDS:
+        start, end = STAGE_COMMANDS[args.command]
+        if start not in pipeline.stages:
+            raise SystemExit(f"Stage '{start}' is disabled in {args.config}")
+        if end not in pipeline.stages:
+            end = start
+    else:
+        start, end = args.start, args.end
+    pipeline.run(start=start, end=end, force=args.force)
+
+
+def predict(args):
+    """Detect objects in images and print (or write) the detections as JSON."""
+    from src.inference.predictor import YOLOv7Predictor
+
+    config = load_config(args.config)
+    inference_config = config.get("inference", {})
+    predictor = YOLOv7Predictor(
+        args.model,
+        imgsz=args.imgsz or config["training"]["imgsz"],
+        batch_size=inference_config.get("batch_size", 8),
+        num_threads=inference_config.get("num_threads"),
+        tile_config=inference_config.get("tile_config") if args.tiled else None,
+    )
+    conf = inference_config.get("conf_threshold", 0.25) if args.conf is None else args.conf
+    iou = inference_config.get("iou_threshold", 0.45) if args.iou is None else args.iou
+    predict_batch = predictor.predict_tiled if args.tiled else predictor.predict_batch
+    names = config["dataset"]["classes"]
+    detections = {}
+    for image_path, boxes in zip(args.images, predict_batch(args.images, conf, iou)):
+        detections[image_path] = [
+            {"box": [round(float(v), 1) for v in box[:4]], "score": round(float(box[4]), 4), "class": names[int(box[5])]}
+            for box in boxes
+        ]
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(detections, f, indent=2)
+        print(f"Detections for {len(detections)} images saved to {args.output}")
+    else:
+        print(json.dumps(detections, indent=2))
+
+
+def check_imports(args):
+    """
+    Import each light subcommand's code path in a fresh interpreter and check its import budget.
+
+    Fails when a heavy framework is loaded or the imports take longer than --budget seconds.
+    """
+    failures = []
+    for command, modules in IMPORT_BUDGET_MODULES.items():
+        code = (
+            "import json, sys, time\n"
+            "start = time.perf_counter()\n"
+            + "".join(f"import {module}\n" for module in modules)
+            + "elapsed = time.perf_counter() - start\n"
+            f"heavy = [m for m in {HEAVY_MODULES!r} if m in sys.modules]\n"
+            "print(json.dumps({'seconds': elapsed, 'heavy': heavy}))\n"
+        )
+        start = time.perf_counter()
+        result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+        startup = time.perf_counter() - start
+        if result.returncode != 0:
+            failures.append(command)
+            print(f"{command:<10} import failed:\n{result.stderr}")
+            continue
+        report = json.loads(result.stdout.strip().splitlines()[-1])
+        ok = not report["heavy"] and report["seconds"] <= args.budget
+        if not ok:
+            failures.append(command)
+        print(f"{command:<10} imports {report['seconds']:.3f}s, process {startup:.3f}s, "
+              f"heavy modules: {report['heavy'] or 'none'} {'OK' if ok else 'FAIL'}")
+    if failures:
+        raise SystemExit(f"Import budget exceeded by: {', '.join(failures)}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="WOTR object detection pipeline")
+    parser.add_argument("--config", default="config/config.yaml")
+    parser.add_argument("--trace", action="store_true",
+                        help="Record spans and counters and export them to tracing.output_dir")
+    subparsers = parser.add_subparsers(dest="command")
+
+    run_parser = subparsers.add_parser("run", help="Run the whole pipeline, skipping unchanged stages (default)")
+    run_parser.add_argument("--from", dest="start", help="First stage to run, with everything downstream of it")
+    run_parser.add_argument("--to", dest="end", help="Last stage to run, with everything upstream of it")
+    for name, help_text in (("download", "Download and extract the dataset"),
+                            ("explore", "Plot dataset statistics and choose the tile config"),
+                            ("dedup", "Find near-duplicate frames and cross-split leakage"),
+                            ("process", "Convert VOC to YOLO and build the image cache"),
+                            ("train", "Train the detector"),
+                            ("export", "Export ONNX/TFLite (and int8) models"),
+                            ("eval", "Evaluate best.pt on the val split")):
+        subparsers.add_parser(name, help=help_text)
+    for name, subparser in subparsers.choices.items():
+        subparser.add_argument("--force", action="store_true", help="Run even if the stage is up to date")
+        subparser.add_argument("--workers", type=int, help="Independent stages run at once")
+        subparser.set_defaults(handler=run_stages)
+
+    predict_parser = subparsers.add_parser("predict", help="Detect objects in images")
+    predict_parser.add_argument("model", help="Path to a .pt, .onnx or .tflite model")
+    predict_parser.add_argument("images", nargs="+")
+    predict_parser.add_argument("--imgsz", type=int)
+    predict_parser.add_argument("--conf", type=float)
+    predict_parser.add_argument("--iou", type=float)
+    predict_parser.add_argument("--tiled", action="store_true", help="Sliced inference with inference.tile_config")
+    predict_parser.add_argument("--output", help="JSON file for the detections, printed if omitted")
+    predict_parser.set_defaults(handler=predict)
+
+    imports_parser = subparsers.add_parser("check-imports", help="Check that light subcommands start fast")
+    imports_parser.add_argument("--budget", type=float, default=1.0, help="Allowed import time in seconds")
+    imports_parser.set_defaults(handler=check_imports)
+
+    args = parser.parse_args(argv)
+    if args.command is None:
+        args = parser.parse_args(["--config", args.config] + (["--trace"] if args.trace else []) + ["run"])
+    tracing_config = load_config(args.config).get("tracing", {}) if os.path.exists(args.config) else {}
+    if not (args.trace or tracing_config.get("enabled", False)):
+        args.handler(args)
+        return
+    from src import tracing
+
+    tracing.enable()
+    try:
+        args.handler(args)
+    finally:
+        tracing.export(tracing_config.get("output_dir", "outputs/trace"))
+
+
+if __name__ == "__main__":
+    main()
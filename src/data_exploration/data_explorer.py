@@ -1,34 +1,68 @@
+import json
 import os
-import matplotlib.pyplot as plt
-import seaborn as sns
 from collections import Counter
-import xml.etree.ElementTree as ET
+import numpy as np
+from src.data_processing.annotation_index import AnnotationIndex
+
+
+def choose_tile_config(widths, heights, object_sizes, imgsz=640, min_overlap=0.1, max_overlap=0.5):
+    """
+    Pick a tile size and overlap from dataset statistics.
+
+    Tiles match the network input so they are not downscaled (or the median short image side
+    when images are smaller). The overlap covers the 95th percentile size of objects smaller
+    than half a tile, so each such object lies whole inside at least one tile.
+
+    Args:
+        widths (np.ndarray): Image widths in pixels.
+        heights (np.ndarray): Image heights in pixels.
+        object_sizes (np.ndarray): Longest side of every annotated box in pixels.
+        imgsz (int): Network input size.
+        min_overlap (float): Lower bound of the overlap as a fraction of the tile size.
+        max_overlap (float): Upper bound of the overlap as a fraction of the tile size.
+
+    Returns:
+        dict: tile_size, overlap, and whether tiling is recommended (images much larger than imgsz).
+    """
+    widths, heights = np.asarray(widths, dtype=np.float64), np.asarray(heights, dtype=np.float64)
+    median_short = float(np.median(np.minimum(widths, heights)))
+    median_long = float(np.median(np.maximum(widths, heights)))
+    tile_size = int(min(imgsz, median_short))
+    object_sizes = np.asarray(object_sizes, dtype=np.float64)
+    small = object_sizes[object_sizes < tile_size / 2]
+    overlap = np.percentile(small, 95) if len(small) else min_overlap * tile_size
+    overlap = int(np.clip(overlap, min_overlap * tile_size, max_overlap * tile_size))
+    return {
+        "tile_size": tile_size,
+        "overlap": overlap,
+        "recommended": median_long >= 1.5 * imgsz,
+        "median_image_size": [float(np.median(widths)), float(np.median(heights))],
+        "downscale": round(imgsz / median_long, 3),
+    }
+
 
 class DataExplorer:
-    def __init__(self, annotations_dir, classes_names, output_dir):
-        """Initialize the DataExplorer with directory paths and class names."""
+    def __init__(self, annotations_dir, classes_names, output_dir, annotation_index=None):
+        """Initialize the DataExplorer with directory paths, class names and an optional shared annotation index."""
         self.annotations_dir = annotations_dir
         self.classes_names = classes_names
         self.output_dir = output_dir
+        self.annotation_index = annotation_index or AnnotationIndex(annotations_dir, classes_names)
         if not os.path.exists(self.output_dir):
             os.makedirs(self.output_dir)
 
     def get_class_counts(self):
         """Compute the count of each class in the annotations."""
-        class_counts = Counter()
-        for xml_file in os.listdir(self.annotations_dir):
-            if not xml_file.endswith(".xml"):
-                continue
-            tree = ET.parse(os.path.join(self.annotations_dir, xml_file))
-            root = tree.getroot()
-            for obj in root.findall("object"):
-                class_name = obj.find("name").text
-                if class_name in self.classes_names:
-                    class_counts[class_name] += 1
-        return class_counts
+        index = self.annotation_index.load()
+        class_ids = np.asarray(index.class_ids)
+        counts = np.bincount(class_ids[class_ids >= 0], minlength=len(index.classes_names))
+        return Counter({name: int(count) for name, count in zip(index.classes_names, counts) if count > 0})
 
     def plot_class_distribution(self):
         """Plot the distribution of classes with percentages."""
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         class_counts = self.get_class_counts()
         for cls in self.classes_names:
             class_counts.setdefault(cls, 0)
@@ -50,20 +84,31 @@ class DataExplorer:
 
     def get_image_dimensions(self):
         """Retrieve image dimensions from annotations."""
-        img_dimensions = []
-        for xml_file in os.listdir(self.annotations_dir):
-            if not xml_file.endswith(".xml"):
-                continue
-            tree = ET.parse(os.path.join(self.annotations_dir, xml_file))
-            root = tree.getroot()
-            size = root.find("size")
-            width = int(size.find("width").text)
-            height = int(size.find("height").text)
-            img_dimensions.append((width, height))
-        return img_dimensions
+        index = self.annotation_index.load()
+        return list(zip(index.widths.tolist(), index.heights.tolist()))
+
+    def get_tile_config(self, imgsz=640):
+        """Choose the tiled-inference tile size and overlap from image and object dimensions."""
+        index = self.annotation_index.load()
+        boxes = np.asarray(index.boxes)
+        object_sizes = np.maximum(boxes[:, 2] - boxes[:, 0], boxes[:, 3] - boxes[:, 1])
+        return choose_tile_config(index.widths, index.heights, object_sizes, imgsz)
+
+    def save_tile_config(self, imgsz=640):
+        """Write the tile configuration to tile_config.json for the predictor."""
+        tile_config = self.get_tile_config(imgsz)
+        output_path = os.path.join(self.output_dir, "tile_config.json")
+        with open(output_path, "w") as f:
+            json.dump(tile_config, f, indent=2)
+        print(f"Tile config ({tile_config['tile_size']}px tiles, {tile_config['overlap']}px overlap, "
+              f"recommended: {tile_config['recommended']}) saved to {output_path}")
+        return tile_config
 
     def plot_image_dimensions(self):
         """Plot the distribution of image dimensions."""
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         img_dims = self.get_image_dimensions()
         widths = [d[0] for d in img_dims]
         heights = [d[1] for d in img_dims]
@@ -81,18 +126,14 @@ class DataExplorer:
 
     def get_objects_per_image(self):
         """Compute the number of objects per image."""
-        objects_per_image = Counter()
-        for xml_file in os.listdir(self.annotations_dir):
-            if not xml_file.endswith(".xml"):
-                continue
-            tree = ET.parse(os.path.join(self.annotations_dir, xml_file))
-            root = tree.getroot()
-            obj_count = len(root.findall("object"))
-            objects_per_image[obj_count] += 1
-        return objects_per_image
+        obj_counts, frequencies = np.unique(self.annotation_index.load().objects_per_image(), return_counts=True)
+        return Counter(dict(zip(obj_counts.tolist(), frequencies.tolist())))
 
     def plot_objects_per_image_distribution(self):
         """Plot the distribution of objects per image."""
+        import matplotlib.pyplot as plt
+        import seaborn as sns
+
         objects_per_image = self.get_objects_per_image()
         counts = list(objects_per_image.keys())
         frequencies = list(objects_per_image.values())
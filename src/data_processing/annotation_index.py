@@ -0,0 +1,153 @@
+import hashlib
+import json
+import os
+import xml.etree.ElementTree as ET
+import numpy as np
+from src import tracing
+
+INDEX_VERSION = 1
+IMAGE_ARRAYS = ("image_ids", "filenames", "widths", "heights", "offsets")
+OBJECT_ARRAYS = ("class_ids", "boxes")
+
+
+class AnnotationIndex:
+    def __init__(self, annotations_dir, classes_names, cache_dir=None):
+        """
+        Initialize the AnnotationIndex.
+
+        Every VOC XML file is parsed once into two columnar tables that are cached
+        on disk as .npy files and memory-mapped on later runs:
+
+        - per-image: image_ids, filenames, widths, heights and offsets, where the
+          objects of image i are rows offsets[i]:offsets[i + 1] of the object table.
+        - per-object: class_ids (int16, -1 for names not in classes_names) and
+          boxes (float32 xmin, ymin, xmax, ymax in pixels).
+
+        Args:
+            annotations_dir (str): Directory containing the VOC XML files.
+            classes_names (list): Ordered class names used to assign class ids.
+            cache_dir (str, optional): Where the index is persisted. Defaults to
+                'annotation_index' next to annotations_dir.
+        """
+        self.annotations_dir = annotations_dir
+        self.classes_names = list(classes_names)
+        self.class_to_id = {name: i for i, name in enumerate(self.classes_names)}
+        if cache_dir is None:
+            cache_dir = os.path.join(os.path.dirname(os.path.normpath(annotations_dir)), "annotation_index")
+        self.cache_dir = cache_dir
+        self.key = None
+        self._arrays = None
+        self._rows = None
+
+    def fingerprint(self):
+        """Hash the names, mtimes and sizes of the XML files together with the class list."""
+        digest = hashlib.sha1()
+        digest.update(f"v{INDEX_VERSION}".encode())
+        digest.update(json.dumps(self.classes_names).encode())
+        entries = sorted(
+            (entry.name, entry.stat().st_mtime_ns, entry.stat().st_size)
+            for entry in os.scandir(self.annotations_dir)
+            if entry.name.endswith(".xml")
+        )
+        for name, mtime_ns, size in entries:
+            digest.update(f"{name}\0{mtime_ns}\0{size}\n".encode())
+        return digest.hexdigest()
+
+    def load(self):
+        """Load the index from the cache, rebuilding it if any annotation file changed."""
+        if self._arrays is not None:
+            return self
+        self.key = self.fingerprint()
+        meta_path = os.path.join(self.cache_dir, "meta.json")
+        if os.path.exists(meta_path):
+            with open(meta_path) as f:
+                meta = json.load(f)
+            if meta.get("key") == self.key:
+                self._arrays = {
+                    name: np.load(os.path.join(self.cache_dir, f"{name}.npy"), mmap_mode="r")
+                    for name in IMAGE_ARRAYS + OBJECT_ARRAYS
+                }
+                return self
+        print(f"Building annotation index for {self.annotations_dir}...")
+        with tracing.span("index.parse_xml"):
+            self._arrays = self.build()
+        tracing.count("index.xml_files", len(self._arrays["image_ids"]))
+        self.save()
+        print(f"Annotation index saved to {self.cache_dir} ({self.num_images} images, {self.num_objects} objects).")
+        return self
+
+    def build(self):
+        """Parse every XML file once and return the columnar arrays."""
+        image_ids, filenames, widths, heights, offsets = [], [], [], [], [0]
+        class_ids, boxes = [], []
+        for xml_file in sorted(os.listdir(self.annotations_dir)):
+            if not xml_file.endswith(".xml"):
+                continue
+            image_id = xml_file[:-len(".xml")]
+            root = ET.parse(os.path.join(self.annotations_dir, xml_file)).getroot()
+            filename = root.findtext("filename") or f"{image_id}.jpg"
+            size = root.find("size")
+            image_ids.append(image_id)
+            filenames.append(filename)
+            widths.append(int(float(size.findtext("width", "0"))) if size is not None else 0)
+            heights.append(int(float(size.findtext("height", "0"))) if size is not None else 0)
+            for obj in root.findall("object"):
+                bndbox = obj.find("bndbox")
+                class_ids.append(self.class_to_id.get(obj.findtext("name"), -1))
+                boxes.append((
+                    float(bndbox.findtext("xmin")),
+                    float(bndbox.findtext("ymin")),
+                    float(bndbox.findtext("xmax")),
+                    float(bndbox.findtext("ymax")),
+                ))
+            offsets.append(len(class_ids))
+        return {
+            "image_ids": np.array(image_ids, dtype=str),
+            "filenames": np.array(filenames, dtype=str),
+            "widths": np.array(widths, dtype=np.int32),
+            "heights": np.array(heights, dtype=np.int32),
+            "offsets": np.array(offsets, dtype=np.int64),
+            "class_ids": np.array(class_ids, dtype=np.int16),
+            "boxes": np.array(boxes, dtype=np.float32).reshape(-1, 4),
+        }
+
+    def save(self):
+        """Persist the arrays; meta.json is written last so a partial save is never trusted."""
+        os.makedirs(self.cache_dir, exist_ok=True)
+        meta_path = os.path.join(self.cache_dir, "meta.json")
+        if os.path.exists(meta_path):
+            os.remove(meta_path)
+        for name, array in self._arrays.items():
+            np.save(os.path.join(self.cache_dir, f"{name}.npy"), array)
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({"key": self.key, "version": INDEX_VERSION, "classes": self.classes_names}, f, indent=2)
+        os.replace(tmp_path, meta_path)
+
+    def __getattr__(self, name):
+        if name in IMAGE_ARRAYS + OBJECT_ARRAYS:
+            return self.load()._arrays[name]
+        raise AttributeError(name)
+
+    @property
+    def num_images(self):
+        return len(self.image_ids)
+
+    @property
+    def num_objects(self):
+        return len(self.class_ids)
+
+    def objects_per_image(self):
+        """Return the number of objects of every image."""
+        return np.diff(self.offsets)
+
+    def row(self, image_id):
+        """Return the row of image_id in the per-image table, or None if it has no annotation."""
+        if self._rows is None:
+            self._rows = {str(image_id): i for i, image_id in enumerate(self.image_ids)}
+        return self._rows.get(image_id)
+
+    def objects(self, row):
+        """Return (class_ids, boxes) of the image at the given row."""
+        start, end = self.offsets[row], self.offsets[row + 1]
+        return self.class_ids[start:end], self.boxes[start:end]
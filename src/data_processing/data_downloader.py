@@ -1,9 +1,19 @@
-import gdown
+import hashlib
+import io
 import os
+import urllib.error
+import urllib.parse
+import urllib.request
 import zipfile
+from src import tracing
+from src.data_processing.streaming_unzip import StreamingZipExtractor, extract_zip
+from src.utils import sha256_of
+
+CHUNK_SIZE = 1 << 20
+
 
 class DataDownloader:
-    def __init__(self, file_id, output_dir, output_file, extract_dir, extract_folder):
+    def __init__(self, file_id, output_dir, output_file, extract_dir, extract_folder, source=None, sha256=None):
         """
         Initialize the DataDownloader.
 
@@ -13,50 +23,178 @@ class DataDownloader:
             output_file (str): The name of the zip file to be saved.
             extract_dir (str): The base directory where the dataset will be extracted.
             extract_folder (str): The subfolder within extract_dir where the dataset will be extracted.
+            source (str, optional): An http(s):// or file:// URL or a local path to fetch the zip from
+                instead of Google Drive. These sources support resume and streaming extraction.
+            sha256 (str, optional): Expected checksum of the zip. Without it, the checksum recorded
+                next to the zip after the last complete download is used to validate the cache.
         """
         self.file_id = file_id
         self.output_dir = output_dir
         self.output_file = output_file
         self.extract_dir = extract_dir
         self.extract_folder = extract_folder
+        self.source = source
+        self.sha256 = sha256
         self.zip_path = None
 
-    def download(self):
+    @property
+    def extract_path(self):
+        return os.path.join(self.extract_dir, self.extract_folder)
+
+    def is_cached(self, zip_path):
+        """Check whether a complete, valid archive is already present at zip_path."""
+        if not os.path.exists(zip_path):
+            return False
+        expected = self.sha256
+        if expected is None and os.path.exists(f"{zip_path}.sha256"):
+            with open(f"{zip_path}.sha256") as f:
+                expected = f.read().strip()
+        if expected is not None:
+            return sha256_of(zip_path) == expected.lower()
+        return zipfile.is_zipfile(zip_path)
+
+    def iter_source_chunks(self, part_path):
+        """
+        Yield the archive bytes from the start, resuming into part_path.
+
+        Bytes already in part_path are replayed first; only the remainder is fetched, with an
+        HTTP Range request for http(s) sources, and appended to part_path.
+        """
+        offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        parsed = urllib.parse.urlparse(self.source)
+        if parsed.scheme in ("http", "https"):
+            request = urllib.request.Request(self.source, headers={"Range": f"bytes={offset}-"} if offset else {})
+            try:
+                response = urllib.request.urlopen(request, timeout=60)
+                if offset and response.status != 206:
+                    print("Server does not support resuming, restarting the download.")
+                    offset = 0
+            except urllib.error.HTTPError as e:
+                if not offset or e.code != 416:
+                    raise
+                # Range starts at the end: the part may already hold the whole archive
+                total = e.headers.get("Content-Range", "").rpartition("/")[2]
+                e.close()
+                if total == str(offset):
+                    print(f"{part_path} already holds the complete archive.")
+                    response = io.BytesIO()
+                else:
+                    print(f"{part_path} does not match the remote archive, restarting the download.")
+                    offset = 0
+                    response = urllib.request.urlopen(urllib.request.Request(self.source), timeout=60)
+        else:
+            path = urllib.request.url2pathname(parsed.path) if parsed.scheme == "file" else self.source
+            response = open(path, "rb")
+            response.seek(offset)
+        if offset:
+            print(f"Resuming download at byte {offset}.")
+        with response, open(part_path, "r+b" if offset else "wb") as part:
+            part.seek(0)
+            while part.tell() < offset:
+                chunk = part.read(min(CHUNK_SIZE, offset - part.tell()))
+                if not chunk:
+                    break
+                yield chunk
+            part.seek(offset)
+            part.truncate()
+            for chunk in iter(lambda: response.read(CHUNK_SIZE), b""):
+                part.write(chunk)
+                yield chunk
+
+    def download(self, extractor=None, is_cached=None):
         """
-        Download the WOTR dataset from Google Drive.
+        Download the WOTR dataset, reusing a cached archive when its checksum matches.
+
+        Args:
+            extractor (StreamingZipExtractor, optional): Receives the archive bytes while they
+                are downloaded. Only used for http(s) and local sources.
+            is_cached (bool, optional): Result of an is_cached check the caller already made,
+                so a large cached archive is not hashed twice.
+
+        Raises:
+            ValueError: If the downloaded archive does not match the expected checksum.
         """
-        try:
-            os.makedirs(self.output_dir, exist_ok=True)
-            self.zip_path = os.path.join(self.output_dir, self.output_file)
+        os.makedirs(self.output_dir, exist_ok=True)
+        zip_path = os.path.join(self.output_dir, self.output_file)
+        if is_cached is None:
+            with tracing.span("download.verify_cache"):
+                is_cached = self.is_cached(zip_path)
+        if is_cached:
+            print(f"Using cached WOTR dataset at {zip_path}.")
+            self.zip_path = zip_path
+            return zip_path
+
+        if self.source is None:
+            import gdown
+
             url = f"https://drive.google.com/uc?id={self.file_id}"
-            print(f"Downloading WOTR dataset to {self.zip_path}...")
-            gdown.download(url, self.zip_path, quiet=False)
-            print("Download completed!")
-        except Exception as e:
-            print(f"Error during download: {e}")
-            self.zip_path = None
+            print(f"Downloading WOTR dataset to {zip_path}...")
+            with tracing.span("download.fetch", source="gdrive"):
+                if gdown.download(url, zip_path, quiet=False, resume=True) is None:
+                    raise RuntimeError(f"Download of {url} failed")
+            tracing.count("download.bytes", os.path.getsize(zip_path))
+            with tracing.span("download.checksum"):
+                checksum = sha256_of(zip_path)
+            downloaded_path = zip_path
+        else:
+            downloaded_path = f"{zip_path}.part"
+            print(f"Downloading WOTR dataset from {self.source} to {zip_path}...")
+            digest = hashlib.sha256()
+            with tracing.span("download.fetch", source=self.source):
+                for chunk in self.iter_source_chunks(downloaded_path):
+                    digest.update(chunk)
+                    tracing.count("download.bytes", len(chunk))
+                    if extractor is not None:
+                        with tracing.span("download.stream_extract"):
+                            extractor.feed(chunk)
+            checksum = digest.hexdigest()
+
+        if self.sha256 is not None and checksum != self.sha256.lower():
+            os.remove(downloaded_path)
+            raise ValueError(f"Checksum mismatch for {zip_path}: expected {self.sha256}, got {checksum}")
+        if downloaded_path != zip_path:
+            os.replace(downloaded_path, zip_path)
+        with open(f"{zip_path}.sha256", "w") as f:
+            f.write(checksum)
+        print("Download completed!")
+        self.zip_path = zip_path
+        return zip_path
 
     def unzip(self):
         """
-        Unzip the downloaded WOTR dataset.
+        Unzip the downloaded WOTR dataset, skipping files that are already extracted.
         """
         if self.zip_path is None:
             print("No zip file to unzip. Please run download first.")
             return
-        try:
-            extract_path = os.path.join(self.extract_dir, self.extract_folder)
-            os.makedirs(extract_path, exist_ok=True)
-            print(f"Unzipping {self.zip_path} to {extract_path}...")
-            with zipfile.ZipFile(self.zip_path, 'r') as zip_ref:
-                zip_ref.extractall(extract_path)
-            print("Unzipping completed!")
-        except Exception as e:
-            print(f"Error during unzipping: {e}")
+        os.makedirs(self.extract_path, exist_ok=True)
+        print(f"Unzipping {self.zip_path} to {self.extract_path}...")
+        with tracing.span("download.unzip"):
+            extracted, skipped = extract_zip(self.zip_path, self.extract_path)
+        tracing.count("download.files", extracted, state="extracted")
+        tracing.count("download.files", skipped, state="up_to_date")
+        print(f"Unzipping completed! Extracted {extracted} files, {skipped} already up to date.")
 
     def download_and_unzip(self):
         """
         Download and unzip the WOTR dataset in one step.
+
+        For http(s) and local sources the archive is extracted while it downloads; anything the
+        streaming pass could not handle is finished from the complete archive afterwards.
         """
-        self.download()
-        if self.zip_path:
-            self.unzip()
\ No newline at end of file
+        zip_path = os.path.join(self.output_dir, self.output_file)
+        with tracing.span("download.verify_cache"):
+            is_cached = self.is_cached(zip_path)
+        if self.source is None or is_cached:
+            self.download(is_cached=is_cached)
+            self.unzip()
+            return
+        os.makedirs(self.extract_path, exist_ok=True)
+        extractor = StreamingZipExtractor(self.extract_path)
+        self.download(extractor=extractor, is_cached=False)
+        if extractor.close():
+            print(f"Unzipping completed while downloading! Extracted {extractor.extracted} files, "
+                  f"{extractor.skipped} already up to date.")
+        else:
+            print(f"Streaming extraction stopped ({extractor.failed}), finishing from the archive.")
+            self.unzip()
@@ -1,57 +1,229 @@
+import hashlib
+import json
 import os
-import xml.etree.ElementTree as ET
-from shutil import copy2
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from collections import Counter
+from src import tracing
+from src.data_processing.annotation_index import AnnotationIndex
+from src.data_processing.file_materializer import materialize
+from src.data_processing.image_cache import ImageCache
+
+MANIFEST_VERSION = 2
+CHUNK_SIZE = 256
+LABEL_FORMAT = "%d %.6f %.6f %.6f %.6f\n"
+
+
+def file_signature(path, with_hash=True):
+    """Return the mtime, size and (optionally) sha1 of a file."""
+    stat = os.stat(path)
+    signature = {"mtime_ns": stat.st_mtime_ns, "size": stat.st_size}
+    if with_hash:
+        digest = hashlib.sha1()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        signature["sha1"] = digest.hexdigest()
+    return signature
+
+
+def yolo_label_table(class_ids, boxes, offsets, widths, heights):
+    """
+    Convert a whole VOC object table to YOLO labels at once.
+
+    Boxes are clipped to their image bounds; boxes that are empty after clipping and objects
+    of unknown classes (class id -1) are dropped.
+
+    Args:
+        class_ids (np.ndarray): Class id of every object.
+        boxes (np.ndarray): (n, 4) xmin, ymin, xmax, ymax of every object in pixels.
+        offsets (np.ndarray): Per-image offsets into the object table (length images + 1).
+        widths (np.ndarray): Width of every image.
+        heights (np.ndarray): Height of every image.
+
+    Returns:
+        tuple: (labels, label_offsets, stats) where labels is a (k, 5) array of class id,
+        x_center, y_center, width and height of the kept objects, label_offsets the per-image
+        offsets into labels and stats per-image counts of 'clipped', 'dropped' and
+        'unknown_class' boxes.
+    """
+    counts = np.diff(offsets)
+    image_of_object = np.repeat(np.arange(len(counts)), counts)
+    class_ids = np.asarray(class_ids)
+    boxes = np.asarray(boxes, dtype=np.float64)
+    obj_w = np.asarray(widths, dtype=np.float64)[image_of_object]
+    obj_h = np.asarray(heights, dtype=np.float64)[image_of_object]
+
+    clipped_boxes = np.clip(boxes, 0.0, np.stack([obj_w, obj_h, obj_w, obj_h], axis=1))
+    known = class_ids >= 0
+    valid = (clipped_boxes[:, 2] > clipped_boxes[:, 0]) & (clipped_boxes[:, 3] > clipped_boxes[:, 1])
+    keep = known & valid
+    clipped = keep & np.any(clipped_boxes != boxes, axis=1)
+
+    xyxy, w, h = clipped_boxes[keep], obj_w[keep], obj_h[keep]
+    labels = np.empty((len(xyxy), 5), dtype=np.float64)
+    labels[:, 0] = class_ids[keep]
+    labels[:, 1] = (xyxy[:, 0] + xyxy[:, 2]) / 2 / w
+    labels[:, 2] = (xyxy[:, 1] + xyxy[:, 3]) / 2 / h
+    labels[:, 3] = (xyxy[:, 2] - xyxy[:, 0]) / w
+    labels[:, 4] = (xyxy[:, 3] - xyxy[:, 1]) / h
+
+    def per_image(mask):
+        return np.bincount(image_of_object[mask], minlength=len(counts))
+
+    label_offsets = np.concatenate([[0], np.cumsum(per_image(keep))])
+    stats = {
+        "clipped": per_image(clipped),
+        "dropped": per_image(known & ~valid),
+        "unknown_class": per_image(~known),
+    }
+    return labels, label_offsets, stats
+
+
+def format_labels(labels):
+    """Format a (k, 5) label array as the text of a YOLO label file in one formatting call."""
+    if len(labels) == 0:
+        return ""
+    return ((LABEL_FORMAT * len(labels)) % tuple(labels.ravel().tolist()))[:-1]
+
+
+def convert_task(task):
+    """Write the label file and materialize the image of one task; return the task key and its manifest entry."""
+    with tracing.span("process.write_label"):
+        with open(task["label_out_path"], "w") as f:
+            f.write(format_labels(task["labels"]))
+    with tracing.span("process.materialize_image"):
+        strategy = materialize(task["img_path"], task["image_out_path"], task["materialization"])
+    tracing.count("process.images", strategy=strategy)
+    with tracing.span("process.hash_sources"):
+        sources = {
+            "xml": file_signature(task["xml_path"]),
+            "image": file_signature(task["img_path"]),
+        }
+    return task["key"], {
+        "sources": sources,
+        "outputs": [task["label_out_path"], task["image_out_path"]],
+        "materialization": strategy,
+    }
+
+
+def convert_chunk(tasks, trace=False):
+    """Process-pool entry point: convert a list of tasks; returns the results and the worker's trace."""
+    tracing.start_worker(trace)
+    return [convert_task(task) for task in tasks], tracing.drain()
+
 
 class DataProcessor:
-    def __init__(self, dataset_root, output_root, classes_names):
+    def __init__(self, dataset_root, output_root, classes_names, annotation_index=None, workers=1,
+                 materialization="auto", split_dir=None):
+        """
+        Initialize the DataProcessor.
+
+        Args:
+            dataset_root (str): Root of the VOC dataset (Annotations, JPEGImages, ImageSets).
+            output_root (str): Root of the YOLO formatted output.
+            classes_names (list): Ordered class names.
+            annotation_index (AnnotationIndex, optional): Shared parsed annotation index.
+            workers (int): Number of conversion processes; 1 converts in-process, 0 uses all CPUs.
+            materialization (str): How images are placed in the output: 'auto' (hardlink, then
+                reflink, then symlink, then copy), 'hardlink', 'reflink', 'symlink' or 'copy'.
+            split_dir (str, optional): Directory of the {split}.txt files, e.g. the deduplicated
+                splits of DuplicateDetector. Defaults to dataset_root/ImageSets/Main.
+        """
         self.dataset_root = dataset_root
         self.output_root = output_root
         self.classes_names = classes_names
         self.annotations_dir = os.path.join(dataset_root, "Annotations")
         self.images_dir = os.path.join(dataset_root, "JPEGImages")
+        self.annotation_index = annotation_index or AnnotationIndex(self.annotations_dir, classes_names)
+        self.workers = workers
+        self.materialization = materialization
+        self.split_dir = split_dir or os.path.join(dataset_root, "ImageSets", "Main")
+        self.manifest_path = os.path.join(output_root, "manifest.json")
+        self._label_table = None
 
-    def process_image(self, file_id, label_out_dir, image_out_dir):
-        xml_path = os.path.join(self.annotations_dir, f"{file_id}.xml")
-        if not os.path.exists(xml_path):
-            print(f"Skipping missing XML file: {xml_path}")
-            return
-        tree = ET.parse(xml_path)
-        root = tree.getroot()
-        filename = root.find("filename").text
+    def label_table(self):
+        """Convert the full annotation index to YOLO labels once and keep the result."""
+        if self._label_table is None:
+            index = self.annotation_index.load()
+            self._label_table = yolo_label_table(index.class_ids, index.boxes, index.offsets, index.widths, index.heights)
+        return self._label_table
+
+    def build_task(self, file_id, label_out_dir, image_out_dir, key=None):
+        """Resolve one image id into a conversion task, or None if its XML or image is missing."""
+        index = self.annotation_index.load()
+        row = index.row(file_id)
+        if row is None:
+            print(f"Skipping missing XML file: {os.path.join(self.annotations_dir, f'{file_id}.xml')}")
+            return None
+        filename = str(index.filenames[row])
         img_path = os.path.join(self.images_dir, filename)
         if not os.path.exists(img_path):
             print(f"Skipping missing image file: {img_path}")
-            return
+            return None
         base_name = os.path.splitext(filename)[0]
-        label_out_path = os.path.join(label_out_dir, f"{base_name}.txt")
-        image_out_path = os.path.join(image_out_dir, filename)
-        size = root.find("size")
-        width = int(size.find("width").text)
-        height = int(size.find("height").text)
-        yolo_lines = []
-        for obj in root.findall("object"):
-            class_name = obj.find("name").text
-            if class_name not in self.classes_names:
+        labels, label_offsets, _ = self.label_table()
+        return {
+            "key": key or file_id,
+            "xml_path": os.path.join(self.annotations_dir, f"{file_id}.xml"),
+            "img_path": img_path,
+            "label_out_path": os.path.join(label_out_dir, f"{base_name}.txt"),
+            "image_out_path": os.path.join(image_out_dir, filename),
+            "row": row,
+            "labels": labels[label_offsets[row]:label_offsets[row + 1]],
+            "materialization": self.materialization,
+        }
+
+    def process_image(self, file_id, label_out_dir, image_out_dir):
+        task = self.build_task(file_id, label_out_dir, image_out_dir)
+        if task is not None:
+            convert_task(task)
+
+    def load_manifest(self):
+        """Load the conversion manifest; entries are discarded if the class list changed."""
+        if not os.path.exists(self.manifest_path):
+            return {}
+        with open(self.manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("version") != MANIFEST_VERSION or manifest.get("classes") != list(self.classes_names):
+            print("Class list or manifest version changed, reconverting every image.")
+            return {"entries": manifest.get("entries", {}), "stale": True}
+        return manifest
+
+    def save_manifest(self, entries):
+        os.makedirs(self.output_root, exist_ok=True)
+        strategies = Counter(entry.get("materialization", "copy") for entry in entries.values())
+        tmp_path = f"{self.manifest_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "version": MANIFEST_VERSION,
+                "classes": list(self.classes_names),
+                "materialization": dict(strategies),
+                "entries": entries,
+            }, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    @staticmethod
+    def is_up_to_date(task, entry):
+        """Check a task against its manifest entry, hashing sources only when their stat changed."""
+        if entry.get("outputs") != [task["label_out_path"], task["image_out_path"]]:
+            return False
+        if not all(os.path.exists(path) for path in entry["outputs"]):
+            return False
+        for name, path in (("xml", task["xml_path"]), ("image", task["img_path"])):
+            recorded = entry["sources"][name]
+            current = file_signature(path, with_hash=False)
+            if current == {"mtime_ns": recorded["mtime_ns"], "size": recorded["size"]}:
                 continue
-            class_id = self.classes_names.index(class_name)
-            bndbox = obj.find("bndbox")
-            xmin = float(bndbox.find("xmin").text)
-            ymin = float(bndbox.find("ymin").text)
-            xmax = float(bndbox.find("xmax").text)
-            ymax = float(bndbox.find("ymax").text)
-            x_center = ((xmin + xmax) / 2) / width
-            y_center = ((ymin + ymax) / 2) / height
-            box_width = (xmax - xmin) / width
-            box_height = (ymax - ymin) / height
-            yolo_lines.append(f"{class_id} {x_center:.6f} {y_center:.6f} {box_width:.6f} {box_height:.6f}")
-        with open(label_out_path, "w") as f:
-            f.write("\n".join(yolo_lines))
-        copy2(img_path, image_out_path)
-
-    def convert_voc_to_yolo(self):
-        sets = ['train', 'val', 'test']
+            if current["size"] != recorded["size"] or file_signature(path)["sha1"] != recorded["sha1"]:
+                return False
+            recorded.update(current)
+        return True
+
+    def collect_tasks(self, sets):
+        tasks = []
         for split in sets:
-            split_txt = os.path.join(self.dataset_root, "ImageSets", "Main", f"{split}.txt")
+            split_txt = os.path.join(self.split_dir, f"{split}.txt")
             if not os.path.exists(split_txt):
                 print(f"Split file not found: {split_txt}. Skipping {split} split.")
                 continue
@@ -60,7 +232,105 @@ class DataProcessor:
             os.makedirs(label_out_dir, exist_ok=True)
             os.makedirs(image_out_dir, exist_ok=True)
             with open(split_txt) as f:
-                file_ids = [line.strip() for line in f.readlines()]
+                file_ids = [line.strip() for line in f if line.strip()]
             for file_id in file_ids:
-                self.process_image(file_id, label_out_dir, image_out_dir)
-        print(f"✅ VOC to YOLO conversion done. Data saved in '{self.output_root}'.")
\ No newline at end of file
+                task = self.build_task(file_id, label_out_dir, image_out_dir, key=f"{split}/{file_id}")
+                if task is not None:
+                    tasks.append(task)
+        return tasks
+
+    def run_tasks(self, tasks, workers):
+        """Convert tasks serially or on a process pool; return {key: manifest entry}."""
+        if workers == 1 or len(tasks) <= CHUNK_SIZE:
+            return dict(convert_task(task) for task in tasks)
+        chunks = [tasks[i:i + CHUNK_SIZE] for i in range(0, len(tasks), CHUNK_SIZE)]
+        results = {}
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            for chunk_results, trace in executor.map(convert_chunk, chunks, [tracing.enabled()] * len(chunks)):
+                results.update(chunk_results)
+                tracing.merge(trace)
+        return results
+
+    def convert_voc_to_yolo(self, workers=None, incremental=True):
+        """
+        Convert the VOC splits to YOLO format.
+
+        Args:
+            workers (int, optional): Overrides the worker count given at construction.
+            incremental (bool): Only convert images whose sources changed since the last run
+                and delete outputs of images that are no longer part of any split.
+        """
+        workers = self.workers if workers is None else workers
+        workers = workers or os.cpu_count()
+        sets = ['train', 'val', 'test']
+        manifest = self.load_manifest() if incremental else {}
+        old_entries = manifest.get("entries", {})
+        with tracing.span("process.collect_tasks"):
+            tasks = self.collect_tasks(sets)
+
+        entries, pending = {}, []
+        with tracing.span("process.check_up_to_date"):
+            for task in tasks:
+                entry = old_entries.get(task["key"])
+                if entry is not None and not manifest.get("stale") and self.is_up_to_date(task, entry):
+                    entries[task["key"]] = entry
+                else:
+                    pending.append(task)
+        tracing.count("process.tasks", len(pending), state="converted")
+        tracing.count("process.tasks", len(tasks) - len(pending), state="up_to_date")
+
+        current_outputs = {path for task in tasks for path in (task["label_out_path"], task["image_out_path"])}
+        removed = 0
+        for key, entry in old_entries.items():
+            if key in entries:
+                continue
+            for path in entry.get("outputs", []):
+                if path not in current_outputs and os.path.lexists(path):
+                    os.remove(path)
+                    removed += 1
+
+        with tracing.span("process.convert", images=len(pending), workers=workers):
+            entries.update(self.run_tasks(pending, workers))
+        self.save_manifest(entries)
+        print(f"Converted: {len(pending)}, skipped (up to date): {len(tasks) - len(pending)}, removed stale files: {removed}")
+        _, _, stats = self.label_table()
+        rows = [task["row"] for task in tasks]
+        print(f"Boxes clipped to image bounds: {int(stats['clipped'][rows].sum())}, "
+              f"dropped as degenerate: {int(stats['dropped'][rows].sum())}, "
+              f"unknown class: {int(stats['unknown_class'][rows].sum())}")
+        print(f"Image materialization: {dict(Counter(entry.get('materialization', 'copy') for entry in entries.values()))}")
+        print(f"✅ VOC to YOLO conversion done. Data saved in '{self.output_root}'.")
+
+    def build_image_cache(self, imgsz, cache_dir=None, workers=None, sets=("train", "val")):
+        """
+        Build the memory-mapped training image cache of the converted splits.
+
+        Args:
+            imgsz (int): Training image size the images are pre-resized to.
+            cache_dir (str, optional): Defaults to output_root/image_cache.
+            workers (int, optional): Overrides the worker count given at construction.
+            sets (tuple): Splits to cache.
+
+        Returns:
+            dict: split -> ImageCache.
+        """
+        workers = self.workers if workers is None else workers
+        workers = workers or os.cpu_count()
+        cache_dir = cache_dir or os.path.join(self.output_root, "image_cache")
+        labels, label_offsets, _ = self.label_table()
+        caches = {}
+        for split in sets:
+            tasks = [task for task in self.collect_tasks([split]) if os.path.exists(task["image_out_path"])]
+            if not tasks:
+                continue
+            rows = np.array([task["row"] for task in tasks], dtype=np.int64)
+            counts = label_offsets[rows + 1] - label_offsets[rows]
+            split_offsets = np.concatenate([[0], np.cumsum(counts)])
+            label_rows = np.arange(split_offsets[-1]) + np.repeat(label_offsets[rows] - split_offsets[:-1], counts)
+            cache = ImageCache(cache_dir, split, imgsz)
+            with tracing.span("process.image_cache", split=split, images=len(tasks)):
+                built = cache.build([task["image_out_path"] for task in tasks], labels[label_rows], split_offsets, workers)
+            if not built:
+                print(f"Image cache for '{split}' is up to date.")
+            caches[split] = cache
+        return caches
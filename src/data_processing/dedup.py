@@ -0,0 +1,275 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+CACHE_VERSION = 1
+CHUNK_SIZE = 256
+SPLITS = ("train", "val", "test")
+# Where a duplicate cluster keeps its image: evaluation splits stay intact, training loses the copies
+SPLIT_PRIORITY = {"test": 0, "val": 1, "train": 2}
+# Set bits of every byte value, for NumPy < 2.0 which has no np.bitwise_count
+POPCOUNT_TABLE = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+def dhash(image_path, hash_size=8):
+    """
+    Difference hash of an image as a 64-bit integer.
+
+    The grayscale image is shrunk to (hash_size + 1) x hash_size and every bit records whether
+    a pixel is brighter than its right neighbour, which survives re-encoding, small shifts and
+    exposure changes between consecutive video frames.
+    """
+    image = cv2.imread(image_path, cv2.IMREAD_REDUCED_GRAYSCALE_4)
+    if image is None:
+        raise FileNotFoundError(f"Could not read image: {image_path}")
+    small = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def hash_chunk(image_paths):
+    """Process-pool entry point: dHash a list of images."""
+    return [dhash(path) for path in image_paths]
+
+
+def popcount64(values):
+    """Set bits of every element of a uint64 array, as uint8."""
+    if hasattr(np, "bitwise_count"):
+        return np.bitwise_count(values)
+    counts = POPCOUNT_TABLE[values.view(np.uint8)].reshape(values.shape + (8,))
+    return counts.sum(axis=-1, dtype=np.uint8)
+
+
+def hamming_pairs(hashes, threshold, block_size=512):
+    """
+    Find all pairs of 64-bit hashes at Hamming distance <= threshold.
+
+    The search is exact and runs block by block: a block of hashes is XORed against every later
+    hash at once and the differing bits are counted with a vectorized popcount, so memory stays
+    at block_size * n and no Python loop runs over pairs.
+
+    Returns:
+        tuple: (i, j, distance) arrays with i < j.
+    """
+    hashes = np.asarray(hashes, dtype=np.uint64)
+    pairs_i, pairs_j, distances = [], [], []
+    for start in range(0, len(hashes), block_size):
+        block = hashes[start:start + block_size]
+        rest = hashes[start:]
+        distance = popcount64(block[:, None] ^ rest[None, :])
+        # Keep each pair once: only columns to the right of the diagonal
+        distance[np.tril_indices(len(block), m=len(rest))] = 255
+        i, j = np.nonzero(distance <= threshold)
+        pairs_i.append(i + start)
+        pairs_j.append(j + start)
+        distances.append(distance[i, j])
+    if not pairs_i:
+        return np.zeros(0, np.int64), np.zeros(0, np.int64), np.zeros(0, np.uint8)
+    return np.concatenate(pairs_i), np.concatenate(pairs_j), np.concatenate(distances)
+
+
+def leader_clusters(n, pairs_i, pairs_j, order):
+    """
+    Group images into clusters around leaders, visiting images in the given order.
+
+    An unassigned image becomes a leader and takes its unassigned neighbours. Unlike connected
+    components this does not chain a slowly moving video into one huge cluster: every member is
+    within the threshold of its leader.
+
+    Returns:
+        np.ndarray: Leader index of every image.
+    """
+    neighbours = [[] for _ in range(n)]
+    for i, j in zip(pairs_i.tolist(), pairs_j.tolist()):
+        neighbours[i].append(j)
+        neighbours[j].append(i)
+    leader = np.full(n, -1, dtype=np.int64)
+    for i in order:
+        if leader[i] >= 0:
+            continue
+        leader[i] = i
+        for j in neighbours[i]:
+            if leader[j] < 0:
+                leader[j] = i
+    return leader
+
+
+class DuplicateDetector:
+    def __init__(self, dataset_root, output_dir, threshold=5, workers=1, annotation_index=None):
+        """
+        Initialize the DuplicateDetector.
+
+        Args:
+            dataset_root (str): Root of the VOC dataset (JPEGImages, ImageSets).
+            output_dir (str): Where the hash cache, the report and the deduplicated split files go.
+            threshold (int): Largest Hamming distance (of 64 bits) between near-duplicates.
+            workers (int): Hashing processes; 0 uses all CPUs.
+            annotation_index (AnnotationIndex, optional): Maps split ids to image file names;
+                '<id>.jpg' is assumed without it.
+        """
+        self.dataset_root = dataset_root
+        self.images_dir = os.path.join(dataset_root, "JPEGImages")
+        self.output_dir = output_dir
+        self.threshold = threshold
+        self.workers = workers
+        self.annotation_index = annotation_index
+        self.cache_path = os.path.join(output_dir, "dhash_cache.npz")
+
+    @property
+    def split_dir(self):
+        """Directory of the deduplicated {split}.txt files, usable as DataProcessor(split_dir=...)."""
+        return os.path.join(self.output_dir, "ImageSets", "Main")
+
+    def load_cache(self):
+        if not os.path.exists(self.cache_path):
+            return {}
+        cache = np.load(self.cache_path)
+        if int(cache["version"]) != CACHE_VERSION:
+            return {}
+        return {
+            name: (size, mtime_ns, value)
+            for name, size, mtime_ns, value in zip(
+                cache["names"].tolist(), cache["sizes"].tolist(), cache["mtimes"].tolist(), cache["hashes"].tolist())
+        }
+
+    def compute_hashes(self):
+        """
+        dHash every image in JPEGImages, reusing cached hashes of files whose size and mtime are unchanged.
+
+        Returns:
+            tuple: (sorted file names, uint64 hashes).
+        """
+        entries = sorted(
+            (entry.name, entry.stat().st_size, entry.stat().st_mtime_ns)
+            for entry in os.scandir(self.images_dir)
+            if entry.is_file() and entry.name.lower().endswith((".jpg", ".jpeg", ".png"))
+        )
+        cache = self.load_cache()
+        hashes = np.zeros(len(entries), dtype=np.uint64)
+        pending = []
+        for i, (name, size, mtime_ns) in enumerate(entries):
+            cached = cache.get(name)
+            if cached is not None and cached[:2] == (size, mtime_ns):
+                hashes[i] = cached[2]
+            else:
+                pending.append(i)
+        print(f"Hashing {len(pending)} images, {len(entries) - len(pending)} cached.")
+        paths = [os.path.join(self.images_dir, entries[i][0]) for i in pending]
+        workers = self.workers or os.cpu_count()
+        if workers == 1 or len(paths) <= CHUNK_SIZE:
+            values = hash_chunk(paths)
+        else:
+            chunks = [paths[i:i + CHUNK_SIZE] for i in range(0, len(paths), CHUNK_SIZE)]
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                values = [value for chunk in executor.map(hash_chunk, chunks) for value in chunk]
+        hashes[pending] = np.array(values, dtype=np.uint64)
+        if pending or len(cache) != len(entries):
+            os.makedirs(self.output_dir, exist_ok=True)
+            tmp_path = f"{self.cache_path}.tmp.npz"
+            np.savez(
+                tmp_path,
+                version=CACHE_VERSION,
+                names=np.array([name for name, _, _ in entries], dtype=str),
+                sizes=np.array([size for _, size, _ in entries], dtype=np.int64),
+                mtimes=np.array([mtime_ns for _, _, mtime_ns in entries], dtype=np.int64),
+                hashes=hashes,
+            )
+            os.replace(tmp_path, self.cache_path)
+        return [name for name, _, _ in entries], hashes
+
+    def read_splits(self):
+        """Return {split: [image ids]} from ImageSets/Main."""
+        splits = {}
+        for split in SPLITS:
+            split_txt = os.path.join(self.dataset_root, "ImageSets", "Main", f"{split}.txt")
+            if os.path.exists(split_txt):
+                with open(split_txt) as f:
+                    splits[split] = [line.strip() for line in f if line.strip()]
+        return splits
+
+    def image_name(self, file_id):
+        if self.annotation_index is not None:
+            row = self.annotation_index.load().row(file_id)
+            if row is not None:
+                return str(self.annotation_index.filenames[row])
+        return f"{file_id}.jpg"
+
+    def run(self, write_splits=True, max_examples=50):
+        """
+        Find near-duplicates within and across splits and write the report.
+
+        Every cluster keeps a single image, placed in its highest-priority split
+        (test, then val, then train); the other members are dropped from the deduplicated split files.
+
+        Args:
+            write_splits (bool): Write the deduplicated ImageSets/Main/{split}.txt files.
+            max_examples (int): Leaking pairs listed in the report.
+
+        Returns:
+            dict: The report, also saved to output_dir/dedup_report.json.
+        """
+        names, hashes = self.compute_hashes()
+        splits = self.read_splits()
+        # One entry per (split, image id); an id listed in two splits is leakage at distance 0
+        members = [(split, file_id) for split in SPLITS for file_id in splits.get(split, [])]
+        position = {name: i for i, name in enumerate(names)}
+        rows = np.array([position.get(self.image_name(file_id), -1) for _, file_id in members], dtype=np.int64)
+        missing = int((rows < 0).sum())
+        if missing:
+            print(f"{missing} split entries have no image in {self.images_dir}, ignoring them.")
+        keep = np.nonzero(rows >= 0)[0]
+        members = [members[i] for i in keep]
+        member_hashes = hashes[rows[keep]]
+
+        pairs_i, pairs_j, distances = hamming_pairs(member_hashes, self.threshold)
+        split_of = np.array([SPLIT_PRIORITY[split] for split, _ in members], dtype=np.int64)
+        order = np.lexsort((np.arange(len(members)), split_of))
+        leader = leader_clusters(len(members), pairs_i, pairs_j, order)
+
+        kept = {split: [] for split in splits}
+        removed = {split: 0 for split in splits}
+        for i, (split, file_id) in enumerate(members):
+            if leader[i] == i:
+                kept[split].append(file_id)
+            else:
+                removed[split] += 1
+
+        cross = split_of[pairs_i] != split_of[pairs_j]
+        leakage = {}
+        for i, j in zip(pairs_i[cross].tolist(), pairs_j[cross].tolist()):
+            key = "-".join(sorted((members[i][0], members[j][0]), key=SPLIT_PRIORITY.get, reverse=True))
+            leakage[key] = leakage.get(key, 0) + 1
+        leaked_images = {split: 0 for split in splits}
+        for i in np.unique(np.concatenate([pairs_i[cross], pairs_j[cross]])).tolist():
+            leaked_images[members[i][0]] += 1
+        worst = np.argsort(distances[cross], kind="stable")[:max_examples]
+        examples = [
+            {"a": "/".join(members[i]), "b": "/".join(members[j]), "distance": int(d)}
+            for i, j, d in zip(pairs_i[cross][worst].tolist(), pairs_j[cross][worst].tolist(), distances[cross][worst].tolist())
+        ]
+
+        report = {
+            "threshold": self.threshold,
+            "images": {split: len(ids) for split, ids in splits.items()},
+            "near_duplicate_pairs": int(len(pairs_i)),
+            "within_split_pairs": int((~cross).sum()),
+            "cross_split_pairs": leakage,
+            "leaked_images": leaked_images,
+            "kept": {split: len(ids) for split, ids in kept.items()},
+            "removed": removed,
+            "examples": examples,
+        }
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(os.path.join(self.output_dir, "dedup_report.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        if write_splits:
+            os.makedirs(self.split_dir, exist_ok=True)
+            for split, ids in kept.items():
+                with open(os.path.join(self.split_dir, f"{split}.txt"), "w") as f:
+                    f.writelines(f"{file_id}\n" for file_id in ids)
+        print(f"Near-duplicates (Hamming <= {self.threshold}): {report['within_split_pairs']} pairs within splits, "
+              f"cross-split pairs: {leakage or 'none'}")
+        print(f"Deduplicated splits: {report['kept']} (removed {removed})")
+        return report
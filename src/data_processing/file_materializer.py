@@ -0,0 +1,79 @@
+import os
+import shutil
+
+FICLONE = 0x40049409  # Linux ioctl cloning a whole file (btrfs, xfs, overlayfs on top of them)
+
+
+def hardlink(src, dst):
+    os.link(src, dst)
+
+
+def reflink(src, dst):
+    """Clone src into dst with FICLONE, falling back to an in-kernel copy_file_range."""
+    try:
+        import fcntl
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+    except (ImportError, OSError):
+        if not hasattr(os, "copy_file_range"):
+            _remove(dst)
+            raise OSError(f"reflink and copy_file_range are not supported for {src}")
+        try:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                remaining = os.fstat(fsrc.fileno()).st_size
+                while remaining > 0:
+                    copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                    if copied == 0:
+                        raise OSError(f"copy_file_range stopped early for {src}")
+                    remaining -= copied
+        except OSError:
+            _remove(dst)
+            raise
+    shutil.copystat(src, dst)
+
+
+def symlink(src, dst):
+    os.symlink(os.path.relpath(src, os.path.dirname(os.path.abspath(dst))), dst)
+
+
+def copy(src, dst):
+    shutil.copy2(src, dst)
+
+
+MATERIALIZERS = {"hardlink": hardlink, "reflink": reflink, "symlink": symlink, "copy": copy}
+STRATEGIES = tuple(MATERIALIZERS)
+
+
+def _remove(path):
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+def materialize(src, dst, strategy="auto"):
+    """
+    Make the content of src available at dst as cheaply as the filesystem allows.
+
+    Args:
+        src (str): Existing source file.
+        dst (str): Destination path; an existing file or link there is replaced.
+        strategy (str): 'auto' tries hardlink, reflink, symlink and copy in that order;
+            any other name from STRATEGIES tries that strategy and then falls back to copy.
+
+    Returns:
+        str: The strategy that was used.
+    """
+    if strategy == "auto":
+        candidates = STRATEGIES
+    elif strategy in STRATEGIES:
+        candidates = (strategy, "copy")
+    else:
+        raise ValueError(f"Unknown materialization strategy '{strategy}', expected 'auto' or one of {STRATEGIES}")
+    _remove(dst)
+    for name in candidates:
+        try:
+            MATERIALIZERS[name](src, dst)
+            return name
+        except OSError:
+            if name == "copy":
+                raise
+            _remove(dst)
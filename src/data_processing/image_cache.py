@@ -0,0 +1,193 @@
+import hashlib
+import json
+import math
+import os
+from concurrent.futures import ProcessPoolExecutor
+import cv2
+import numpy as np
+
+CACHE_VERSION = 1
+CHUNK_SIZE = 256
+
+
+def resize_chunk(images_path, start, image_paths, imgsz):
+    """
+    Decode and resize a chunk of images into their slots of the memory-mapped shard.
+
+    Images are resized like Ultralytics' load_image (long side to imgsz, aspect kept) and
+    stored at the top-left of their imgsz x imgsz slot.
+
+    Returns:
+        tuple: (start, list of (h0, w0, h, w) original and resized shapes).
+    """
+    images = np.load(images_path, mmap_mode="r+")
+    shapes = []
+    for offset, image_path in enumerate(image_paths):
+        image = cv2.imread(image_path)
+        if image is None:
+            raise FileNotFoundError(f"Could not read image: {image_path}")
+        h0, w0 = image.shape[:2]
+        ratio = imgsz / max(h0, w0)
+        if ratio != 1:
+            w, h = min(math.ceil(w0 * ratio), imgsz), min(math.ceil(h0 * ratio), imgsz)
+            image = cv2.resize(image, (w, h), interpolation=cv2.INTER_LINEAR if ratio > 1 else cv2.INTER_AREA)
+        h, w = image.shape[:2]
+        images[start + offset, :h, :w] = image
+        shapes.append((h0, w0, h, w))
+    images.flush()
+    return start, shapes
+
+
+class ImageCache:
+    def __init__(self, cache_dir, split, imgsz=640):
+        """
+        Initialize the ImageCache of one split.
+
+        The split is stored as one memory-mapped (n, imgsz, imgsz, 3) uint8 BGR shard of
+        pre-resized images with a sidecar index, so dataloader workers share the page cache
+        instead of decoding JPEGs:
+
+        - {split}_{imgsz}.npy: the image shard, image i at the top-left of slot i.
+        - {split}_{imgsz}_index.npz: original and resized (h, w) of every image and the packed
+          YOLO labels, where the labels of image i are rows label_offsets[i]:label_offsets[i + 1].
+        - {split}_{imgsz}.json: cache key and image file names, written last.
+
+        Args:
+            cache_dir (str): Directory holding the shards.
+            split (str): Dataset split ('train', 'val', ...).
+            imgsz (int): Training image size.
+        """
+        self.cache_dir = cache_dir
+        self.split = split
+        self.imgsz = imgsz
+        self.key = None
+        self.im_files = None
+        self.index = None
+        self.images = None
+        self._rows = None
+
+    @property
+    def images_path(self):
+        return os.path.join(self.cache_dir, f"{self.split}_{self.imgsz}.npy")
+
+    @property
+    def index_path(self):
+        return os.path.join(self.cache_dir, f"{self.split}_{self.imgsz}_index.npz")
+
+    @property
+    def meta_path(self):
+        return os.path.join(self.cache_dir, f"{self.split}_{self.imgsz}.json")
+
+    def fingerprint(self, image_paths, labels, label_offsets):
+        """Hash the names, sizes and mtimes of the images together with the packed labels."""
+        digest = hashlib.sha1(f"v{CACHE_VERSION}\0{self.imgsz}\n".encode())
+        for image_path in image_paths:
+            stat = os.stat(image_path)
+            digest.update(f"{os.path.basename(image_path)}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+        digest.update(np.ascontiguousarray(labels, dtype=np.float32).tobytes())
+        digest.update(np.ascontiguousarray(label_offsets, dtype=np.int64).tobytes())
+        return digest.hexdigest()
+
+    def read_meta(self):
+        if not os.path.exists(self.meta_path):
+            return None
+        with open(self.meta_path) as f:
+            return json.load(f)
+
+    def build(self, image_paths, labels, label_offsets, workers=1):
+        """
+        Write the shard and its index unless a cache with the same key already exists.
+
+        Args:
+            image_paths (list): Image files in dataset order.
+            labels (np.ndarray): (k, 5) class, x_center, y_center, width, height labels of all images.
+            label_offsets (np.ndarray): Per-image offsets into labels (length images + 1).
+            workers (int): Decoding processes; each writes its chunk straight into the shard.
+
+        Returns:
+            bool: True if the cache was (re)built.
+        """
+        key = self.fingerprint(image_paths, labels, label_offsets)
+        meta = self.read_meta()
+        if meta is not None and meta.get("key") == key and os.path.exists(self.images_path):
+            self.key = key
+            return False
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        if meta is not None:
+            os.remove(self.meta_path)
+        shard = np.lib.format.open_memmap(
+            self.images_path, mode="w+", dtype=np.uint8, shape=(len(image_paths), self.imgsz, self.imgsz, 3)
+        )
+        del shard
+        shapes = np.zeros((len(image_paths), 4), dtype=np.int32)
+        chunks = [(start, image_paths[start:start + CHUNK_SIZE]) for start in range(0, len(image_paths), CHUNK_SIZE)]
+        if workers == 1 or len(chunks) <= 1:
+            results = [resize_chunk(self.images_path, start, paths, self.imgsz) for start, paths in chunks]
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                futures = [executor.submit(resize_chunk, self.images_path, start, paths, self.imgsz)
+                           for start, paths in chunks]
+                results = [future.result() for future in futures]
+        for start, chunk_shapes in results:
+            shapes[start:start + len(chunk_shapes)] = chunk_shapes
+
+        np.savez(
+            self.index_path,
+            original_shapes=shapes[:, :2],
+            resized_shapes=shapes[:, 2:],
+            labels=np.asarray(labels, dtype=np.float32).reshape(-1, 5),
+            label_offsets=np.asarray(label_offsets, dtype=np.int64),
+        )
+        tmp_path = f"{self.meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "key": key,
+                "version": CACHE_VERSION,
+                "imgsz": self.imgsz,
+                "im_files": [os.path.basename(path) for path in image_paths],
+            }, f)
+        os.replace(tmp_path, self.meta_path)
+        self.key = key
+        size_gb = os.path.getsize(self.images_path) / 1e9
+        print(f"Image cache for '{self.split}' saved to {self.images_path} ({len(image_paths)} images, {size_gb:.2f} GB).")
+        return True
+
+    def load(self):
+        """Memory-map the shard and load its index; returns self, or None if no complete cache exists."""
+        if self.index is not None:
+            return self
+        meta = self.read_meta()
+        if meta is None or meta.get("version") != CACHE_VERSION or not os.path.exists(self.images_path):
+            return None
+        self.key = meta["key"]
+        self.im_files = meta["im_files"]
+        with np.load(self.index_path) as index:
+            self.index = {name: index[name] for name in index.files}
+        self.images = np.load(self.images_path, mmap_mode="r")
+        return self
+
+    def __getstate__(self):
+        # Dataloader workers re-open the memory map instead of pickling the shard
+        state = self.__dict__.copy()
+        state["images"] = None
+        return state
+
+    def row(self, im_file):
+        """Return the row of an image file (matched by file name), or None if it is not cached."""
+        if self._rows is None:
+            self._rows = {name: i for i, name in enumerate(self.im_files)}
+        return self._rows.get(os.path.basename(im_file))
+
+    def image(self, row):
+        """Return (image view, (h0, w0), (h, w)) of a cached image."""
+        if self.images is None:
+            self.images = np.load(self.images_path, mmap_mode="r")
+        h0, w0 = self.index["original_shapes"][row]
+        h, w = self.index["resized_shapes"][row]
+        return self.images[row, :h, :w], (int(h0), int(w0)), (int(h), int(w))
+
+    def labels(self, row):
+        """Return the (k, 5) YOLO labels of a cached image."""
+        offsets = self.index["label_offsets"]
+        return self.index["labels"][offsets[row]:offsets[row + 1]]
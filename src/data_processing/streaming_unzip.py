@@ -0,0 +1,232 @@
+import os
+import struct
+import zipfile
+import zlib
+
+LOCAL_HEADER = struct.Struct("<4sHHHHHIIIHH")
+LOCAL_SIGNATURE = b"PK\x03\x04"
+DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+END_SIGNATURES = (b"PK\x01\x02", b"PK\x05\x06", b"PK\x06\x06")
+ZIP64_EXTRA_ID = 0x0001
+
+
+def safe_target(extract_path, name):
+    """Return where an archive member is extracted, refusing names that escape extract_path."""
+    parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+    if ".." in parts:
+        raise ValueError(f"Refusing to extract '{name}' outside of {extract_path}")
+    return os.path.join(extract_path, *parts)
+
+
+def file_crc32(path):
+    crc = 0
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            crc = zlib.crc32(block, crc)
+    return crc
+
+
+def is_extracted(path, size, crc):
+    """Check whether path already holds a member with the given size and CRC-32."""
+    return os.path.isfile(path) and os.path.getsize(path) == size and file_crc32(path) == crc
+
+
+def extract_zip(zip_path, extract_path):
+    """
+    Extract a complete archive, skipping members whose size and CRC already match on disk.
+
+    Returns:
+        tuple: (extracted, skipped) member counts.
+    """
+    extracted = skipped = 0
+    with zipfile.ZipFile(zip_path, "r") as zip_ref:
+        for info in zip_ref.infolist():
+            if not info.is_dir() and is_extracted(safe_target(extract_path, info.filename), info.file_size, info.CRC):
+                skipped += 1
+                continue
+            zip_ref.extract(info, extract_path)
+            extracted += not info.is_dir()
+    return extracted, skipped
+
+
+class StreamingZipExtractor:
+    def __init__(self, extract_path):
+        """
+        Extract a zip archive from its local file headers while the bytes are still arriving.
+
+        Members that use features which cannot be streamed (encryption, compression other than
+        stored/deflate, stored members with a trailing data descriptor) stop the streaming pass;
+        close() then returns False and the caller finishes with extract_zip on the full archive.
+
+        Args:
+            extract_path (str): Directory the archive members are extracted into.
+        """
+        self.extract_path = extract_path
+        self.buffer = bytearray()
+        self.entry = None
+        self.done = False
+        self.failed = None
+        self.extracted = 0
+        self.skipped = 0
+
+    def feed(self, data):
+        """Consume the next chunk of the archive."""
+        if self.done or self.failed:
+            return
+        self.buffer += data
+        try:
+            while self._step():
+                pass
+        except (ValueError, OSError, zlib.error, struct.error) as e:
+            self.failed = str(e)
+            self._discard_entry()
+
+    def close(self):
+        """Return True if every member was extracted by the streaming pass."""
+        if not self.done and not self.failed:
+            self.failed = "archive ended before its central directory"
+            self._discard_entry()
+        return self.done
+
+    def _step(self):
+        if self.entry is None:
+            return self._read_header()
+        if self.entry["phase"] == "data":
+            return self._read_data()
+        return self._read_descriptor()
+
+    def _read_header(self):
+        if len(self.buffer) < 4:
+            return False
+        signature = bytes(self.buffer[:4])
+        if signature in END_SIGNATURES:
+            self.done = True
+            return False
+        if signature != LOCAL_SIGNATURE:
+            raise ValueError(f"Unexpected zip signature {signature!r}")
+        if len(self.buffer) < LOCAL_HEADER.size:
+            return False
+        (_, _, flags, method, _, _, crc, compressed_size, size,
+         name_length, extra_length) = LOCAL_HEADER.unpack_from(self.buffer)
+        header_length = LOCAL_HEADER.size + name_length + extra_length
+        if len(self.buffer) < header_length:
+            return False
+        raw_name = bytes(self.buffer[LOCAL_HEADER.size:LOCAL_HEADER.size + name_length])
+        extra = bytes(self.buffer[LOCAL_HEADER.size + name_length:header_length])
+        del self.buffer[:header_length]
+
+        name = raw_name.decode("utf-8" if flags & 0x800 else "cp437")
+        zip64 = False
+        if compressed_size == 0xFFFFFFFF or size == 0xFFFFFFFF:
+            size, compressed_size = self._zip64_sizes(extra)
+            zip64 = True
+        if flags & 0x1:
+            raise ValueError(f"Encrypted member '{name}' cannot be streamed")
+        if method not in (zipfile.ZIP_STORED, zipfile.ZIP_DEFLATED):
+            raise ValueError(f"Compression method {method} of '{name}' cannot be streamed")
+        has_descriptor = bool(flags & 0x8)
+        if has_descriptor and method == zipfile.ZIP_STORED and not name.endswith("/"):
+            raise ValueError(f"Stored member '{name}' with a data descriptor cannot be streamed")
+
+        target = safe_target(self.extract_path, name)
+        self.entry = {
+            "name": name,
+            "target": target,
+            "method": method,
+            "crc": crc,
+            "remaining": compressed_size,
+            "has_descriptor": has_descriptor,
+            "zip64": zip64,
+            "phase": "data",
+            "running_crc": 0,
+            "decompressor": zlib.decompressobj(-15) if method == zipfile.ZIP_DEFLATED else None,
+            "file": None,
+            "skip": False,
+        }
+        if name.endswith("/"):
+            os.makedirs(target, exist_ok=True)
+            self.entry["skip"] = True
+            if has_descriptor and method == zipfile.ZIP_STORED:
+                self.entry["phase"] = "descriptor"
+        elif not has_descriptor and is_extracted(target, size, crc):
+            self.entry["skip"] = True
+            self.skipped += 1
+        else:
+            os.makedirs(os.path.dirname(target) or ".", exist_ok=True)
+            self.entry["file"] = open(f"{target}.part", "wb")
+        return True
+
+    @staticmethod
+    def _zip64_sizes(extra):
+        offset = 0
+        while offset + 4 <= len(extra):
+            header_id, length = struct.unpack_from("<HH", extra, offset)
+            if header_id == ZIP64_EXTRA_ID:
+                return struct.unpack_from("<QQ", extra, offset + 4)
+            offset += 4 + length
+        raise ValueError("Missing zip64 extra field")
+
+    def _write(self, data):
+        entry = self.entry
+        if entry["decompressor"] is not None:
+            data = entry["decompressor"].decompress(data)
+        if entry["file"] is not None and data:
+            entry["running_crc"] = zlib.crc32(data, entry["running_crc"])
+            entry["file"].write(data)
+
+    def _read_data(self):
+        entry = self.entry
+        if entry["has_descriptor"]:
+            if not self.buffer:
+                return False
+            self._write(bytes(self.buffer))
+            self.buffer = bytearray(entry["decompressor"].unused_data)
+            if entry["decompressor"].eof:
+                entry["phase"] = "descriptor"
+                return True
+            return False
+        if entry["remaining"] and not self.buffer:
+            return False
+        chunk_length = min(entry["remaining"], len(self.buffer))
+        chunk = bytes(self.buffer[:chunk_length])
+        del self.buffer[:chunk_length]
+        entry["remaining"] -= chunk_length
+        if not entry["skip"]:
+            self._write(chunk)
+        if entry["remaining"] == 0:
+            self._finish_entry()
+        return True
+
+    def _read_descriptor(self):
+        entry = self.entry
+        offset = 4 if self.buffer[:4] == DESCRIPTOR_SIGNATURE else 0
+        length = offset + (20 if entry["zip64"] else 12)
+        if len(self.buffer) < length:
+            return False
+        entry["crc"] = struct.unpack_from("<I", self.buffer, offset)[0]
+        del self.buffer[:length]
+        self._finish_entry()
+        return True
+
+    def _finish_entry(self):
+        entry = self.entry
+        if entry["file"] is not None:
+            if entry["decompressor"] is not None:
+                self._write(b"")
+                tail = entry["decompressor"].flush()
+                if tail:
+                    entry["running_crc"] = zlib.crc32(tail, entry["running_crc"])
+                    entry["file"].write(tail)
+            entry["file"].close()
+            if entry["running_crc"] != entry["crc"]:
+                raise ValueError(f"CRC mismatch for '{entry['name']}'")
+            os.replace(f"{entry['target']}.part", entry["target"])
+            self.extracted += 1
+        self.entry = None
+
+    def _discard_entry(self):
+        if self.entry is not None and self.entry["file"] is not None:
+            self.entry["file"].close()
+            if os.path.exists(f"{self.entry['target']}.part"):
+                os.remove(f"{self.entry['target']}.part")
+        self.entry = None
@@ -0,0 +1,233 @@
+import argparse
+import fnmatch
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import yaml
+from src.evaluation.metrics import evaluate_detections
+from src.evaluation.yolo_dataset import labels_to_pixels, read_labels, split_images
+from src.inference.backends import EXTENSIONS
+from src.utils import peak_rss_mb
+
+
+def benchmark_artifact(model_path, image_pairs, imgsz, batch_sizes, thread_counts, warm_iterations, num_classes):
+    """
+    Benchmark one artifact; runs in a fresh spawned process so cold start and peak RSS are its own.
+    """
+    import cv2
+    from src.inference.engine import InferenceEngine
+
+    images = [cv2.imread(image_path) for image_path, _ in image_pairs]
+    start = time.perf_counter()
+    engine = InferenceEngine(model_path, imgsz=imgsz, batch_size=1, num_threads=thread_counts[0], warmup=False)
+    engine.predict_batch(images[:1])
+    cold_start = time.perf_counter() - start
+
+    latency = []
+    for threads in thread_counts:
+        engine = InferenceEngine(model_path, imgsz=imgsz, batch_size=max(batch_sizes), num_threads=threads, warmup=False)
+        for batch_size in batch_sizes:
+            batch, _ = engine.preprocess([images[i % len(images)] for i in range(batch_size)])
+            for _ in range(2):
+                engine.infer(batch)
+            timings = []
+            for _ in range(warm_iterations):
+                t0 = time.perf_counter()
+                engine.infer(batch)
+                timings.append(time.perf_counter() - t0)
+            timings = np.array(timings) * 1000.0
+            latency.append({
+                "threads": threads,
+                "batch_size": batch_size,
+                "p50_ms": round(float(np.percentile(timings, 50)), 3),
+                "p95_ms": round(float(np.percentile(timings, 95)), 3),
+                "p99_ms": round(float(np.percentile(timings, 99)), 3),
+                "images_per_s": round(batch_size * 1000.0 / float(timings.mean()), 2),
+            })
+
+    predictions = engine.predict_batch(images, conf_threshold=0.001, iou_threshold=0.7)
+    truths = [labels_to_pixels(read_labels(label_path), image.shape) for (_, label_path), image in zip(image_pairs, images)]
+    metrics = evaluate_detections(predictions, truths, num_classes)
+    return {
+        "model": model_path,
+        "backend": engine.backend_name,
+        "size_mb": round(os.path.getsize(model_path) / 1e6, 3),
+        "cold_start_s": round(cold_start, 3),
+        "latency": latency,
+        "map50": round(metrics["map50"], 4),
+        "map50_95": round(metrics["map50_95"], 4),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }
+
+
+class InferenceBenchmark:
+    def __init__(self, models_dir, data_config_path, output_dir, reference_model="best.pt", pattern="best*",
+                 imgsz=640, subset_size=100, batch_sizes=(1, 4, 8), thread_counts=(1, 4), warm_iterations=20,
+                 max_map_drop=0.02, max_latency_regression=0.2, baseline_report=None):
+        """
+        Initialize the InferenceBenchmark.
+
+        Args:
+            models_dir (str): Directory searched recursively for .pt, .onnx and .tflite artifacts.
+            data_config_path (str): Dataset YAML whose val split provides the fixed accuracy subset.
+            output_dir (str): Where benchmark.json and benchmark.md are written.
+            reference_model (str): File name of the .pt model accuracy drift is measured against.
+            pattern (str): Glob on artifact file names, so base weights are not benchmarked.
+            imgsz (int): Network input size.
+            subset_size (int): Number of evenly spaced validation images.
+            batch_sizes (tuple): Batch sizes for the latency/throughput sweep.
+            thread_counts (tuple): Intra-op thread counts for the sweep.
+            warm_iterations (int): Timed iterations per configuration after warm-up.
+            max_map_drop (float): Allowed mAP50-95 drop of an artifact relative to the reference.
+            max_latency_regression (float): Allowed relative p50 latency increase against the baseline report.
+            baseline_report (str, optional): Previous benchmark.json to compare latency against.
+        """
+        self.models_dir = models_dir
+        self.data_config_path = data_config_path
+        self.output_dir = output_dir
+        self.reference_model = reference_model
+        self.pattern = pattern
+        self.imgsz = imgsz
+        self.subset_size = subset_size
+        self.batch_sizes = list(batch_sizes)
+        self.thread_counts = list(thread_counts)
+        self.warm_iterations = warm_iterations
+        self.max_map_drop = max_map_drop
+        self.max_latency_regression = max_latency_regression
+        self.baseline_report = baseline_report
+
+    def find_artifacts(self):
+        artifacts = []
+        for root, dirs, files in os.walk(self.models_dir):
+            dirs[:] = [d for d in dirs if not d.startswith(".")]
+            for name in files:
+                if os.path.splitext(name)[1].lower() in EXTENSIONS and fnmatch.fnmatch(name, self.pattern):
+                    artifacts.append(os.path.join(root, name))
+        return sorted(artifacts)
+
+    def run(self):
+        """
+        Benchmark every artifact, write the JSON and Markdown reports and check for regressions.
+
+        Raises:
+            RuntimeError: If an artifact exceeds the accuracy or latency thresholds.
+        """
+        artifacts = self.find_artifacts()
+        if not artifacts:
+            raise FileNotFoundError(f"No model artifacts matching '{self.pattern}' found in {self.models_dir}")
+        image_pairs = split_images(self.data_config_path, "val", self.subset_size)
+        with open(self.data_config_path) as f:
+            num_classes = len(yaml.safe_load(f)["names"])
+
+        results = []
+        context = multiprocessing.get_context("spawn")
+        for model_path in artifacts:
+            print(f"Benchmarking {model_path}...")
+            with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                try:
+                    results.append(executor.submit(
+                        benchmark_artifact, model_path, image_pairs, self.imgsz, self.batch_sizes,
+                        self.thread_counts, self.warm_iterations, num_classes,
+                    ).result())
+                except Exception as e:
+                    print(f"Error while benchmarking {model_path}: {e}")
+                    results.append({"model": model_path, "error": str(e)})
+
+        regressions = self.check_regressions(results)
+        report = {"subset_size": len(image_pairs), "imgsz": self.imgsz, "results": results, "regressions": regressions}
+        self.write_reports(report)
+        if regressions:
+            raise RuntimeError("Benchmark regressions:\n" + "\n".join(regressions))
+        return report
+
+    def check_regressions(self, results):
+        regressions = []
+        reference = next((r for r in results if os.path.basename(r["model"]) == self.reference_model and "error" not in r), None)
+        baseline = {}
+        if self.baseline_report and os.path.exists(self.baseline_report):
+            with open(self.baseline_report) as f:
+                baseline = {r["model"]: r for r in json.load(f)["results"] if "error" not in r}
+        for result in results:
+            if "error" in result:
+                regressions.append(f"{result['model']}: failed ({result['error']})")
+                continue
+            if reference is not None:
+                result["map_drop"] = round(reference["map50_95"] - result["map50_95"], 4)
+                if result["map_drop"] > self.max_map_drop:
+                    regressions.append(f"{result['model']}: mAP50-95 drop {result['map_drop']:.4f} > {self.max_map_drop}")
+            previous = baseline.get(result["model"])
+            if previous is None:
+                continue
+            previous_latency = {(l["threads"], l["batch_size"]): l["p50_ms"] for l in previous["latency"]}
+            for latency in result["latency"]:
+                before = previous_latency.get((latency["threads"], latency["batch_size"]))
+                if before and latency["p50_ms"] > before * (1 + self.max_latency_regression):
+                    regressions.append(
+                        f"{result['model']}: p50 latency {before} -> {latency['p50_ms']} ms "
+                        f"(batch {latency['batch_size']}, {latency['threads']} threads)"
+                    )
+        return regressions
+
+    def write_reports(self, report):
+        os.makedirs(self.output_dir, exist_ok=True)
+        json_path = os.path.join(self.output_dir, "benchmark.json")
+        with open(json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+        lines = [
+            f"# Inference benchmark ({report['subset_size']} val images, imgsz {report['imgsz']})",
+            "",
+            "| Model | Backend | Size (MB) | Cold start (s) | Peak RSS (MB) | mAP50 | mAP50-95 | mAP drop |",
+            "|---|---|---|---|---|---|---|---|",
+        ]
+        for r in report["results"]:
+            if "error" in r:
+                lines.append(f"| {r['model']} | error: {r['error']} | | | | | | |")
+                continue
+            lines.append(f"| {r['model']} | {r['backend']} | {r['size_mb']} | {r['cold_start_s']} | {r['peak_rss_mb']} "
+                         f"| {r['map50']} | {r['map50_95']} | {r.get('map_drop', '')} |")
+        lines += ["", "| Model | Threads | Batch | p50 (ms) | p95 (ms) | p99 (ms) | Images/s |", "|---|---|---|---|---|---|---|"]
+        for r in report["results"]:
+            for l in r.get("latency", []):
+                lines.append(f"| {r['model']} | {l['threads']} | {l['batch_size']} | {l['p50_ms']} | {l['p95_ms']} "
+                             f"| {l['p99_ms']} | {l['images_per_s']} |")
+        if report["regressions"]:
+            lines += ["", "## Regressions", ""] + [f"- {r}" for r in report["regressions"]]
+        markdown_path = os.path.join(self.output_dir, "benchmark.md")
+        with open(markdown_path, "w") as f:
+            f.write("\n".join(lines) + "\n")
+        print(f"Benchmark reports saved to {json_path} and {markdown_path}")
+
+
+def build_benchmark(config):
+    """Create an InferenceBenchmark from the 'benchmark' section of config.yaml."""
+    benchmark_config = config.get("benchmark", {})
+    return InferenceBenchmark(
+        models_dir=config["deployment"]["models_dir"],
+        data_config_path=config["dataset"]["wotr_config_path"],
+        output_dir=benchmark_config.get("output_dir", os.path.join(config["output_dir_path"], "benchmark")),
+        imgsz=config["training"]["imgsz"],
+        subset_size=benchmark_config.get("subset_size", 100),
+        batch_sizes=benchmark_config.get("batch_sizes", (1, 4, 8)),
+        thread_counts=benchmark_config.get("thread_counts", (1, 4)),
+        warm_iterations=benchmark_config.get("warm_iterations", 20),
+        max_map_drop=benchmark_config.get("max_map_drop", 0.02),
+        max_latency_regression=benchmark_config.get("max_latency_regression", 0.2),
+        baseline_report=benchmark_config.get("baseline_report"),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark exported inference artifacts")
+    parser.add_argument("--config", default="config/config.yaml")
+    args = parser.parse_args()
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    build_benchmark(config).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,40 +1,314 @@
+import hashlib
+import json
+import multiprocessing
 import os
-from ultralytics import YOLO
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from src import tracing
+from src.evaluation.metrics import confusion_matrix, evaluate_detections
+from src.evaluation.yolo_dataset import labels_to_pixels, load_data_config, read_labels, split_images
+from src.inference.nms import batched_nms
+from src.utils import sha256_of
 
 
-def evaluate_yolo_model(model_path, model_name, data_config_path, output_dir):
+def image_key(image_path):
+    """Identify an image by its path, size and mtime so edited files are predicted again."""
+    stat = os.stat(image_path)
+    return hashlib.sha1(f"{os.path.abspath(image_path)}\0{stat.st_size}\0{stat.st_mtime_ns}".encode()).hexdigest()[:20]
 
-    try:
-        print(f"Loading model from: {model_path}")
-        model = YOLO(model_path)
 
-        print(f"Using dataset configuration: {data_config_path}")
-        print(f"Saving evaluation results to: {os.path.join(output_dir, 'evaluation_metrics')}")
+def predict_shard(model_path, imgsz, batch_size, device, num_threads, jobs, conf_floor, max_candidates, trace=None):
+    """
+    Predict a shard of (image_path, cache_path) jobs and write each image's pre-NMS candidates.
 
-        # Ensure the base output directory exists
-        os.makedirs(output_dir, exist_ok=True)
+    Runs in a worker process; every worker loads its own inference engine.
 
-        # Run validation
-        metrics = model.val(
-            device="mps",
-            data=data_config_path,
-            name=model_name,
-            project=output_dir,
-            save_json=True,  # Save metrics results to a JSON file
-            save_hybrid=False,  # Save hybrid format labels (labels + predictions)
-            plots=True
-        )
+    Returns:
+        tuple: (number of images, trace of the worker to merge, or None when trace is None).
+    """
+    from src.inference.engine import InferenceEngine, load_image
 
+    if trace is not None:
+        tracing.start_worker(trace)
+    with tracing.span("eval.load_model"):
+        engine = InferenceEngine(model_path, imgsz=imgsz, batch_size=batch_size, num_threads=num_threads, warmup=False,
+                                 device=device)
+    for start in range(0, len(jobs), batch_size):
+        chunk = jobs[start:start + batch_size]
+        with tracing.span("infer.decode"):
+            images = [load_image(image_path) for image_path, _ in chunk]
+        batch, meta = engine.preprocess(images)
+        candidates = engine.candidates(engine.infer(batch), meta, conf_floor, max_candidates)
+        with tracing.span("eval.write_cache"):
+            for (_, cache_path), image, image_candidates in zip(chunk, images, candidates):
+                tmp_path = f"{cache_path}.tmp.npz"
+                np.savez(tmp_path, candidates=image_candidates, shape=np.array(image.shape[:2]))
+                os.replace(tmp_path, cache_path)
+    return len(jobs), tracing.drain() if trace is not None else None
 
-        print("\n--- Evaluation Metrics ---")
-        print(f"mAP50-95: {metrics.box.map:.4f}")
-        print(f"   mAP50: {metrics.box.map50:.4f}")
-        print(f"   mAP75: {metrics.box.map75:.4f}")
-        # You can access per-class mAP50 via metrics.box.maps
 
-        results_dir = os.path.join(output_dir, 'evaluation_metrics')
-        print(f"\nDetailed results, plots (including confusion matrix), and metrics saved in: {results_dir}")
+def apply_nms(candidates, shape, conf_threshold, iou_threshold, max_det=None):
+    """Class-aware NMS of cached candidates, clipped to the image; returns (k, 6) detections."""
+    candidates = candidates[candidates[:, 4] > conf_threshold]
+    keep = batched_nms(candidates[:, :4], candidates[:, 4], candidates[:, 5], iou_threshold)
+    detections = candidates[keep[:max_det] if max_det else keep].copy()
+    detections[:, [0, 2]] = detections[:, [0, 2]].clip(0, shape[1])
+    detections[:, [1, 3]] = detections[:, [1, 3]].clip(0, shape[0])
+    return detections
+
+
+class Evaluator:
+    def __init__(self, model_path, data_config_path, output_dir, split="val", imgsz=640, batch_size=8, device="cpu",
+                 workers=1, cache_dir=None, conf_floor=0.001, max_candidates=3000, subset_size=None):
+        """
+        Initialize the Evaluator.
+
+        Raw predictions are cached per model and image, so changing thresholds, re-scoring or
+        sweeping only re-runs NMS and matching instead of inference.
+
+        Args:
+            model_path (str): Path to a .pt, .onnx or .tflite artifact.
+            data_config_path (str): Dataset YAML with the split and class names.
+            output_dir (str): Where reports are written.
+            split (str): Split of the dataset YAML to evaluate.
+            imgsz (int): Network input size.
+            batch_size (int): Images per forward pass.
+            device (str): Torch device for .pt models; other backends always run on CPU.
+            workers (int): Worker processes the images are sharded across on CPU.
+            cache_dir (str, optional): Prediction cache. Defaults to output_dir/.prediction_cache.
+            conf_floor (float): Lowest confidence kept in the cache; sweeps cannot go below it.
+            max_candidates (int): Pre-NMS candidates kept per image, highest scores first.
+            subset_size (int, optional): Evaluate an evenly spaced subset of the split.
+        """
+        self.model_path = model_path
+        self.data_config_path = data_config_path
+        self.output_dir = output_dir
+        self.split = split
+        self.imgsz = imgsz
+        self.batch_size = batch_size
+        self.device = device or "cpu"
+        self.workers = max(1, workers or 1)
+        self.cache_dir = cache_dir or os.path.join(output_dir, ".prediction_cache")
+        self.conf_floor = conf_floor
+        self.max_candidates = max_candidates
+        self.subset_size = subset_size
+        self.names = load_data_config(data_config_path)["names"]
+        if isinstance(self.names, dict):
+            self.names = [self.names[k] for k in sorted(self.names)]
+        self.candidates = None
+        self.shapes = None
+        self.truths = None
+
+    @property
+    def num_classes(self):
+        return len(self.names)
+
+    def model_cache_dir(self):
+        key = json.dumps({
+            "model": sha256_of(self.model_path),
+            "imgsz": self.imgsz,
+            "conf_floor": self.conf_floor,
+            "max_candidates": self.max_candidates,
+        }, sort_keys=True)
+        return os.path.join(self.cache_dir, hashlib.sha256(key.encode()).hexdigest()[:16])
+
+    def predict(self):
+        """
+        Load cached candidates for every image and predict only the missing ones.
+
+        Returns:
+            int: Number of images that needed inference.
+        """
+        if self.candidates is not None:
+            return 0
+        pairs = split_images(self.data_config_path, self.split, self.subset_size)
+        model_dir = self.model_cache_dir()
+        os.makedirs(model_dir, exist_ok=True)
+        cache_paths = [os.path.join(model_dir, f"{image_key(image_path)}.npz") for image_path, _ in pairs]
+        jobs = [(image_path, cache_path) for (image_path, _), cache_path in zip(pairs, cache_paths)
+                if not os.path.exists(cache_path)]
+
+        if jobs:
+            start = time.perf_counter()
+            if self.workers == 1 or self.device != "cpu":
+                predict_shard(self.model_path, self.imgsz, self.batch_size, self.device, None, jobs, self.conf_floor,
+                              self.max_candidates)
+            else:
+                shards = [list(shard) for shard in np.array_split(np.array(jobs, dtype=object), self.workers) if len(shard)]
+                threads = max(1, (os.cpu_count() or 1) // len(shards))
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=len(shards), mp_context=context) as executor:
+                    futures = [
+                        executor.submit(predict_shard, self.model_path, self.imgsz, self.batch_size, self.device, threads,
+                                        [tuple(job) for job in shard], self.conf_floor, self.max_candidates,
+                                        tracing.enabled())
+                        for shard in shards
+                    ]
+                    for future in futures:
+                        tracing.merge(future.result()[1])
+            print(f"Predicted {len(jobs)} images in {time.perf_counter() - start:.1f}s "
+                  f"({len(pairs) - len(jobs)} cached).")
+        else:
+            print(f"All {len(pairs)} predictions loaded from cache {model_dir}.")
+
+        self.candidates, self.shapes, self.truths = [], [], []
+        with tracing.span("eval.load_cache", images=len(pairs)):
+            for (_, label_path), cache_path in zip(pairs, cache_paths):
+                with np.load(cache_path) as cached:
+                    self.candidates.append(cached["candidates"])
+                    self.shapes.append(tuple(cached["shape"]))
+                self.truths.append(labels_to_pixels(read_labels(label_path), self.shapes[-1]))
+        tracing.count("eval.images", len(jobs), state="predicted")
+        tracing.count("eval.images", len(pairs) - len(jobs), state="cached")
+        return len(jobs)
+
+    def detections(self, conf_threshold=0.001, iou_threshold=0.7, max_det=300):
+        self.predict()
+        with tracing.span("eval.nms"):
+            return [apply_nms(candidates, shape, conf_threshold, iou_threshold, max_det)
+                    for candidates, shape in zip(self.candidates, self.shapes)]
+
+    def evaluate(self, conf_threshold=0.001, iou_threshold=0.7, max_det=300, confusion_conf=0.25, confusion_iou=0.45):
+        """
+        Compute mAP, per-class AP, PR curves and the confusion matrix.
+
+        Returns:
+            dict: Metrics as returned by evaluate_detections plus 'confusion_matrix'.
+        """
+        detections = self.detections(conf_threshold, iou_threshold, max_det)
+        with tracing.span("eval.metrics"):
+            metrics = evaluate_detections(detections, self.truths, self.num_classes, curves=True)
+            metrics["confusion_matrix"] = confusion_matrix(detections, self.truths, self.num_classes, confusion_conf,
+                                                           confusion_iou)
+        return metrics
+
+    def sweep(self, conf_thresholds, iou_thresholds, max_det=300):
+        """
+        Score every conf/NMS-IoU combination from the cached predictions.
+
+        NMS runs once per IoU threshold at the lowest confidence; higher confidences only filter
+        its output, which gives the same detections as running NMS again.
+
+        Returns:
+            list: One dict per combination with conf, iou, map50, map50_95, precision and recall.
+        """
+        self.predict()
+        conf_thresholds = sorted(conf_thresholds)
+        results = []
+        for iou_threshold in iou_thresholds:
+            base = [apply_nms(candidates, shape, conf_thresholds[0], iou_threshold)
+                    for candidates, shape in zip(self.candidates, self.shapes)]
+            for conf_threshold in conf_thresholds:
+                detections = [d[d[:, 4] > conf_threshold][:max_det] for d in base]
+                metrics = evaluate_detections(detections, self.truths, self.num_classes, curves=True)
+                curves, present = metrics["curves"], metrics["present"]
+                index = min(int(round(conf_threshold * (len(curves["confidence"]) - 1))), len(curves["confidence"]) - 1)
+                results.append({
+                    "conf": conf_threshold,
+                    "iou": iou_threshold,
+                    "map50": round(metrics["map50"], 4),
+                    "map50_95": round(metrics["map50_95"], 4),
+                    "precision": round(float(curves["precision"][present, index].mean()), 4) if present.any() else 0.0,
+                    "recall": round(float(curves["recall"][present, index].mean()), 4) if present.any() else 0.0,
+                })
+        return results
+
+    def report(self, metrics):
+        """Summarize evaluate() output as a JSON-serializable dict."""
+        curves, present, ap = metrics["curves"], metrics["present"], metrics["ap"]
+        mean_f1 = curves["f1"][present].mean(axis=0) if present.any() else curves["f1"].mean(axis=0)
+        best = int(mean_f1.argmax())
+        per_class = {
+            self.names[c]: {
+                "ap50": round(float(ap[c, 0]), 4),
+                "ap50_95": round(float(ap[c].mean()), 4),
+                "precision": round(float(curves["precision"][c, best]), 4),
+                "recall": round(float(curves["recall"][c, best]), 4),
+            }
+            for c in np.nonzero(present)[0]
+        }
+        return {
+            "model": self.model_path,
+            "images": len(self.truths),
+            "map50": round(metrics["map50"], 4),
+            "map75": round(metrics["map75"], 4),
+            "map50_95": round(metrics["map50_95"], 4),
+            "best_f1_conf": round(float(curves["confidence"][best]), 3),
+            "best_f1": round(float(mean_f1[best]), 4),
+            "per_class": per_class,
+            "names": list(self.names) + ["background"],
+            "confusion_matrix": metrics["confusion_matrix"].tolist(),
+        }
+
+    def save(self, metrics, name="evaluation", plots=True):
+        """Write the report to output_dir/name/metrics.json and, optionally, PR-curve and confusion matrix plots."""
+        save_dir = os.path.join(self.output_dir, name)
+        os.makedirs(save_dir, exist_ok=True)
+        report = self.report(metrics)
+        with open(os.path.join(save_dir, "metrics.json"), "w") as f:
+            json.dump(report, f, indent=2)
+        if plots:
+            self.save_plots(metrics, save_dir)
+        return save_dir
+
+    def save_plots(self, metrics, save_dir):
+        import matplotlib
+        matplotlib.use("Agg")
+        import matplotlib.pyplot as plt
+        from src.evaluation.metrics import RECALL_POINTS
+
+        curves, present = metrics["curves"], metrics["present"]
+        fig, ax = plt.subplots(figsize=(9, 6))
+        for c in np.nonzero(present)[0]:
+            ax.plot(RECALL_POINTS, curves["pr"][c], linewidth=1, label=f"{self.names[c]} {metrics['ap'][c, 0]:.3f}")
+        ax.plot(RECALL_POINTS, curves["pr"][present].mean(axis=0), linewidth=3, color="blue",
+                label=f"all classes {metrics['map50']:.3f} mAP@0.5")
+        ax.set_xlabel("Recall")
+        ax.set_ylabel("Precision")
+        ax.set_xlim(0, 1)
+        ax.set_ylim(0, 1)
+        ax.legend(bbox_to_anchor=(1.04, 1), loc="upper left", fontsize=7)
+        fig.tight_layout()
+        fig.savefig(os.path.join(save_dir, "pr_curve.png"), dpi=150)
+        plt.close(fig)
 
+        matrix = metrics["confusion_matrix"].astype(np.float64)
+        normalized = matrix / np.maximum(matrix.sum(axis=0, keepdims=True), 1)
+        labels = list(self.names) + ["background"]
+        fig, ax = plt.subplots(figsize=(12, 10))
+        image = ax.imshow(normalized, cmap="Blues", vmin=0, vmax=1)
+        ax.set_xticks(range(len(labels)), labels, rotation=90, fontsize=7)
+        ax.set_yticks(range(len(labels)), labels, fontsize=7)
+        ax.set_xlabel("True")
+        ax.set_ylabel("Predicted")
+        fig.colorbar(image, ax=ax)
+        fig.tight_layout()
+        fig.savefig(os.path.join(save_dir, "confusion_matrix.png"), dpi=150)
+        plt.close(fig)
+
+
+def evaluate_yolo_model(model_path, model_name, data_config_path, output_dir, device="cpu", imgsz=640, batch_size=8,
+                        workers=1, cache_dir=None, subset_size=None):
+    """
+    Evaluate a .pt, .onnx or .tflite model on the val split with cached predictions.
+
+    Returns:
+        dict: Metrics as returned by Evaluator.evaluate, or None on failure.
+    """
+    try:
+        print(f"Evaluating model: {model_path}")
+        print(f"Using dataset configuration: {data_config_path}")
+        evaluator = Evaluator(model_path, data_config_path, output_dir, imgsz=imgsz, batch_size=batch_size,
+                              device=device, workers=workers, cache_dir=cache_dir, subset_size=subset_size)
+        metrics = evaluator.evaluate()
+        save_dir = evaluator.save(metrics, name=model_name)
+
+        print("\n--- Evaluation Metrics ---")
+        print(f"mAP50-95: {metrics['map50_95']:.4f}")
+        print(f"   mAP50: {metrics['map50']:.4f}")
+        print(f"   mAP75: {metrics['map75']:.4f}")
+        print(f"\nDetailed results, plots (including confusion matrix), and metrics saved in: {save_dir}")
         return metrics
 
     except FileNotFoundError as e:
@@ -42,4 +316,4 @@ def evaluate_yolo_model(model_path, model_name, data_config_path, output_dir):
         return None
     except Exception as e:
         print(f"An error occurred during evaluation: {e}")
-        return None
\ No newline at end of file
+        return None
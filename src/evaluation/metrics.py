@@ -0,0 +1,195 @@
+import numpy as np
+from src.inference.nms import box_iou
+
+IOU_THRESHOLDS = np.linspace(0.5, 0.95, 10)
+RECALL_POINTS = np.linspace(0, 1, 101)
+trapezoid = getattr(np, "trapezoid", None) or np.trapz
+
+
+def match_predictions(pred_boxes, pred_classes, gt_boxes, gt_classes, iou_thresholds=IOU_THRESHOLDS):
+    """
+    Mark each prediction of one image as a true positive at every IoU threshold.
+
+    Matching is one-to-one and greedy by IoU, computed for all predictions and ground-truth
+    boxes at once.
+
+    Returns:
+        np.ndarray: (k, len(iou_thresholds)) boolean array.
+    """
+    correct = np.zeros((len(pred_boxes), len(iou_thresholds)), dtype=bool)
+    if len(pred_boxes) == 0 or len(gt_boxes) == 0:
+        return correct
+    iou = box_iou(gt_boxes, pred_boxes) * (gt_classes[:, None] == pred_classes[None, :])
+    for t, threshold in enumerate(iou_thresholds):
+        gt_index, pred_index = np.nonzero(iou >= threshold)
+        if not len(gt_index):
+            continue
+        matches = np.stack([gt_index, pred_index], axis=1)
+        matches = matches[np.argsort(-iou[gt_index, pred_index], kind="stable")]
+        matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
+        matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
+        correct[matches[:, 1], t] = True
+    return correct
+
+
+def compute_ap(recall, precision):
+    """COCO-style 101-point interpolated average precision of one precision/recall curve."""
+    mrec = np.concatenate(([0.0], recall, [1.0]))
+    mpre = np.concatenate(([1.0], precision, [0.0]))
+    mpre = np.flip(np.maximum.accumulate(np.flip(mpre)))
+    return trapezoid(np.interp(RECALL_POINTS, mrec, mpre), RECALL_POINTS)
+
+
+def ap_per_class(correct, scores, pred_classes, gt_classes, num_classes):
+    """
+    Compute the average precision of every class at every IoU threshold.
+
+    Args:
+        correct (np.ndarray): (k, t) true-positive flags of all predictions of the dataset.
+        scores (np.ndarray): (k,) prediction confidences.
+        pred_classes (np.ndarray): (k,) predicted class ids.
+        gt_classes (np.ndarray): (n,) class ids of all ground-truth boxes.
+        num_classes (int): Number of classes.
+
+    Returns:
+        tuple: (ap, present) where ap is (num_classes, t) and present flags the classes that
+        have ground-truth boxes.
+    """
+    order = np.argsort(-scores, kind="stable")
+    correct, pred_classes = correct[order], pred_classes[order]
+    gt_counts = np.bincount(gt_classes.astype(np.int64), minlength=num_classes)
+    ap = np.zeros((num_classes, correct.shape[1]))
+    for c in np.nonzero(gt_counts)[0]:
+        tp = correct[pred_classes == c]
+        if not len(tp):
+            continue
+        tpc = tp.cumsum(axis=0)
+        fpc = (1 - tp).cumsum(axis=0)
+        recall = tpc / gt_counts[c]
+        precision = tpc / (tpc + fpc)
+        for t in range(correct.shape[1]):
+            ap[c, t] = compute_ap(recall[:, t], precision[:, t])
+    return ap, gt_counts > 0
+
+
+def pr_curves(correct, scores, pred_classes, gt_classes, num_classes, points=1000):
+    """
+    Per-class precision, recall and F1 curves at the first IoU threshold.
+
+    Args:
+        correct (np.ndarray): (k, t) true-positive flags of all predictions of the dataset.
+        scores (np.ndarray): (k,) prediction confidences.
+        pred_classes (np.ndarray): (k,) predicted class ids.
+        gt_classes (np.ndarray): (n,) class ids of all ground-truth boxes.
+        num_classes (int): Number of classes.
+        points (int): Number of confidence thresholds the curves are sampled at.
+
+    Returns:
+        dict: confidence (points,), precision/recall/f1 (num_classes, points) as functions of
+        confidence, and pr (num_classes, 101) interpolated precision at RECALL_POINTS.
+    """
+    confidence = np.linspace(0, 1, points)
+    precision_curve = np.zeros((num_classes, points))
+    recall_curve = np.zeros((num_classes, points))
+    pr = np.zeros((num_classes, len(RECALL_POINTS)))
+    order = np.argsort(-scores, kind="stable")
+    tp_all, scores, pred_classes = correct[order, 0], scores[order], pred_classes[order]
+    gt_counts = np.bincount(gt_classes.astype(np.int64), minlength=num_classes)
+    for c in np.nonzero(gt_counts)[0]:
+        mask = pred_classes == c
+        if not mask.any():
+            continue
+        tpc = tp_all[mask].cumsum()
+        fpc = (1 - tp_all[mask]).cumsum()
+        recall = tpc / gt_counts[c]
+        precision = tpc / (tpc + fpc)
+        recall_curve[c] = np.interp(-confidence, -scores[mask], recall, left=0)
+        precision_curve[c] = np.interp(-confidence, -scores[mask], precision, left=1)
+        mrec = np.concatenate(([0.0], recall, [1.0]))
+        mpre = np.flip(np.maximum.accumulate(np.flip(np.concatenate(([1.0], precision, [0.0])))))
+        pr[c] = np.interp(RECALL_POINTS, mrec, mpre)
+    f1 = 2 * precision_curve * recall_curve / np.maximum(precision_curve + recall_curve, 1e-16)
+    return {"confidence": confidence, "precision": precision_curve, "recall": recall_curve, "f1": f1, "pr": pr}
+
+
+def confusion_matrix(predictions, ground_truths, num_classes, conf_threshold=0.25, iou_threshold=0.45):
+    """
+    Build a detection confusion matrix with a background row and column.
+
+    Predictions are matched one-to-one to ground-truth boxes of any class by IoU; unmatched
+    predictions count as background false positives and unmatched ground truth as missed.
+
+    Returns:
+        np.ndarray: (num_classes + 1, num_classes + 1) int64 counts indexed [predicted, true].
+    """
+    background = num_classes
+    matrix = np.zeros((num_classes + 1, num_classes + 1), dtype=np.int64)
+    for prediction, truth in zip(predictions, ground_truths):
+        prediction = prediction[prediction[:, 4] > conf_threshold]
+        pred_classes = prediction[:, 5].astype(np.int64)
+        gt_classes = truth[:, 0].astype(np.int64)
+        matched_pred = np.zeros(len(prediction), dtype=bool)
+        matched_gt = np.zeros(len(truth), dtype=bool)
+        if len(prediction) and len(truth):
+            iou = box_iou(truth[:, 1:], prediction[:, :4])
+            gt_index, pred_index = np.nonzero(iou > iou_threshold)
+            if len(gt_index):
+                matches = np.stack([gt_index, pred_index], axis=1)
+                matches = matches[np.argsort(-iou[gt_index, pred_index], kind="stable")]
+                matches = matches[np.unique(matches[:, 1], return_index=True)[1]]
+                matches = matches[np.unique(matches[:, 0], return_index=True)[1]]
+                np.add.at(matrix, (pred_classes[matches[:, 1]], gt_classes[matches[:, 0]]), 1)
+                matched_gt[matches[:, 0]] = True
+                matched_pred[matches[:, 1]] = True
+        np.add.at(matrix, (background, gt_classes[~matched_gt]), 1)
+        np.add.at(matrix, (pred_classes[~matched_pred], background), 1)
+    return matrix
+
+
+def detection_statistics(predictions, ground_truths, iou_thresholds=IOU_THRESHOLDS):
+    """
+    Match every image and concatenate the results.
+
+    Returns:
+        tuple: (correct (k, t), scores (k,), pred_classes (k,), gt_classes (n,)) for the dataset.
+    """
+    correct, scores, pred_classes, gt_classes = [], [], [], []
+    for prediction, truth in zip(predictions, ground_truths):
+        correct.append(match_predictions(prediction[:, :4], prediction[:, 5], truth[:, 1:], truth[:, 0], iou_thresholds))
+        scores.append(prediction[:, 4])
+        pred_classes.append(prediction[:, 5])
+        gt_classes.append(truth[:, 0])
+    return (
+        np.concatenate(correct) if correct else np.zeros((0, len(iou_thresholds)), dtype=bool),
+        np.concatenate(scores) if scores else np.zeros(0),
+        np.concatenate(pred_classes) if pred_classes else np.zeros(0),
+        np.concatenate(gt_classes) if gt_classes else np.zeros(0),
+    )
+
+
+def evaluate_detections(predictions, ground_truths, num_classes, iou_thresholds=IOU_THRESHOLDS, curves=False):
+    """
+    Score detections against ground truth.
+
+    Args:
+        predictions (list): One (k, 6) x1, y1, x2, y2, score, class array per image.
+        ground_truths (list): One (n, 5) class, x1, y1, x2, y2 array per image, same pixel space.
+        num_classes (int): Number of classes.
+        curves (bool): Also return the pr_curves of the dataset under 'curves'.
+
+    Returns:
+        dict: map50, map75, map50_95, per-class ap (num_classes, t) and the present-class mask.
+    """
+    correct, scores, pred_classes, gt_classes = detection_statistics(predictions, ground_truths, iou_thresholds)
+    ap, present = ap_per_class(correct, scores, pred_classes, gt_classes, num_classes)
+    present_ap = ap[present] if present.any() else np.zeros((1, len(iou_thresholds)))
+    metrics = {
+        "map50": float(present_ap[:, 0].mean()),
+        "map75": float(present_ap[:, 5].mean()) if present_ap.shape[1] > 5 else None,
+        "map50_95": float(present_ap.mean()),
+        "ap": ap,
+        "present": present,
+    }
+    if curves:
+        metrics["curves"] = pr_curves(correct, scores, pred_classes, gt_classes, num_classes)
+    return metrics
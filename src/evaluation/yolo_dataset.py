@@ -0,0 +1,50 @@
+import os
+import numpy as np
+import yaml
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+
+
+def load_data_config(data_config_path):
+    with open(data_config_path) as f:
+        return yaml.safe_load(f)
+
+
+def split_images(data_config_path, split="val", limit=None):
+    """
+    List (image_path, label_path) pairs of a split of a YOLO dataset config.
+
+    Args:
+        data_config_path (str): Ultralytics data YAML (path, train/val/test, names).
+        split (str): Split key in the YAML.
+        limit (int, optional): Keep a fixed, evenly spaced subset of this many images.
+    """
+    data = load_data_config(data_config_path)
+    images_dir = os.path.join(data.get("path", ""), data[split])
+    files = sorted(f for f in os.listdir(images_dir) if f.lower().endswith(IMAGE_EXTENSIONS))
+    if limit and len(files) > limit:
+        files = [files[i] for i in np.linspace(0, len(files) - 1, limit).round().astype(int)]
+    labels_dir = os.path.join(os.path.dirname(os.path.dirname(images_dir)), "labels", os.path.basename(images_dir))
+    return [
+        (os.path.join(images_dir, f), os.path.join(labels_dir, f"{os.path.splitext(f)[0]}.txt"))
+        for f in files
+    ]
+
+
+def read_labels(label_path):
+    """Read a YOLO label file as an (n, 5) class, x_center, y_center, width, height array."""
+    if not os.path.exists(label_path) or os.path.getsize(label_path) == 0:
+        return np.zeros((0, 5), dtype=np.float32)
+    return np.loadtxt(label_path, dtype=np.float32, ndmin=2)[:, :5]
+
+
+def labels_to_pixels(labels, shape):
+    """Convert normalized YOLO labels to (n, 5) class, x1, y1, x2, y2 in pixels of an image of shape (h, w)."""
+    height, width = shape[:2]
+    boxes = np.empty_like(labels)
+    boxes[:, 0] = labels[:, 0]
+    boxes[:, 1] = (labels[:, 1] - labels[:, 3] / 2) * width
+    boxes[:, 2] = (labels[:, 2] - labels[:, 4] / 2) * height
+    boxes[:, 3] = (labels[:, 1] + labels[:, 3] / 2) * width
+    boxes[:, 4] = (labels[:, 2] + labels[:, 4] / 2) * height
+    return boxes
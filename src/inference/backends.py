@@ -0,0 +1,135 @@
+import ast
+import json
+import os
+import zipfile
+import numpy as np
+
+
+class UltralyticsBackend:
+    def __init__(self, model_path, num_threads=None, model=None, device=None):
+        """
+        Run a PyTorch .pt checkpoint through its raw detection model.
+
+        Args:
+            model_path (str): Path to the .pt checkpoint.
+            num_threads (int, optional): Torch intra-op threads.
+            model (YOLO, optional): An already loaded Ultralytics model to share.
+            device (str, optional): Torch device the model runs on; CPU by default.
+        """
+        import torch
+        from ultralytics import YOLO
+        if num_threads:
+            torch.set_num_threads(num_threads)
+        self.torch = torch
+        yolo = model or YOLO(model_path)
+        self.device = torch.device(device or "cpu")
+        self.model = yolo.model.float().eval().to(self.device)
+        self.names = dict(yolo.names)
+        self.input_layout = "nchw"
+        self.normalized_boxes = False
+
+    def run(self, batch):
+        with self.torch.inference_mode():
+            output = self.model(self.torch.from_numpy(batch).to(self.device))
+        if isinstance(output, (list, tuple)):
+            output = output[0]
+        return output.cpu().numpy()
+
+
+class OnnxBackend:
+    def __init__(self, model_path, num_threads=None):
+        """Run an ONNX export on the ONNX Runtime CPU execution provider."""
+        import onnxruntime as ort
+        options = ort.SessionOptions()
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+        self.session = ort.InferenceSession(model_path, sess_options=options, providers=["CPUExecutionProvider"])
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        self.fixed_batch = model_input.shape[0] if isinstance(model_input.shape[0], int) else None
+        metadata = self.session.get_modelmeta().custom_metadata_map
+        self.names = ast.literal_eval(metadata["names"]) if "names" in metadata else None
+        self.input_layout = "nchw"
+        self.normalized_boxes = False
+
+    def run(self, batch):
+        if self.fixed_batch is None or len(batch) == self.fixed_batch:
+            return self.session.run(None, {self.input_name: batch})[0]
+        outputs = []
+        for start in range(0, len(batch), self.fixed_batch):
+            chunk = batch[start:start + self.fixed_batch]
+            if len(chunk) < self.fixed_batch:
+                padding = np.zeros((self.fixed_batch - len(chunk),) + chunk.shape[1:], dtype=chunk.dtype)
+                chunk = np.concatenate([chunk, padding])
+            outputs.append(self.session.run(None, {self.input_name: chunk})[0])
+        return np.concatenate(outputs)[:len(batch)]
+
+
+class TFLiteBackend:
+    def __init__(self, model_path, num_threads=None):
+        """Run a TFLite export (float or int8 quantized) with the TFLite interpreter."""
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            from tensorflow.lite import Interpreter
+        self.interpreter = Interpreter(model_path=model_path, num_threads=num_threads)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self.batch_size = int(self.input_detail["shape"][0])
+        self.names = self.read_names(model_path)
+        self.input_layout = "nhwc"
+        self.normalized_boxes = True
+
+    @staticmethod
+    def read_names(model_path):
+        """Read the class names Ultralytics appends to the exported file as a zipped metadata.json."""
+        try:
+            with zipfile.ZipFile(model_path) as archive:
+                metadata = json.loads(archive.read("metadata.json"))
+        except (zipfile.BadZipFile, KeyError, ValueError):
+            return None
+        names = metadata.get("names")
+        return {int(k): v for k, v in names.items()} if isinstance(names, dict) else names
+
+    def resize(self, batch_size):
+        index = self.input_detail["index"]
+        shape = list(self.input_detail["shape"])
+        shape[0] = batch_size
+        self.interpreter.resize_tensor_input(index, shape)
+        self.interpreter.allocate_tensors()
+        self.input_detail = self.interpreter.get_input_details()[0]
+        self.output_detail = self.interpreter.get_output_details()[0]
+        self.batch_size = batch_size
+
+    def run(self, batch):
+        batch = np.ascontiguousarray(batch.transpose(0, 2, 3, 1))
+        if len(batch) != self.batch_size:
+            self.resize(len(batch))
+        dtype = self.input_detail["dtype"]
+        if dtype in (np.int8, np.uint8):
+            scale, zero_point = self.input_detail["quantization"]
+            batch = np.clip(np.round(batch / scale + zero_point), np.iinfo(dtype).min, np.iinfo(dtype).max)
+        self.interpreter.set_tensor(self.input_detail["index"], batch.astype(dtype))
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self.output_detail["index"])
+        if output.dtype in (np.int8, np.uint8):
+            scale, zero_point = self.output_detail["quantization"]
+            output = (output.astype(np.float32) - zero_point) * scale
+        return output
+
+
+BACKENDS = {
+    "ultralytics": UltralyticsBackend,
+    "onnx": OnnxBackend,
+    "tflite": TFLiteBackend,
+}
+EXTENSIONS = {".pt": "ultralytics", ".onnx": "onnx", ".tflite": "tflite"}
+
+
+def backend_name_for(model_path):
+    """Infer the backend from the artifact's file extension."""
+    extension = os.path.splitext(model_path)[1].lower()
+    if extension not in EXTENSIONS:
+        raise ValueError(f"Cannot infer an inference backend for '{model_path}', expected one of {sorted(EXTENSIONS)}")
+    return EXTENSIONS[extension]
@@ -0,0 +1,155 @@
+import time
+import cv2
+import numpy as np
+from src import tracing
+from src.inference.backends import BACKENDS, backend_name_for
+from src.inference.nms import non_max_suppression, top_candidates
+
+PAD_VALUE = 114
+
+
+def letterbox_into(image, out, imgsz):
+    """
+    Resize a BGR image with unchanged aspect ratio and pad it into one CHW float32 slot.
+
+    Args:
+        image (np.ndarray): HWC BGR uint8 image.
+        out (np.ndarray): (3, imgsz, imgsz) float32 view of the batch buffer, written in place as RGB in [0, 1].
+        imgsz (int): Square network input size.
+
+    Returns:
+        tuple: (ratio, (pad_x, pad_y)) needed to map boxes back to the original image.
+    """
+    height, width = image.shape[:2]
+    ratio = min(imgsz / height, imgsz / width)
+    new_w, new_h = int(round(width * ratio)), int(round(height * ratio))
+    pad_x, pad_y = (imgsz - new_w) // 2, (imgsz - new_h) // 2
+    if (new_w, new_h) != (width, height):
+        image = cv2.resize(image, (new_w, new_h), interpolation=cv2.INTER_LINEAR)
+    out.fill(PAD_VALUE / 255.0)
+    np.multiply(image[..., ::-1].transpose(2, 0, 1), 1 / 255.0, out=out[:, pad_y:pad_y + new_h, pad_x:pad_x + new_w],
+                casting="unsafe")
+    return ratio, (pad_x, pad_y)
+
+
+def scale_detections(detections, ratio, pad, shape, clip=True):
+    """Map (k, 6) detections from letterboxed input pixels back to the original image and clip them."""
+    pad_x, pad_y = pad
+    detections[:, [0, 2]] = (detections[:, [0, 2]] - pad_x) / ratio
+    detections[:, [1, 3]] = (detections[:, [1, 3]] - pad_y) / ratio
+    if clip:
+        clip_detections(detections, shape)
+    return detections
+
+
+def clip_detections(detections, shape):
+    """Clip (k, 6) detections in place to an image of shape (h, w)."""
+    detections[:, [0, 2]] = detections[:, [0, 2]].clip(0, shape[1])
+    detections[:, [1, 3]] = detections[:, [1, 3]].clip(0, shape[0])
+    return detections
+
+
+def load_image(image):
+    """Accept a path or an already decoded BGR array."""
+    if isinstance(image, np.ndarray):
+        return image
+    decoded = cv2.imread(str(image))
+    if decoded is None:
+        raise FileNotFoundError(f"Could not read image: {image}")
+    return decoded
+
+
+class InferenceEngine:
+    def __init__(self, model_path, imgsz=640, batch_size=8, backend=None, num_threads=None, warmup=True, model=None,
+                 device=None):
+        """
+        Initialize the InferenceEngine.
+
+        Args:
+            model_path (str): Path to a .pt, .onnx or .tflite artifact.
+            imgsz (int): Square network input size.
+            batch_size (int): Maximum number of images per forward pass.
+            backend (str, optional): 'ultralytics', 'onnx' or 'tflite'; inferred from the extension by default.
+            num_threads (int, optional): Intra-op threads for the backend.
+            warmup (bool): Run one dummy batch at load time so the first request is not slowed down.
+            model (YOLO, optional): Loaded Ultralytics model shared with the 'ultralytics' backend.
+            device (str, optional): Torch device of the 'ultralytics' backend ('cpu', 'cuda:0', 'mps').
+        """
+        self.model_path = model_path
+        self.imgsz = imgsz
+        self.batch_size = batch_size
+        self.backend_name = backend or backend_name_for(model_path)
+        if self.backend_name == "ultralytics":
+            self.backend = BACKENDS[self.backend_name](model_path, num_threads=num_threads, model=model, device=device)
+        else:
+            self.backend = BACKENDS[self.backend_name](model_path, num_threads=num_threads)
+        self.names = self.backend.names
+        self.buffer = np.zeros((batch_size, 3, imgsz, imgsz), dtype=np.float32)
+        self.warmup_time = None
+        if warmup:
+            self.warmup()
+
+    def warmup(self):
+        """Run one full-size dummy batch through the backend."""
+        start = time.perf_counter()
+        self.backend.run(self.buffer)
+        self.warmup_time = time.perf_counter() - start
+
+    def preprocess(self, images, out=None):
+        """
+        Letterbox decoded images into the preallocated NCHW buffer (or into out).
+
+        Returns:
+            tuple: (batch view, list of (ratio, pad, original shape) per image).
+        """
+        out = self.buffer if out is None else out
+        meta = []
+        with tracing.span("infer.preprocess", images=len(images)):
+            for i, image in enumerate(images):
+                ratio, pad = letterbox_into(image, out[i], self.imgsz)
+                meta.append((ratio, pad, image.shape[:2]))
+        return out[:len(images)], meta
+
+    def infer(self, batch):
+        """Run the backend and return raw (batch, 4 + num_classes, anchors) predictions in input pixels."""
+        with tracing.span("infer.forward", backend=self.backend_name, batch=len(batch)):
+            output = self.backend.run(batch)
+        tracing.count("infer.images", len(batch), backend=self.backend_name)
+        if self.backend.normalized_boxes:
+            output = output.copy()
+            output[:, :4] *= self.imgsz
+        return output
+
+    def postprocess(self, output, meta, conf_threshold=0.25, iou_threshold=0.45, max_det=300):
+        with tracing.span("infer.nms"):
+            detections = non_max_suppression(output, conf_threshold, iou_threshold, max_det)
+        return [scale_detections(d, ratio, pad, shape) for d, (ratio, pad, shape) in zip(detections, meta)]
+
+    def candidates(self, output, meta, conf_threshold=0.001, max_candidates=3000):
+        """
+        Decode raw outputs into pre-NMS (k, 6) x1, y1, x2, y2, score, class candidates in original
+        image pixels, unclipped, so NMS can be re-run later with any IoU threshold.
+        """
+        results = []
+        with tracing.span("infer.candidates"):
+            for prediction, (ratio, pad, shape) in zip(output, meta):
+                boxes, scores, classes = top_candidates(prediction, conf_threshold, max_candidates)
+                candidates = np.concatenate([boxes, scores[:, None], classes[:, None].astype(boxes.dtype)], axis=1)
+                results.append(scale_detections(candidates.astype(np.float32), ratio, pad, shape, clip=False))
+        return results
+
+    def predict_batch(self, images, conf_threshold=0.25, iou_threshold=0.45, max_det=300):
+        """
+        Run batched inference on image paths or BGR arrays.
+
+        Returns:
+            list: One (k, 6) float32 array per image with x1, y1, x2, y2, score and class
+            in original image pixels.
+        """
+        results = []
+        for start in range(0, len(images), self.batch_size):
+            with tracing.span("infer.decode"):
+                decoded = [load_image(image) for image in images[start:start + self.batch_size]]
+            batch, meta = self.preprocess(decoded)
+            results.extend(self.postprocess(self.infer(batch), meta, conf_threshold, iou_threshold, max_det))
+        return results
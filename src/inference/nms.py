@@ -0,0 +1,112 @@
+import numpy as np
+
+
+def xywh_to_xyxy(boxes):
+    """Convert (n, 4) center x, center y, width, height boxes to corner coordinates."""
+    xyxy = np.empty_like(boxes)
+    half_w, half_h = boxes[:, 2] / 2, boxes[:, 3] / 2
+    xyxy[:, 0] = boxes[:, 0] - half_w
+    xyxy[:, 1] = boxes[:, 1] - half_h
+    xyxy[:, 2] = boxes[:, 0] + half_w
+    xyxy[:, 3] = boxes[:, 1] + half_h
+    return xyxy
+
+
+def box_iou(boxes_a, boxes_b):
+    """Return the (n, m) IoU matrix between two sets of xyxy boxes."""
+    area_a = (boxes_a[:, 2] - boxes_a[:, 0]) * (boxes_a[:, 3] - boxes_a[:, 1])
+    area_b = (boxes_b[:, 2] - boxes_b[:, 0]) * (boxes_b[:, 3] - boxes_b[:, 1])
+    top_left = np.maximum(boxes_a[:, None, :2], boxes_b[None, :, :2])
+    bottom_right = np.minimum(boxes_a[:, None, 2:], boxes_b[None, :, 2:])
+    wh = np.clip(bottom_right - top_left, 0, None)
+    inter = wh[..., 0] * wh[..., 1]
+    return inter / np.maximum(area_a[:, None] + area_b[None, :] - inter, 1e-9)
+
+
+def nms(boxes, scores, iou_threshold, metric="iou"):
+    """
+    Greedy non-maximum suppression.
+
+    Each step keeps the best remaining box and drops all boxes overlapping it in one
+    vectorized IoU computation. With metric='ios' the overlap is intersection over the
+    smaller box, which also merges a box cut at a tile border into the full box.
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, sorted by decreasing score.
+    """
+    order = np.argsort(-scores, kind="stable")
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+    keep = []
+    while order.size:
+        i = order[0]
+        keep.append(i)
+        rest = order[1:]
+        w = np.clip(np.minimum(x2[i], x2[rest]) - np.maximum(x1[i], x1[rest]), 0, None)
+        h = np.clip(np.minimum(y2[i], y2[rest]) - np.maximum(y1[i], y1[rest]), 0, None)
+        inter = w * h
+        if metric == "ios":
+            iou = inter / np.maximum(np.minimum(areas[i], areas[rest]), 1e-9)
+        else:
+            iou = inter / np.maximum(areas[i] + areas[rest] - inter, 1e-9)
+        order = rest[iou <= iou_threshold]
+    return np.array(keep, dtype=np.int64)
+
+
+def batched_nms(boxes, scores, classes, iou_threshold, metric="iou"):
+    """Class-aware NMS: boxes of different classes are shifted apart so they never overlap."""
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    offsets = classes.astype(boxes.dtype)[:, None] * (boxes.max() + 1)
+    return nms(boxes + offsets, scores, iou_threshold, metric)
+
+
+def top_candidates(prediction, conf_threshold=0.25, max_candidates=30000):
+    """
+    Decode the raw head output of one image into pre-NMS candidates.
+
+    Args:
+        prediction (np.ndarray): (4 + num_classes, anchors) array of xywh boxes in input pixels
+            followed by per-class scores.
+        conf_threshold (float): Minimum class score.
+        max_candidates (int): Maximum candidates kept, highest scores first.
+
+    Returns:
+        tuple: (boxes (k, 4) xyxy, scores (k,), classes (k,)) of the best class of every anchor.
+    """
+    prediction = prediction.T
+    class_scores = prediction[:, 4:]
+    classes = class_scores.argmax(axis=1)
+    scores = class_scores[np.arange(len(classes)), classes]
+    mask = scores > conf_threshold
+    boxes, scores, classes = xywh_to_xyxy(prediction[mask, :4]), scores[mask], classes[mask]
+    if len(scores) > max_candidates:
+        top = np.argpartition(-scores, max_candidates)[:max_candidates]
+        boxes, scores, classes = boxes[top], scores[top], classes[top]
+    return boxes, scores, classes
+
+
+def non_max_suppression(predictions, conf_threshold=0.25, iou_threshold=0.45, max_det=300, max_candidates=30000):
+    """
+    Decode raw YOLOv8/YOLO11 detection head outputs and apply class-aware NMS.
+
+    Args:
+        predictions (np.ndarray): (batch, 4 + num_classes, anchors) array of xywh boxes in
+            input pixels followed by per-class scores.
+        conf_threshold (float): Minimum class score.
+        iou_threshold (float): IoU above which lower-scored boxes of the same class are dropped.
+        max_det (int): Maximum detections kept per image.
+        max_candidates (int): Maximum boxes passed to NMS per image.
+
+    Returns:
+        list: One (k, 6) float32 array per image with x1, y1, x2, y2, score, class.
+    """
+    outputs = []
+    for prediction in predictions:
+        boxes, scores, classes = top_candidates(prediction, conf_threshold, max_candidates)
+        keep = batched_nms(boxes, scores, classes, iou_threshold)[:max_det]
+        detections = np.concatenate(
+            [boxes[keep], scores[keep, None], classes[keep, None].astype(boxes.dtype)], axis=1
+        )
+        outputs.append(detections.astype(np.float32))
+    return outputs
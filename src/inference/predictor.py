@@ -1,24 +1,110 @@
-
-import torch
-from ultralytics import YOLO
+import os
+import cv2
+from src import tracing
+from src.inference.backends import backend_name_for
+from src.inference.engine import InferenceEngine, load_image
+from src.inference.tiling import TiledInference, load_tile_config
+from src.inference.video import VideoPipeline, draw_detections
 
 class YOLOv7Predictor:
-    def __init__(self, model_path):
-        self.model = YOLO(model_path)
+    def __init__(self, model_path, imgsz=640, batch_size=8, backend=None, num_threads=None, warmup=True,
+                 tile_config=None):
+        """
+        Initialize the predictor.
+
+        Args:
+            model_path (str): Path to a .pt, .onnx or .tflite artifact.
+            imgsz (int): Square network input size used by predict_batch.
+            batch_size (int): Maximum images per forward pass in predict_batch.
+            backend (str, optional): 'ultralytics', 'onnx' or 'tflite'; inferred from the extension by default.
+            num_threads (int, optional): Intra-op threads for the inference backend.
+            warmup (bool): Warm the inference engine up at load time.
+            tile_config (dict or str, optional): tile_size/overlap (or the tile_config.json written by
+                DataExplorer) used by predict_tiled.
+        """
+        self.backend = backend or backend_name_for(model_path)
+        self.model = None
+        if self.backend == "ultralytics":
+            from ultralytics import YOLO
+
+            self.model = YOLO(model_path)
+        self.engine = InferenceEngine(
+            model_path,
+            imgsz=imgsz,
+            batch_size=batch_size,
+            backend=self.backend,
+            num_threads=num_threads,
+            warmup=warmup,
+            model=self.model,
+        )
+        if isinstance(tile_config, str):
+            tile_config = load_tile_config(tile_config)
+        tile_config = tile_config or {}
+        self.tiler = TiledInference(
+            self.engine,
+            tile_size=tile_config.get("tile_size", imgsz),
+            overlap=tile_config.get("overlap", imgsz // 10),
+        )
 
     def predict(self, image_path, conf_threshold=0.25, iou_threshold=0.45):
-        results = self.model(image_path, conf=conf_threshold, iou=iou_threshold)
-        return results
+        with tracing.span("predict", backend=self.backend):
+            if self.model is None:
+                return self.predict_batch([image_path], conf_threshold, iou_threshold)
+            results = self.model(image_path, conf=conf_threshold, iou=iou_threshold)
+            return results
+
+    def predict_batch(self, images, conf_threshold=0.25, iou_threshold=0.45, max_det=300):
+        """Batched inference through the engine; returns one (k, 6) x1, y1, x2, y2, score, class array per image."""
+        return self.engine.predict_batch(images, conf_threshold, iou_threshold, max_det)
+
+    def predict_tiled(self, images, conf_threshold=0.25, iou_threshold=0.45, max_det=300):
+        """
+        Sliced inference for small objects: every image is cut into overlapping tiles, all tiles are
+        batched through the engine and the detections are merged with cross-tile NMS.
+
+        Returns:
+            list: One (k, 6) x1, y1, x2, y2, score, class array per image in original pixels.
+        """
+        return self.tiler.predict_batch(images, conf_threshold, iou_threshold, max_det)
 
-    def visualize_predictions(self, results, output_dir="./predictions"):
+    def predict_video(self, source, output_path, target_fps=None, conf_threshold=0.25, iou_threshold=0.45, fps=None):
+        """
+        Run pipelined detection on a video file or frame directory and write one annotated video.
+
+        Args:
+            source (str): Video file or directory of frames.
+            output_path (str): Output video path (mp4).
+            target_fps (float, optional): Rate to keep up with; frames are skipped adaptively when
+                inference is slower.
+            fps (float, optional): Frame rate of a frame directory source.
+
+        Returns:
+            dict: Frame counts and per-stage throughput.
+        """
+        pipeline = VideoPipeline(self.engine, target_fps=target_fps, conf_threshold=conf_threshold,
+                                 iou_threshold=iou_threshold)
+        return pipeline.run(source, output_path, fps=fps)
+
+    def visualize_predictions(self, results, output_dir="./predictions", images=None):
+        """
+        Save one annotated image per prediction.
+
+        Args:
+            results (list): What predict returned: Ultralytics Results for a .pt model, (k, 6) arrays otherwise.
+            output_dir (str): Directory of the prediction_{i}.jpg files.
+            images (list, optional): The predicted images (paths or BGR arrays), needed to draw (k, 6) arrays.
+        """
         for i, r in enumerate(results):
-            # Plot results image
-            im_bgr = r.plot()  # BGR numpy array
+            if hasattr(r, "plot"):
+                # Plot results image
+                im_bgr = r.plot()  # BGR numpy array
+            else:
+                if images is None:
+                    raise ValueError(f"visualize_predictions needs the images to draw {self.backend} detections")
+                im_bgr = draw_detections(load_image(images[i]).copy(), r)
             # Save results to disk
             if not os.path.exists(output_dir):
                 os.makedirs(output_dir)
             output_path = os.path.join(output_dir, f"prediction_{i}.jpg")
             cv2.imwrite(output_path, im_bgr)
             print(f"Prediction saved to {output_path}")
-
-
@@ -0,0 +1,265 @@
+import argparse
+import asyncio
+import json
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+import cv2
+import numpy as np
+from src.inference.engine import letterbox_into, load_image
+
+STATUS_TEXT = {200: "OK", 400: "Bad Request", 404: "Not Found", 500: "Internal Server Error",
+               503: "Service Unavailable"}
+
+
+def decode_image(image):
+    """Decode encoded image bytes; paths and arrays are handled by load_image."""
+    if isinstance(image, (bytes, bytearray, memoryview)):
+        try:
+            decoded = cv2.imdecode(np.frombuffer(image, dtype=np.uint8), cv2.IMREAD_COLOR)
+        except cv2.error as e:
+            raise ValueError(f"Request body is not a decodable image: {e}") from e
+        if decoded is None:
+            raise ValueError("Request body is not a decodable image")
+        return decoded
+    return load_image(image)
+
+
+class InferenceServer:
+    def __init__(self, predictor, max_batch_size=None, max_wait_ms=5.0, max_queue_size=64, decode_workers=4,
+                 conf_threshold=0.25, iou_threshold=0.45, latency_window=2048):
+        """
+        Serve a YOLOv7Predictor with dynamic micro-batching on an asyncio event loop.
+
+        Requests are decoded and letterboxed in a thread pool, queued, and grouped into batches
+        of at most max_batch_size images, waiting at most max_wait_ms for a batch to fill.
+        Batches run one at a time on a dedicated inference thread.
+
+        Args:
+            predictor (YOLOv7Predictor): Predictor whose inference engine runs the batches.
+            max_batch_size (int, optional): Defaults to the engine batch size.
+            max_wait_ms (float): Longest time the first request of a batch waits for company.
+            max_queue_size (int): Requests accepted but not yet answered before new ones are rejected.
+            decode_workers (int): Threads decoding and preprocessing requests.
+            conf_threshold (float): Confidence threshold for detections.
+            iou_threshold (float): NMS IoU threshold.
+            latency_window (int): Number of recent requests used for the latency percentiles.
+        """
+        self.engine = predictor.engine
+        self.max_batch_size = max_batch_size or self.engine.batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.max_queue_size = max_queue_size
+        self.decode_workers = decode_workers
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.latencies = deque(maxlen=latency_window)
+        self.batch_sizes = deque(maxlen=latency_window)
+        self.inflight = 0
+        self.rejected = 0
+        self.served = 0
+        self.queue = None
+        self.batcher = None
+        self.decode_pool = None
+        self.infer_pool = None
+
+    async def start(self):
+        self.queue = asyncio.Queue()
+        self.decode_pool = ThreadPoolExecutor(max_workers=self.decode_workers, thread_name_prefix="decode")
+        self.infer_pool = ThreadPoolExecutor(max_workers=1, thread_name_prefix="infer")
+        self.batcher = asyncio.create_task(self.batch_loop())
+
+    async def stop(self):
+        if self.batcher is not None:
+            self.batcher.cancel()
+            try:
+                await self.batcher
+            except asyncio.CancelledError:
+                pass
+        self.decode_pool.shutdown(wait=False)
+        self.infer_pool.shutdown(wait=True)
+
+    def preprocess(self, image):
+        decoded = decode_image(image)
+        tensor = np.empty((3, self.engine.imgsz, self.engine.imgsz), dtype=np.float32)
+        ratio, pad = letterbox_into(decoded, tensor, self.engine.imgsz)
+        return tensor, (ratio, pad, decoded.shape[:2])
+
+    async def submit(self, image):
+        """
+        Run detection on one image (encoded bytes, path or BGR array).
+
+        Returns:
+            np.ndarray: (k, 6) x1, y1, x2, y2, score, class detections.
+
+        Raises:
+            asyncio.QueueFull: If max_queue_size requests are already in flight.
+        """
+        if self.inflight >= self.max_queue_size:
+            self.rejected += 1
+            raise asyncio.QueueFull(f"{self.inflight} requests in flight")
+        self.inflight += 1
+        start = time.perf_counter()
+        try:
+            loop = asyncio.get_running_loop()
+            tensor, meta = await loop.run_in_executor(self.decode_pool, self.preprocess, image)
+            future = loop.create_future()
+            await self.queue.put((tensor, meta, future))
+            detections = await future
+        finally:
+            self.inflight -= 1
+        self.latencies.append(time.perf_counter() - start)
+        self.served += 1
+        return detections
+
+    def run_batch(self, tensors, meta):
+        if len(tensors) <= len(self.engine.buffer):
+            batch = np.stack(tensors, out=self.engine.buffer[:len(tensors)])
+        else:
+            batch = np.stack(tensors)
+        output = self.engine.infer(batch)
+        return self.engine.postprocess(output, meta, self.conf_threshold, self.iou_threshold)
+
+    async def batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            items = [await self.queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(items) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    items.append(await asyncio.wait_for(self.queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            tensors, meta, futures = zip(*items)
+            try:
+                results = await loop.run_in_executor(self.infer_pool, self.run_batch, list(tensors), list(meta))
+            except Exception as e:
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            self.batch_sizes.append(len(items))
+            for future, detections in zip(futures, results):
+                if not future.done():
+                    future.set_result(detections)
+
+    def stats(self):
+        """Return queue depth, throughput counters and latency percentiles in milliseconds."""
+        latencies = np.array(self.latencies) * 1000.0
+        percentiles = np.percentile(latencies, [50, 95, 99]).round(3).tolist() if len(latencies) else [None] * 3
+        return {
+            "queue_depth": self.queue.qsize() if self.queue is not None else 0,
+            "inflight": self.inflight,
+            "served": self.served,
+            "rejected": self.rejected,
+            "mean_batch_size": float(np.mean(self.batch_sizes)) if self.batch_sizes else None,
+            "latency_ms": dict(zip(("p50", "p95", "p99"), percentiles)),
+        }
+
+    async def handle_connection(self, reader, writer):
+        """Minimal HTTP/1.1: POST /predict with an encoded image body, GET /stats."""
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line:
+                    break
+                method, path, _ = request_line.decode("latin-1").split(" ", 2)
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if line in (b"\r\n", b"\n", b""):
+                        break
+                    name, _, value = line.decode("latin-1").partition(":")
+                    headers[name.strip().lower()] = value.strip()
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    content_length = int(headers.get("content-length", 0))
+                    if content_length < 0:
+                        raise ValueError(content_length)
+                except ValueError:
+                    # Without a valid length the end of the body is unknown, so the connection closes
+                    status, payload = 400, {"error": f"Invalid Content-Length: {headers['content-length']!r}"}
+                    keep_alive = False
+                else:
+                    body = await reader.readexactly(content_length)
+                    status, payload = await self.route(method, path, body)
+                data = json.dumps(payload).encode()
+                writer.write(
+                    f"HTTP/1.1 {status} {STATUS_TEXT[status]}\r\nContent-Type: application/json\r\n"
+                    f"Content-Length: {len(data)}\r\nConnection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n"
+                    .encode() + data
+                )
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (asyncio.IncompleteReadError, ConnectionResetError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def route(self, method, path, body):
+        if method == "GET" and path == "/stats":
+            return 200, self.stats()
+        if method == "POST" and path == "/predict":
+            if not body:
+                return 400, {"error": "Empty request body, expected an encoded image"}
+            try:
+                detections = await self.submit(body)
+            except asyncio.QueueFull as e:
+                return 503, {"error": f"Server overloaded: {e}"}
+            except ValueError as e:
+                return 400, {"error": str(e)}
+            except Exception as e:
+                # e.g. a backend error set on every request of the failed batch
+                return 500, {"error": f"Inference failed: {e}"}
+            return 200, {"detections": detections.tolist()}
+        return 404, {"error": f"No route for {method} {path}"}
+
+    async def serve(self, host="127.0.0.1", port=8000):
+        """Start the batcher and serve HTTP until cancelled."""
+        await self.start()
+        server = await asyncio.start_server(self.handle_connection, host, port)
+        print(f"Serving {self.engine.model_path} on http://{host}:{port} (POST /predict, GET /stats)")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            await self.stop()
+
+
+async def request_prediction(host, port, image_bytes):
+    """Local client: send one encoded image to a running server and return the decoded JSON reply."""
+    reader, writer = await asyncio.open_connection(host, port)
+    writer.write(
+        f"POST /predict HTTP/1.1\r\nHost: {host}\r\nContent-Length: {len(image_bytes)}\r\nConnection: close\r\n\r\n"
+        .encode() + image_bytes
+    )
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    return json.loads(response.split(b"\r\n\r\n", 1)[1])
+
+
+def main():
+    from src.inference.predictor import YOLOv7Predictor
+
+    parser = argparse.ArgumentParser(description="Micro-batching YOLO inference server")
+    parser.add_argument("--model", required=True, help="Path to a .pt, .onnx or .tflite model")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--imgsz", type=int, default=640)
+    parser.add_argument("--batch-size", type=int, default=8)
+    parser.add_argument("--max-wait-ms", type=float, default=5.0)
+    parser.add_argument("--max-queue-size", type=int, default=64)
+    parser.add_argument("--num-threads", type=int, default=None)
+    args = parser.parse_args()
+
+    predictor = YOLOv7Predictor(args.model, imgsz=args.imgsz, batch_size=args.batch_size, num_threads=args.num_threads)
+    server = InferenceServer(predictor, max_wait_ms=args.max_wait_ms, max_queue_size=args.max_queue_size)
+    asyncio.run(server.serve(args.host, args.port))
+
+
+if __name__ == "__main__":
+    main()
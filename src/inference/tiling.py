@@ -0,0 +1,93 @@
+import json
+import numpy as np
+from src.inference.engine import clip_detections, letterbox_into, load_image
+from src.inference.nms import batched_nms
+
+
+def load_tile_config(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def tile_grid(height, width, tile_size, overlap):
+    """
+    Return (n, 4) x1, y1, x2, y2 windows covering an image; the last row and column are
+    shifted back to end on the image border instead of being padded.
+    """
+    stride = max(tile_size - overlap, 1)
+
+    def starts(length):
+        if length <= tile_size:
+            return np.zeros(1, dtype=np.int64)
+        positions = np.arange(int(np.ceil((length - tile_size) / stride)) + 1) * stride
+        positions[-1] = length - tile_size
+        return positions
+
+    y, x = np.meshgrid(starts(height), starts(width), indexing="ij")
+    x1, y1 = x.ravel(), y.ravel()
+    return np.stack([x1, y1, np.minimum(x1 + tile_size, width), np.minimum(y1 + tile_size, height)], axis=1)
+
+
+class TiledInference:
+    def __init__(self, engine, tile_size=640, overlap=64, include_full_image=True, max_tiles_per_pass=32,
+                 merge_threshold=0.5, merge_metric="ios"):
+        """
+        Sliced inference for small objects on images larger than the network input.
+
+        Args:
+            engine (InferenceEngine): Engine whose backend runs the tiles.
+            tile_size (int): Side of the square tiles in original image pixels.
+            overlap (int): Overlap between neighbouring tiles in pixels.
+            include_full_image (bool): Also run the whole downscaled image so large objects
+                spanning several tiles are still detected in one piece.
+            max_tiles_per_pass (int): Tiles of all images are batched into forward passes of at most this size.
+            merge_threshold (float): Overlap above which cross-tile detections of one class are merged.
+            merge_metric (str): 'ios' (intersection over the smaller box) or 'iou' for the cross-tile merge.
+        """
+        self.engine = engine
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.include_full_image = include_full_image
+        self.max_tiles_per_pass = max_tiles_per_pass
+        self.merge_threshold = merge_threshold
+        self.merge_metric = merge_metric
+        self.buffer = np.zeros((0, 3, engine.imgsz, engine.imgsz), dtype=np.float32)
+
+    def windows(self, shape):
+        height, width = shape[:2]
+        windows = tile_grid(height, width, self.tile_size, self.overlap)
+        if self.include_full_image and len(windows) > 1:
+            windows = np.concatenate([windows, [[0, 0, width, height]]])
+        return windows
+
+    def predict_batch(self, images, conf_threshold=0.25, iou_threshold=0.45, max_det=300):
+        """
+        Run tiled inference on image paths or BGR arrays.
+
+        Returns:
+            list: One (k, 6) float32 x1, y1, x2, y2, score, class array per image in original pixels.
+        """
+        images = [load_image(image) for image in images]
+        tiles = [(i, window) for i, image in enumerate(images) for window in self.windows(image.shape)]
+        per_image = [[] for _ in images]
+        for start in range(0, len(tiles), self.max_tiles_per_pass):
+            chunk = tiles[start:start + self.max_tiles_per_pass]
+            if len(self.buffer) < len(chunk):
+                self.buffer = np.zeros((len(chunk), 3, self.engine.imgsz, self.engine.imgsz), dtype=np.float32)
+            meta = []
+            for slot, (i, (x1, y1, x2, y2)) in enumerate(chunk):
+                ratio, pad = letterbox_into(images[i][y1:y2, x1:x2], self.buffer[slot], self.engine.imgsz)
+                meta.append((ratio, pad, (y2 - y1, x2 - x1)))
+            output = self.engine.infer(self.buffer[:len(chunk)])
+            detections = self.engine.postprocess(output, meta, conf_threshold, iou_threshold, max_det)
+            for (i, (x1, y1, _, _)), tile_detections in zip(chunk, detections):
+                tile_detections[:, [0, 2]] += x1
+                tile_detections[:, [1, 3]] += y1
+                per_image[i].append(tile_detections)
+        return [self.merge(np.concatenate(d), image.shape, max_det) for d, image in zip(per_image, images)]
+
+    def merge(self, detections, shape, max_det=300):
+        """Cross-tile class-aware NMS over the detections of all tiles of one image."""
+        keep = batched_nms(detections[:, :4], detections[:, 4], detections[:, 5], self.merge_threshold,
+                           self.merge_metric)[:max_det]
+        return clip_detections(detections[keep], shape)
@@ -0,0 +1,251 @@
+import math
+import os
+import queue
+import threading
+import time
+import cv2
+import numpy as np
+from src.inference.engine import letterbox_into
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp")
+END = object()
+
+
+class FrameSource:
+    def __init__(self, source, fps=None):
+        """
+        Iterate over the frames of a video file or of the images in a directory (sorted by name).
+
+        Args:
+            source (str): Video file or frame directory.
+            fps (float, optional): Frame rate of a frame directory; videos report their own.
+        """
+        self.source = source
+        if os.path.isdir(source):
+            self.files = sorted(f for f in os.listdir(source) if f.lower().endswith(IMAGE_EXTENSIONS))
+            self.fps = fps or 30.0
+        else:
+            self.files = None
+            capture = cv2.VideoCapture(source)
+            if not capture.isOpened():
+                raise FileNotFoundError(f"Could not open video: {source}")
+            self.fps = fps or capture.get(cv2.CAP_PROP_FPS) or 30.0
+            capture.release()
+
+    def __iter__(self):
+        if self.files is not None:
+            for name in self.files:
+                frame = cv2.imread(os.path.join(self.source, name))
+                if frame is not None:
+                    yield frame
+            return
+        capture = cv2.VideoCapture(self.source)
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                yield frame
+        finally:
+            capture.release()
+
+
+def draw_detections(image, detections, names=None):
+    """Draw (k, 6) x1, y1, x2, y2, score, class detections onto a BGR image in place."""
+    for x1, y1, x2, y2, score, class_id in detections.tolist():
+        class_id = int(class_id)
+        color = tuple(int(c) for c in np.random.default_rng(class_id).integers(64, 256, 3))
+        label = f"{names.get(class_id, class_id) if names else class_id} {score:.2f}"
+        cv2.rectangle(image, (int(x1), int(y1)), (int(x2), int(y2)), color, 2)
+        cv2.putText(image, label, (int(x1), max(int(y1) - 4, 10)), cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1, cv2.LINE_AA)
+    return image
+
+
+class StageStats:
+    def __init__(self, name):
+        self.name = name
+        self.items = 0
+        self.busy = 0.0
+
+    def as_dict(self, wall_time):
+        return {
+            "items": self.items,
+            "busy_s": round(self.busy, 3),
+            "items_per_s": round(self.items / self.busy, 2) if self.busy else None,
+            "utilization": round(self.busy / wall_time, 3) if wall_time else None,
+        }
+
+
+class VideoPipeline:
+    def __init__(self, engine, batch_size=None, queue_size=16, target_fps=None, conf_threshold=0.25,
+                 iou_threshold=0.45):
+        """
+        Run detection on a frame stream with decode, preprocess, inference and encode overlapping.
+
+        Each stage runs on its own thread and hands frames on through bounded queues, so a slow
+        stage applies backpressure instead of buffering the whole video.
+
+        Args:
+            engine (InferenceEngine): Engine running the forward passes.
+            batch_size (int, optional): Frames per forward pass, defaults to the engine batch size.
+            queue_size (int): Capacity of each inter-stage queue.
+            target_fps (float, optional): Frame rate the pipeline has to keep up with. When
+                inference is slower, only every n-th frame goes through the model and the frames
+                in between are written with the latest detections. None processes every frame.
+            conf_threshold (float): Confidence threshold for detections.
+            iou_threshold (float): NMS IoU threshold.
+        """
+        self.engine = engine
+        self.batch_size = min(batch_size or engine.batch_size, engine.batch_size)
+        self.queue_size = queue_size
+        self.target_fps = target_fps
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.stride = 1
+        self.infer_fps = None
+
+    def run(self, source, output_path, fps=None):
+        """
+        Annotate every frame of source and encode them into a single video at output_path.
+
+        Returns:
+            dict: Frame counts, wall time and per-stage throughput.
+        """
+        frames = FrameSource(source, fps)
+        stats = {name: StageStats(name) for name in ("decode", "preprocess", "inference", "encode")}
+        queues = [queue.Queue(maxsize=self.queue_size) for _ in range(3)]
+        errors = []
+        counters = {"skipped": 0}
+        self.stride = 1
+
+        def guarded(target, *args):
+            def wrapper():
+                try:
+                    target(*args)
+                except Exception as e:
+                    errors.append(e)
+                    for q in queues:
+                        try:
+                            q.put_nowait(END)
+                        except queue.Full:
+                            pass
+            return threading.Thread(target=wrapper, name=target.__name__, daemon=True)
+
+        def decode(out_queue):
+            index = 0
+            iterator = iter(frames)
+            while not errors:
+                start = time.perf_counter()
+                frame = next(iterator, None)
+                stats["decode"].busy += time.perf_counter() - start
+                if frame is None:
+                    break
+                stats["decode"].items += 1
+                infer = index % self.stride == 0
+                counters["skipped"] += not infer
+                out_queue.put((index, frame, infer))
+                index += 1
+            out_queue.put(END)
+
+        def preprocess(in_queue, out_queue):
+            while True:
+                item = in_queue.get()
+                if item is END:
+                    break
+                index, frame, infer = item
+                tensor = meta = None
+                if infer:
+                    start = time.perf_counter()
+                    tensor = np.empty((3, self.engine.imgsz, self.engine.imgsz), dtype=np.float32)
+                    ratio, pad = letterbox_into(frame, tensor, self.engine.imgsz)
+                    meta = (ratio, pad, frame.shape[:2])
+                    stats["preprocess"].busy += time.perf_counter() - start
+                    stats["preprocess"].items += 1
+                out_queue.put((index, frame, tensor, meta))
+            out_queue.put(END)
+
+        def inference(in_queue, out_queue):
+            finished = False
+            while not finished:
+                items = [in_queue.get()]
+                while items[-1] is not END and sum(item[2] is not None for item in items) < self.batch_size:
+                    try:
+                        items.append(in_queue.get(timeout=0.002))
+                    except queue.Empty:
+                        break
+                if items[-1] is END:
+                    items.pop()
+                    finished = True
+                selected = [item for item in items if item[2] is not None]
+                results = {}
+                if selected:
+                    start = time.perf_counter()
+                    batch = np.stack([item[2] for item in selected], out=self.engine.buffer[:len(selected)])
+                    output = self.engine.infer(batch)
+                    detections = self.engine.postprocess(output, [item[3] for item in selected],
+                                                         self.conf_threshold, self.iou_threshold)
+                    elapsed = time.perf_counter() - start
+                    stats["inference"].busy += elapsed
+                    stats["inference"].items += len(selected)
+                    results = {item[0]: d for item, d in zip(selected, detections)}
+                    self.adapt_stride(len(selected) / elapsed)
+                for index, frame, _, _ in items:
+                    out_queue.put((index, frame, results.get(index)))
+            out_queue.put(END)
+
+        def encode(in_queue):
+            writer = None
+            latest = np.empty((0, 6), dtype=np.float32)
+            while True:
+                item = in_queue.get()
+                if item is END:
+                    break
+                start = time.perf_counter()
+                _, frame, detections = item
+                if detections is not None:
+                    latest = detections
+                if writer is None:
+                    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+                    writer = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*"mp4v"), frames.fps,
+                                             (frame.shape[1], frame.shape[0]))
+                writer.write(draw_detections(frame, latest, self.engine.names))
+                stats["encode"].busy += time.perf_counter() - start
+                stats["encode"].items += 1
+            if writer is not None:
+                writer.release()
+
+        wall_start = time.perf_counter()
+        threads = [
+            guarded(decode, queues[0]),
+            guarded(preprocess, queues[0], queues[1]),
+            guarded(inference, queues[1], queues[2]),
+            guarded(encode, queues[2]),
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            while thread.is_alive() and not errors:
+                thread.join(0.1)
+        if errors:
+            raise errors[0]
+        wall_time = time.perf_counter() - wall_start
+
+        report = {
+            "frames": stats["decode"].items,
+            "inferred": stats["inference"].items,
+            "skipped": counters["skipped"],
+            "wall_s": round(wall_time, 3),
+            "fps": round(stats["encode"].items / wall_time, 2) if wall_time else None,
+            "stages": {name: stage.as_dict(wall_time) for name, stage in stats.items()},
+        }
+        print(f"Video saved to {output_path}: {report['frames']} frames, {report['inferred']} inferred, "
+              f"{report['skipped']} skipped, {report['fps']} fps")
+        for name, stage in report["stages"].items():
+            print(f"  {name:<10} {stage['items']:>6} items  {stage['items_per_s']} items/s  utilization {stage['utilization']}")
+        return report
+
+    def adapt_stride(self, batch_fps, smoothing=0.3):
+        """Update the frame stride from an exponential moving average of inference throughput."""
+        self.infer_fps = batch_fps if self.infer_fps is None else (1 - smoothing) * self.infer_fps + smoothing * batch_fps
+        if self.target_fps:
+            self.stride = max(1, math.ceil(self.target_fps / self.infer_fps))
@@ -0,0 +1,259 @@
+import hashlib
+import json
+import os
+import numpy as np
+import yaml
+from src.evaluation.yolo_dataset import load_data_config
+
+
+def select_calibration_subset(index, rows, size, size_buckets=4, count_buckets=4):
+    """
+    Greedily pick a compact, class-balanced subset of images for int8 calibration.
+
+    Each step takes the candidate that adds the most weight from classes the subset still
+    under-represents (rare classes weigh more) plus a bonus for under-represented strata of
+    image size and objects per image, so the calibration activations cover the value ranges
+    the deployed model sees.
+
+    Args:
+        index (AnnotationIndex): Loaded annotation index.
+        rows (np.ndarray): Candidate rows of the per-image table.
+        size (int): Number of images to select.
+        size_buckets (int): Quantile buckets over image area.
+        count_buckets (int): Quantile buckets over objects per image.
+
+    Returns:
+        np.ndarray: Selected rows, in selection order.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    if len(rows) <= size:
+        return rows
+    num_classes = len(index.classes_names)
+    offsets = np.asarray(index.offsets)
+    class_ids = np.asarray(index.class_ids)
+    counts = offsets[rows + 1] - offsets[rows]
+
+    presence = np.zeros((len(rows), num_classes), dtype=np.float64)
+    object_rows = np.repeat(np.arange(len(rows)), counts)
+    object_index = np.arange(counts.sum()) + np.repeat(offsets[rows] - (np.cumsum(counts) - counts), counts)
+    object_classes = class_ids[object_index]
+    known = object_classes >= 0
+    np.add.at(presence, (object_rows[known], object_classes[known].astype(np.int64)), 1.0)
+    presence = np.minimum(presence, 1.0)
+    rarity = 1.0 / np.maximum(presence.sum(axis=0), 1.0)
+
+    def buckets(values, n):
+        edges = np.quantile(values, np.linspace(0, 1, n + 1)[1:-1]) if len(values) else []
+        return np.searchsorted(edges, values, side="right")
+
+    areas = np.asarray(index.widths)[rows].astype(np.float64) * np.asarray(index.heights)[rows]
+    strata = buckets(areas, size_buckets) * count_buckets + buckets(counts, count_buckets)
+    num_strata = size_buckets * count_buckets
+
+    selected = []
+    available = np.ones(len(rows), dtype=bool)
+    class_taken = np.zeros(num_classes)
+    strata_taken = np.zeros(num_strata)
+    for _ in range(size):
+        class_gain = presence @ (rarity / (1.0 + class_taken))
+        strata_gain = rarity.mean() / (1.0 + strata_taken[strata])
+        score = np.where(available, class_gain + strata_gain, -np.inf)
+        best = int(np.argmax(score))
+        selected.append(best)
+        available[best] = False
+        class_taken += presence[best]
+        strata_taken[strata[best]] += 1
+    return rows[np.array(selected)]
+
+
+class CalibrationSet:
+    def __init__(self, annotation_index, processed_root, data_config_path, cache_dir, imgsz=640, size=300,
+                 split="train"):
+        """
+        Initialize the CalibrationSet.
+
+        Args:
+            annotation_index (AnnotationIndex): Parsed annotations the subset is selected from.
+            processed_root (str): Root of the YOLO dataset written by DataProcessor.
+            data_config_path (str): Dataset YAML whose class names the calibration YAML reuses.
+            cache_dir (str): Where the image list, calibration YAML and tensor cache are written.
+            imgsz (int): Square input size of the cached calibration tensors.
+            size (int): Number of calibration images.
+            split (str): Split the images are drawn from; val stays untouched for accuracy checks.
+        """
+        self.annotation_index = annotation_index
+        self.processed_root = processed_root
+        self.data_config_path = data_config_path
+        self.cache_dir = cache_dir
+        self.imgsz = imgsz
+        self.size = size
+        self.split = split
+        self.image_paths = None
+        self.key = None
+
+    @property
+    def list_path(self):
+        return os.path.join(self.cache_dir, "images.txt")
+
+    @property
+    def calibration_config_path(self):
+        return os.path.join(self.cache_dir, "calibration.yaml")
+
+    @property
+    def tensors_path(self):
+        return os.path.join(self.cache_dir, f"tensors_{self.imgsz}.npy")
+
+    def prepare(self):
+        """Select the subset and write the image list and calibration YAML; returns self."""
+        if self.image_paths is not None:
+            return self
+        index = self.annotation_index.load()
+        split_txt = os.path.join(os.path.dirname(os.path.normpath(index.annotations_dir)), "ImageSets", "Main", f"{self.split}.txt")
+        with open(split_txt) as f:
+            ids = [line.strip() for line in f if line.strip()]
+        images_dir = os.path.join(self.processed_root, "images", self.split)
+        rows = [row for row in (index.row(image_id) for image_id in ids)
+                if row is not None and os.path.exists(os.path.join(images_dir, str(index.filenames[row])))]
+        selected = select_calibration_subset(index, rows, self.size)
+        self.image_paths = [os.path.abspath(os.path.join(images_dir, str(index.filenames[row]))) for row in selected]
+
+        digest = hashlib.sha256(f"{self.imgsz}\n".encode())
+        for path in self.image_paths:
+            stat = os.stat(path)
+            digest.update(f"{path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+        self.key = digest.hexdigest()
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(self.list_path, "w") as f:
+            f.write("\n".join(self.image_paths) + "\n")
+        names = load_data_config(self.data_config_path)["names"]
+        with open(self.calibration_config_path, "w") as f:
+            yaml.safe_dump({
+                "path": os.path.abspath(self.cache_dir),
+                "train": os.path.abspath(self.list_path),
+                "val": os.path.abspath(self.list_path),
+                "nc": len(names),
+                "names": names,
+            }, f, sort_keys=False)
+        print(f"Calibration subset: {len(self.image_paths)} {self.split} images, list saved to {self.list_path}")
+        return self
+
+    def tensors(self):
+        """
+        Return the letterboxed calibration images as a memory-mapped (n, imgsz, imgsz, 3) uint8 RGB array.
+
+        The array is rebuilt only when the selected images or imgsz change.
+        """
+        import cv2
+        from src.inference.engine import letterbox_into
+
+        self.prepare()
+        meta_path = f"{self.tensors_path}.json"
+        if os.path.exists(meta_path) and os.path.exists(self.tensors_path):
+            with open(meta_path) as f:
+                if json.load(f).get("key") == self.key:
+                    return np.load(self.tensors_path, mmap_mode="r")
+        tensors = np.lib.format.open_memmap(
+            self.tensors_path, mode="w+", dtype=np.uint8, shape=(len(self.image_paths), self.imgsz, self.imgsz, 3)
+        )
+        chw = np.empty((3, self.imgsz, self.imgsz), dtype=np.float32)
+        for i, path in enumerate(self.image_paths):
+            letterbox_into(cv2.imread(path), chw, self.imgsz)
+            tensors[i] = (chw.transpose(1, 2, 0) * 255.0).round().astype(np.uint8)
+        tensors.flush()
+        del tensors
+        with open(meta_path, "w") as f:
+            json.dump({"key": self.key, "images": len(self.image_paths)}, f)
+        print(f"Calibration tensors cached to {self.tensors_path}")
+        return np.load(self.tensors_path, mmap_mode="r")
+
+
+def quantize_onnx_static(float_model_path, int8_model_path, tensors_path, batch_size=8):
+    """Quantize an ONNX model to int8 (QDQ) with ONNX Runtime, calibrating on the cached tensors."""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+
+    tensors = np.load(tensors_path, mmap_mode="r")
+    input_meta = ort.InferenceSession(float_model_path, providers=["CPUExecutionProvider"]).get_inputs()[0]
+    fixed_batch = input_meta.shape[0] if isinstance(input_meta.shape[0], int) else batch_size
+
+    class Reader(CalibrationDataReader):
+        def __init__(self):
+            self.start = 0
+
+        def get_next(self):
+            if self.start >= len(tensors):
+                return None
+            batch = tensors[self.start:self.start + fixed_batch]
+            self.start += fixed_batch
+            if len(batch) < fixed_batch:
+                batch = np.concatenate([batch, batch[:1].repeat(fixed_batch - len(batch), axis=0)])
+            return {input_meta.name: np.ascontiguousarray(batch.transpose(0, 3, 1, 2), dtype=np.float32) / 255.0}
+
+    quantize_static(
+        float_model_path,
+        int8_model_path,
+        Reader(),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=True,
+    )
+    return int8_model_path
+
+
+def profile_quantization(float_model_path, int8_model_paths, data_config_path, output_path, imgsz=640, subset_size=200):
+    """
+    Compare per-class AP of int8 models against their float model on a fixed val subset.
+
+    For ONNX int8 models, the weight SQNR of every quantized initializer is added so the
+    layers losing the most precision can be located.
+
+    Returns:
+        dict: Report with overall and per-class mAP50-95 deltas, also written to output_path as JSON.
+    """
+    import cv2
+    from src.evaluation.metrics import evaluate_detections
+    from src.evaluation.yolo_dataset import labels_to_pixels, read_labels, split_images
+    from src.inference.engine import InferenceEngine
+
+    names = load_data_config(data_config_path)["names"]
+    pairs = split_images(data_config_path, "val", subset_size)
+    images = [cv2.imread(image_path) for image_path, _ in pairs]
+    truths = [labels_to_pixels(read_labels(label_path), image.shape) for (_, label_path), image in zip(pairs, images)]
+
+    def per_class_ap(model_path):
+        engine = InferenceEngine(model_path, imgsz=imgsz, batch_size=8, warmup=False)
+        metrics = evaluate_detections(engine.predict_batch(images, conf_threshold=0.001, iou_threshold=0.7), truths, len(names))
+        return metrics, metrics["ap"].mean(axis=1)
+
+    float_metrics, float_ap = per_class_ap(float_model_path)
+    report = {"float_model": float_model_path, "float_map50_95": round(float_metrics["map50_95"], 4), "images": len(pairs),
+              "models": {}}
+    for int8_model_path in int8_model_paths:
+        metrics, ap = per_class_ap(int8_model_path)
+        present = float_metrics["present"]
+        per_class = {
+            names[c]: {"float": round(float(float_ap[c]), 4), "int8": round(float(ap[c]), 4),
+                       "delta": round(float(ap[c] - float_ap[c]), 4)}
+            for c in np.nonzero(present)[0]
+        }
+        entry = {
+            "map50_95": round(metrics["map50_95"], 4),
+            "delta": round(metrics["map50_95"] - float_metrics["map50_95"], 4),
+            "per_class": dict(sorted(per_class.items(), key=lambda item: item[1]["delta"])),
+        }
+        if int8_model_path.endswith(".onnx") and float_model_path.endswith(".onnx"):
+            from onnxruntime.quantization.qdq_loss_debug import compute_weight_error, create_weight_matching
+            errors = compute_weight_error(create_weight_matching(float_model_path, int8_model_path))
+            entry["weight_sqnr_db"] = {name: round(float(value), 2) for name, value in sorted(errors.items(), key=lambda item: item[1])[:20]}
+        report["models"][int8_model_path] = entry
+        worst = list(entry["per_class"].items())[:3]
+        print(f"{int8_model_path}: mAP50-95 {entry['map50_95']} ({entry['delta']:+.4f} vs float), "
+              f"largest class drops: " + ", ".join(f"{name} {values['delta']:+.4f}" for name, values in worst))
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    with open(output_path, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"Quantization profile saved to {output_path}")
+    return report
@@ -1,8 +1,57 @@
-from ultralytics import YOLO
+import hashlib
+import json
+import multiprocessing
 import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from src import tracing
+from src.data_processing.file_materializer import materialize
+from src.evaluation.yolo_dataset import split_images
+from src.models.calibration import profile_quantization, quantize_onnx_static
+from src.utils import sha256_of
+
+# format -> (published subdirectory, published file name, int8)
+EXPORTS = {
+    "tflite": ("tflite", "best_model_int8.tflite", True),
+    "onnx": ("onnx", "best_model.onnx", False),
+    "onnx_int8": ("onnx", "best_model_int8.onnx", True),
+}
+
+
+def export_worker(model_path, work_dir, export_format, device, data_config_path, int8, img_size, calibration_tensors=None,
+                  trace=False):
+    """
+    Export one format from a private copy of the weights inside its cache entry.
+
+    Ultralytics writes exports next to the weights file, so every worker gets its own copy
+    and concurrent exports of the same model never overwrite each other's files. 'onnx_int8'
+    is a float ONNX export quantized with ONNX Runtime on the cached calibration tensors.
+
+    Returns:
+        tuple: (artifact path, trace of the worker to merge).
+    """
+    tracing.start_worker(trace)
+    os.makedirs(work_dir, exist_ok=True)
+    weights = os.path.join(work_dir, os.path.basename(model_path))
+    materialize(model_path, weights)
+    from ultralytics import YOLO
+
+    model = YOLO(weights)
+    with tracing.span(f"export.{export_format}"):
+        if export_format == "onnx_int8":
+            with tracing.span("export.onnx_float"):
+                float_path = str(model.export(format="onnx", device=device, imgsz=img_size))
+            with tracing.span("export.quantize"):
+                artifact = quantize_onnx_static(float_path, float_path.replace(".onnx", "_int8.onnx"), calibration_tensors)
+        else:
+            artifact = str(model.export(format=export_format, device=device, data=data_config_path, int8=int8,
+                                        imgsz=img_size))
+    return artifact, tracing.drain()
+
 
 class ModelConverter:
-    def __init__(self, model_path, device, data_config_path, output_dir="./models", img_size=(640, 640)):
+    def __init__(self, model_path, device, data_config_path, output_dir="./models", img_size=(640, 640),
+                 cache_dir=None, workers=2, calibration=None):
         """
         Initialize the ModelConverter with model path, output directory, and image size.
 
@@ -10,6 +59,10 @@ class ModelConverter:
             model_path (str): Path to the YOLO model file.
             output_dir (str): Base directory to save converted models.
             img_size (tuple): Image size for model export (width, height).
+            cache_dir (str, optional): Content-addressed export cache. Defaults to output_dir/.export_cache.
+            workers (int): Number of formats exported in parallel worker processes.
+            calibration (CalibrationSet, optional): Class-balanced calibration subset used for int8
+                exports instead of the whole val split of data_config_path.
         """
         self.model_path = model_path
         self.output_dir = output_dir
@@ -17,22 +70,139 @@ class ModelConverter:
         self.model = None
         self.device = device
         self.data_config_path = data_config_path
+        self.cache_dir = cache_dir or os.path.join(output_dir, ".export_cache")
+        self.workers = workers
+        self.manifest_path = os.path.join(output_dir, "export_manifest.json")
+        self.calibration = calibration
 
     def load_model(self):
         """Load the YOLO model from the specified path."""
         if not os.path.exists(self.model_path):
             raise FileNotFoundError(f"Model file not found: {self.model_path}")
+        from ultralytics import YOLO
+
         self.model = YOLO(self.model_path)
 
+    @property
+    def calibration_config_path(self):
+        if self.calibration is not None:
+            return self.calibration.prepare().calibration_config_path
+        return self.data_config_path
+
+    def calibration_hash(self):
+        """Hash the dataset config and the name, size and mtime of the images int8 calibration reads."""
+        if self.calibration is not None:
+            return self.calibration.prepare().key
+        digest = hashlib.sha256()
+        with open(self.data_config_path, "rb") as f:
+            digest.update(f.read())
+        for image_path, _ in split_images(self.data_config_path, "val"):
+            stat = os.stat(image_path)
+            digest.update(f"{image_path}\0{stat.st_size}\0{stat.st_mtime_ns}\n".encode())
+        return digest.hexdigest()
+
+    def cache_key(self, export_format, int8, weights_hash):
+        key = {
+            "weights": weights_hash,
+            "format": export_format,
+            "imgsz": self.img_size,
+            "int8": int8,
+            "calibration": self.calibration_hash() if int8 else None,
+        }
+        return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()[:16]
+
+    def cached_artifact(self, key):
+        entry_path = os.path.join(self.cache_dir, key, "artifact.json")
+        if not os.path.exists(entry_path):
+            return None
+        with open(entry_path) as f:
+            artifact = json.load(f)["artifact"]
+        return artifact if os.path.exists(artifact) else None
+
+    def export(self, formats):
+        """
+        Export the given formats, reusing cached artifacts and running the others in parallel.
+
+        Returns:
+            dict: format -> published artifact path.
+        """
+        if not os.path.exists(self.model_path):
+            raise FileNotFoundError(f"Model file not found: {self.model_path}")
+        with tracing.span("export.hash_weights"):
+            weights_hash = sha256_of(self.model_path)
+        jobs, artifacts, cached = {}, {}, {}
+        for export_format in formats:
+            int8 = EXPORTS[export_format][2]
+            key = self.cache_key(export_format, int8, weights_hash)
+            artifact = self.cached_artifact(key)
+            if artifact is not None:
+                print(f"{export_format} export is up to date (cache {key}), skipping.")
+                artifacts[export_format], cached[export_format] = (key, artifact), True
+            else:
+                jobs[export_format] = (key, int8)
+
+        calibration_tensors = None
+        if "onnx_int8" in jobs:
+            if self.calibration is None:
+                raise ValueError("onnx_int8 export needs a CalibrationSet")
+            with tracing.span("export.calibration_tensors"):
+                self.calibration.tensors()
+            calibration_tensors = self.calibration.tensors_path
+
+        if jobs:
+            context = multiprocessing.get_context("spawn")
+            with ProcessPoolExecutor(max_workers=min(self.workers, len(jobs)), mp_context=context) as executor:
+                futures = {
+                    export_format: executor.submit(
+                        export_worker, self.model_path, os.path.join(self.cache_dir, key, "work"), export_format,
+                        self.device, self.calibration_config_path, int8, self.img_size, calibration_tensors,
+                        tracing.enabled(),
+                    )
+                    for export_format, (key, int8) in jobs.items()
+                }
+                for export_format, future in futures.items():
+                    key = jobs[export_format][0]
+                    artifact, trace = future.result()
+                    tracing.merge(trace)
+                    with open(os.path.join(self.cache_dir, key, "artifact.json"), "w") as f:
+                        json.dump({"artifact": artifact, "weights_sha256": weights_hash}, f, indent=2)
+                    artifacts[export_format], cached[export_format] = (key, artifact), False
+
+        tracing.count("export.formats", sum(cached.values()), state="cached")
+        tracing.count("export.formats", len(cached) - sum(cached.values()), state="exported")
+        published = {}
+        for export_format, (key, artifact) in artifacts.items():
+            subdir, name, int8 = EXPORTS[export_format]
+            published_path = os.path.join(self.output_dir, subdir, name)
+            os.makedirs(os.path.dirname(published_path), exist_ok=True)
+            materialize(artifact, published_path)
+            published[export_format] = published_path
+            self.update_manifest(export_format, {
+                "path": published_path,
+                "artifact": artifact,
+                "size_bytes": os.path.getsize(artifact),
+                "cache_key": key,
+                "cached": cached[export_format],
+                "weights_sha256": weights_hash,
+                "imgsz": self.img_size,
+                "int8": int8,
+            })
+        return published
+
+    def update_manifest(self, export_format, entry):
+        manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        manifest[export_format] = entry
+        os.makedirs(self.output_dir, exist_ok=True)
+        with open(self.manifest_path, "w") as f:
+            json.dump(manifest, f, indent=2)
+
     def convert_to_tflite(self):
         """Convert the YOLO model to TFLite format with int8 quantization."""
         try:
-            if self.model is None:
-                self.load_model()
-            tflite_dir = os.path.join(self.output_dir, "tflite")
-            os.makedirs(tflite_dir, exist_ok=True)
-            output_path = os.path.join(tflite_dir, "best_model_int8.tflite")
-            self.model.export(format="tflite", device = self.device, data=self.data_config_path, int8=True, imgsz=self.img_size)
+            output_path = self.export(["tflite"])["tflite"]
             print(f"TensorFlow Lite model saved to {output_path}")
             return output_path
         except Exception as e:
@@ -42,12 +212,7 @@ class ModelConverter:
     def convert_to_onnx(self):
         """Convert the YOLO model to ONNX format."""
         try:
-            if self.model is None:
-                self.load_model()
-            onnx_dir = os.path.join(self.output_dir, "onnx")
-            os.makedirs(onnx_dir, exist_ok=True)
-            output_path = os.path.join(onnx_dir, "best_model.onnx")
-            self.model.export(format="onnx", device = self.device, data=self.data_config_path, imgsz=self.img_size)
+            output_path = self.export(["onnx"])["onnx"]
             print(f"ONNX model saved to {output_path}")
             return output_path
         except Exception as e:
@@ -55,7 +220,46 @@ class ModelConverter:
             return None
 
     def convert_all(self):
-        """Convert the YOLO model to both TFLite and ONNX formats."""
-        tflite_path = self.convert_to_tflite()
-        onnx_path = self.convert_to_onnx()
-        return {"tflite": tflite_path, "onnx": onnx_path}
\ No newline at end of file
+        """
+        Convert the YOLO model to TFLite and ONNX formats, exporting them in parallel.
+
+        With a calibration set, an int8 ONNX model is exported as well.
+        """
+        formats = ["tflite", "onnx"] + (["onnx_int8"] if self.calibration is not None else [])
+        try:
+            paths = self.export(formats)
+        except Exception as e:
+            print(f"Error during model conversion: {e}")
+            return {export_format: None for export_format in formats}
+        for export_format, output_path in paths.items():
+            print(f"{export_format} model saved to {output_path}")
+        return {export_format: paths.get(export_format) for export_format in formats}
+
+    def profile_quantization(self, output_path=None, subset_size=200):
+        """
+        Report per-class mAP deltas of the published int8 models against the float model.
+
+        The float ONNX export is the reference when it exists, the .pt model otherwise.
+        """
+        manifest = {}
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        float_model = manifest.get("onnx", {}).get("path", self.model_path)
+        int8_models = [entry["path"] for entry in manifest.values() if entry.get("int8") and os.path.exists(entry["path"])]
+        if not int8_models:
+            print("No int8 models to profile.")
+            return None
+        img_size = self.img_size if isinstance(self.img_size, int) else self.img_size[0]
+        return profile_quantization(
+            float_model,
+            int8_models,
+            self.data_config_path,
+            output_path or os.path.join(self.output_dir, "quantization_profile.json"),
+            imgsz=img_size,
+            subset_size=subset_size,
+        )
+
+    def clear_cache(self):
+        """Remove every cached export."""
+        shutil.rmtree(self.cache_dir, ignore_errors=True)
@@ -0,0 +1,338 @@
+import fnmatch
+import hashlib
+import json
+import os
+import shutil
+import subprocess
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from src import tracing
+
+CHUNK_SIZE = 1 << 20
+
+
+def config_value(config, key):
+    """Look up a dotted key such as 'training.imgsz'; missing keys are None."""
+    value = config
+    for part in key.split("."):
+        if not isinstance(value, dict):
+            return None
+        value = value.get(part)
+    return value
+
+
+class FileHasher:
+    def __init__(self, cache_path, workers=8, ignore=()):
+        """
+        md5 content hashes of files and directories, cached by (size, mtime).
+
+        A file is only read again when its size or mtime changed, so re-checking a large,
+        unchanged dataset costs one stat per file.
+
+        Args:
+            cache_path (str): JSON file the per-file hashes are kept in.
+            workers (int): Threads hashing files in parallel.
+            ignore (tuple): File name patterns left out of directory hashes, e.g. '*.cache'.
+        """
+        self.cache_path = cache_path
+        self.workers = workers
+        self.ignore = tuple(ignore)
+        self.lock = threading.Lock()
+        self.cache = {}
+        if os.path.exists(cache_path):
+            with open(cache_path) as f:
+                self.cache = json.load(f)
+
+    def file_md5(self, path):
+        stat = os.stat(path)
+        key = os.path.abspath(path)
+        with self.lock:
+            entry = self.cache.get(key)
+        if entry and entry[0] == stat.st_size and entry[1] == stat.st_mtime_ns:
+            return entry[2]
+        digest = hashlib.md5()
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+                digest.update(block)
+        with self.lock:
+            self.cache[key] = [stat.st_size, stat.st_mtime_ns, digest.hexdigest()]
+        return digest.hexdigest()
+
+    def hash(self, path):
+        """Return the md5 of a file, of a directory listing with its file hashes, or None if missing."""
+        if os.path.isfile(path):
+            return self.file_md5(path)
+        if not os.path.isdir(path):
+            return None
+        files = sorted(
+            os.path.join(root, name)
+            for root, _, names in os.walk(path)
+            for name in names
+            if not any(fnmatch.fnmatch(name, pattern) for pattern in self.ignore)
+        )
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            hashes = list(executor.map(self.file_md5, files))
+        digest = hashlib.md5()
+        for file_path, file_hash in zip(files, hashes):
+            digest.update(f"{os.path.relpath(file_path, path)}\0{file_hash}\n".encode())
+        return digest.hexdigest()
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.cache_path) or ".", exist_ok=True)
+        tmp_path = f"{self.cache_path}.tmp"
+        with self.lock, open(tmp_path, "w") as f:
+            json.dump(self.cache, f)
+        os.replace(tmp_path, self.cache_path)
+
+
+class Stage:
+    def __init__(self, name, run, deps=(), inputs=(), outputs=(), config_keys=()):
+        """
+        A pipeline step.
+
+        Args:
+            name (str): Stage name used by --from/--to.
+            run (callable): Called without arguments to execute the stage.
+            deps (tuple): Names of stages that must finish first.
+            inputs (tuple): Files or directories whose content decides whether the stage reruns.
+            outputs (tuple): Files or directories the stage produces; the stage reruns when one
+                is missing or was modified since the last run.
+            config_keys (tuple): Dotted config keys the stage depends on, e.g. 'training.epochs'.
+        """
+        self.name = name
+        self.run = run
+        self.deps = tuple(deps)
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.config_keys = tuple(config_keys)
+
+
+class Pipeline:
+    def __init__(self, config, stages, state_dir=".pipeline", report_path=None, workers=2, ignore=()):
+        """
+        Run stages as a DAG, skipping the ones whose inputs, config and outputs did not change.
+
+        Hashes of the last successful run of every stage are kept in state_dir/lock.json.
+        Outputs tracked by DVC (a '<output>.dvc' file next to them) are restored with 'dvc pull'
+        instead of being recomputed when they are missing and the stage cannot or need not run.
+
+        Args:
+            config (dict): Loaded config.yaml; stages read their config_keys from it.
+            stages (list): Stages, in any order.
+            state_dir (str): Directory of the lock file and the file hash cache.
+            report_path (str, optional): Where the timing report is written as JSON.
+            workers (int): Independent stages run at once.
+            ignore (tuple): File name patterns inside input and output directories that do not
+                affect whether a stage is up to date, e.g. caches written by a later stage.
+        """
+        self.config = config
+        self.stages = {stage.name: stage for stage in stages}
+        for stage in stages:
+            unknown = [dep for dep in stage.deps if dep not in self.stages]
+            if unknown:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stages {unknown}")
+        self.order = self.topological_order()
+        self.state_dir = state_dir
+        self.lock_path = os.path.join(state_dir, "lock.json")
+        self.report_path = report_path
+        self.workers = workers
+        self.hasher = FileHasher(os.path.join(state_dir, "hash_cache.json"), ignore=ignore)
+        self.lock_guard = threading.Lock()
+        self.lock = {}
+        if os.path.exists(self.lock_path):
+            with open(self.lock_path) as f:
+                self.lock = json.load(f)
+
+    def topological_order(self):
+        order, visiting, done = [], set(), set()
+
+        def visit(name):
+            if name in done:
+                return
+            if name in visiting:
+                raise ValueError(f"Pipeline has a cycle through stage '{name}'")
+            visiting.add(name)
+            for dep in self.stages[name].deps:
+                visit(dep)
+            visiting.discard(name)
+            done.add(name)
+            order.append(name)
+
+        for name in self.stages:
+            visit(name)
+        return order
+
+    def select(self, start=None, end=None):
+        """Return the stages from start (and everything downstream) to end (and everything upstream)."""
+        for name in (start, end):
+            if name is not None and name not in self.stages:
+                raise ValueError(f"Unknown stage '{name}', expected one of {self.order}")
+        selected = set(self.order)
+        if start is not None:
+            downstream = {start}
+            for name in self.order:
+                if any(dep in downstream for dep in self.stages[name].deps):
+                    downstream.add(name)
+            selected &= downstream
+        if end is not None:
+            upstream, pending = set(), [end]
+            while pending:
+                name = pending.pop()
+                if name not in upstream:
+                    upstream.add(name)
+                    pending.extend(self.stages[name].deps)
+            selected &= upstream
+        return [name for name in self.order if name in selected]
+
+    def input_hash(self, stage):
+        """Hash of the stage's input contents and config values; None if an input is missing."""
+        inputs = {path: self.hasher.hash(path) for path in stage.inputs}
+        if any(value is None for value in inputs.values()):
+            return None
+        config = {key: config_value(self.config, key) for key in stage.config_keys}
+        payload = json.dumps({"inputs": inputs, "config": config}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def output_hashes(self, stage):
+        return {path: self.hasher.hash(path) for path in stage.outputs}
+
+    @staticmethod
+    def dvc_file(path):
+        dvc_path = f"{os.path.normpath(path)}.dvc"
+        return dvc_path if os.path.exists(dvc_path) else None
+
+    def dvc_restore(self, stage, inputs_available):
+        """
+        Pull the missing outputs of a stage from the DVC remote.
+
+        Only done when the inputs are not available to recompute them, or when the .dvc files are
+        the ones recorded at the last run of the stage (so the remote holds what it produced).
+        """
+        missing = [path for path in stage.outputs if not os.path.exists(path)]
+        dvc_files = [self.dvc_file(path) for path in missing]
+        if not missing or None in dvc_files or shutil.which("dvc") is None:
+            return False
+        recorded = self.lock.get(stage.name, {}).get("dvc", {})
+        if inputs_available and any(recorded.get(path) != self.hasher.hash(path) for path in dvc_files):
+            return False
+        print(f"[{stage.name}] Restoring {missing} from the DVC remote...")
+        result = subprocess.run(["dvc", "pull", *dvc_files])
+        return result.returncode == 0 and all(os.path.exists(path) for path in missing)
+
+    def execute(self, name, force=False):
+        """Run one stage unless it is up to date; return its report row."""
+        stage = self.stages[name]
+        row = {"stage": name, "status": None, "hash_s": 0.0, "run_s": 0.0}
+        start = time.perf_counter()
+        input_hash = self.input_hash(stage)
+        previous = self.lock.get(name, {})
+        up_to_date = (
+            not force
+            and input_hash is not None
+            and previous.get("input_hash") == input_hash
+            and previous.get("outputs") == self.output_hashes(stage)
+        )
+        row["hash_s"] = time.perf_counter() - start
+        if up_to_date:
+            row["status"] = "skipped"
+            print(f"[{name}] Up to date, skipping.")
+            return row
+
+        start = time.perf_counter()
+        if not force and self.dvc_restore(stage, input_hash is not None):
+            row["status"] = "restored"
+        else:
+            print(f"[{name}] Running...")
+            with tracing.span(f"stage.{name}"):
+                stage.run()
+            row["status"] = "ran"
+        row["run_s"] = time.perf_counter() - start
+
+        start = time.perf_counter()
+        entry = {
+            "input_hash": self.input_hash(stage),
+            "outputs": self.output_hashes(stage),
+            "dvc": {path: self.hasher.hash(path) for path in map(self.dvc_file, stage.outputs) if path},
+            "finished_at": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        }
+        row["hash_s"] += time.perf_counter() - start
+        with self.lock_guard:
+            self.lock[name] = entry
+            self.save_lock()
+        return row
+
+    def save_lock(self):
+        os.makedirs(self.state_dir, exist_ok=True)
+        tmp_path = f"{self.lock_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(self.lock, f, indent=2)
+        os.replace(tmp_path, self.lock_path)
+        self.hasher.save()
+
+    def run(self, start=None, end=None, force=False):
+        """
+        Run the selected stages, independent ones in parallel threads.
+
+        Stages outside the selection are treated as done. When a stage fails, the stages that
+        depend on it are not started, the others still run, and the first error is raised at the end.
+
+        Args:
+            start (str, optional): First stage (--from).
+            end (str, optional): Last stage (--to).
+            force (bool): Run the selected stages even if they are up to date.
+
+        Returns:
+            list: Report rows (stage, status, hash_s, run_s, wall_s) in execution order.
+        """
+        selected = self.select(start, end)
+        pending = list(selected)
+        done, failed, report = set(self.order) - set(selected), {}, []
+        pipeline_start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            running = {}
+            while pending or running:
+                for name in list(pending):
+                    deps = self.stages[name].deps
+                    if any(dep in failed for dep in deps):
+                        pending.remove(name)
+                        failed[name] = None
+                        report.append({"stage": name, "status": "blocked", "hash_s": 0.0, "run_s": 0.0, "wall_s": 0.0})
+                    elif all(dep in done for dep in deps):
+                        pending.remove(name)
+                        running[executor.submit(self.timed, name, force)] = name
+                if not running:
+                    continue
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    name = running.pop(future)
+                    try:
+                        report.append(future.result())
+                        done.add(name)
+                    except Exception as e:
+                        print(f"[{name}] Failed: {e}")
+                        failed[name] = e
+                        report.append({"stage": name, "status": "failed", "hash_s": 0.0, "run_s": 0.0, "wall_s": 0.0,
+                                       "error": str(e)})
+        self.print_report(report, time.perf_counter() - pipeline_start)
+        errors = [error for error in failed.values() if error is not None]
+        if errors:
+            raise errors[0]
+        return report
+
+    def timed(self, name, force):
+        start = time.perf_counter()
+        row = self.execute(name, force)
+        row["wall_s"] = time.perf_counter() - start
+        return row
+
+    def print_report(self, report, total_s):
+        print("\n--- Pipeline Report ---")
+        print(f"{'stage':<14}{'status':<10}{'hash s':>9}{'run s':>10}{'wall s':>10}")
+        for row in report:
+            print(f"{row['stage']:<14}{row['status']:<10}{row['hash_s']:>9.2f}{row['run_s']:>10.2f}{row['wall_s']:>10.2f}")
+        print(f"Total wall time: {total_s:.2f}s")
+        if self.report_path:
+            os.makedirs(os.path.dirname(self.report_path) or ".", exist_ok=True)
+            with open(self.report_path, "w") as f:
+                json.dump({"stages": report, "total_s": total_s}, f, indent=2)
@@ -0,0 +1,292 @@
+import os
+import shutil
+import threading
+from src.pipeline.runner import Pipeline, Stage
+
+
+def build_pipeline(config, workers=2):
+    """
+    Create the download -> explore/process -> train -> evaluate/export -> benchmark pipeline.
+
+    Stages are only defined for the optional steps enabled in config.yaml (image cache,
+    evaluation, benchmark). Modules are imported inside the stages so a run that skips
+    training does not load the training stack.
+
+    Args:
+        config (dict): Loaded config.yaml.
+        workers (int): Independent stages run at once.
+
+    Returns:
+        Pipeline: The pipeline, run with Pipeline.run(start, end).
+    """
+    dataset_config = config["dataset"]
+    training_config = config["training"]
+    mlflow_config = config["mlflow"]
+    deployment_config = config["deployment"]
+    evaluation_config = config.get("evaluation", {})
+    calibration_config = deployment_config.get("calibration", {})
+    image_cache_config = dataset_config.get("image_cache", {})
+    raw_data_path = dataset_config["raw_data_path"]
+    annotations_dir = os.path.join(raw_data_path, "Annotations")
+    processed_data_path = dataset_config["processed_data_path"]
+    # What the process stage writes, without the image cache that may live in the same directory.
+    # Ultralytics adds labels/<split>.cache while training; the pipeline ignores *.cache files.
+    processed_outputs = [os.path.join(processed_data_path, name) for name in ("images", "labels", "manifest.json")]
+    models_dir = deployment_config["models_dir"]
+    best_model_path = os.path.join(models_dir, "best.pt")
+    trained_model_path = os.path.join(training_config["training_output_dir"], "best.pt")
+    image_cache_dir = None
+    if image_cache_config.get("enabled", False):
+        image_cache_dir = image_cache_config.get("dir", os.path.join(processed_data_path, "image_cache"))
+    dedup_config = dataset_config.get("dedup", {})
+    dedup_dir = dedup_config.get("output_dir", os.path.join(processed_data_path, "dedup"))
+    split_dir = os.path.join(dedup_dir, "ImageSets", "Main") if dedup_config.get("apply", False) else None
+    annotation_index_dir = dataset_config.get("annotation_index_dir") or os.path.join(raw_data_path, "annotation_index")
+    shared = {}
+    shared_lock = threading.Lock()
+
+    def annotation_index():
+        """The AnnotationIndex shared by all stages, loaded once even when stages run in parallel."""
+        from src.data_processing.annotation_index import AnnotationIndex
+
+        with shared_lock:
+            if "annotation_index" not in shared:
+                shared["annotation_index"] = AnnotationIndex(
+                    annotations_dir=annotations_dir,
+                    classes_names=dataset_config["classes"],
+                    cache_dir=annotation_index_dir,
+                ).load()
+            return shared["annotation_index"]
+
+    def data_processor():
+        from src.data_processing.data_processor import DataProcessor
+
+        return DataProcessor(
+            dataset_root=raw_data_path,
+            output_root=processed_data_path,
+            classes_names=dataset_config["classes"],
+            annotation_index=annotation_index(),
+            workers=dataset_config.get("conversion_workers", 1),
+            materialization=dataset_config.get("materialization", "auto"),
+            split_dir=split_dir,
+        )
+
+    def download():
+        from src.data_processing.data_downloader import DataDownloader
+
+        DataDownloader(
+            file_id=dataset_config["file_id"],
+            output_dir=config["output_dir_path"],
+            output_file=dataset_config["output_file"],
+            extract_dir=dataset_config["extract_dir"],
+            extract_folder=dataset_config["extract_folder"],
+            source=dataset_config.get("source"),
+            sha256=dataset_config.get("sha256"),
+        ).download_and_unzip()
+
+    def index():
+        annotation_index()
+
+    def dedup():
+        from src.data_processing.dedup import DuplicateDetector
+
+        DuplicateDetector(
+            dataset_root=raw_data_path,
+            output_dir=dedup_dir,
+            threshold=dedup_config.get("threshold", 5),
+            workers=dataset_config.get("conversion_workers", 1),
+            annotation_index=annotation_index(),
+        ).run()
+
+    def explore():
+        import matplotlib
+
+        # Plots are only saved, and may be drawn from a worker thread
+        matplotlib.use("Agg")
+        from src.data_exploration.data_explorer import DataExplorer
+
+        data_explorer = DataExplorer(
+            annotations_dir=annotations_dir,
+            classes_names=dataset_config["classes"],
+            output_dir=config["output_dir_path"],
+            annotation_index=annotation_index(),
+        )
+        data_explorer.plot_class_distribution()
+        data_explorer.plot_objects_per_image_distribution()
+        data_explorer.plot_image_dimensions()
+        data_explorer.save_tile_config(imgsz=training_config["imgsz"])
+
+    def process():
+        data_processor().convert_voc_to_yolo()
+
+    def image_cache():
+        data_processor().build_image_cache(imgsz=training_config["imgsz"], cache_dir=image_cache_dir)
+
+    def train():
+        from src.training.yolo_trainer import YOLOTrainer
+
+        autotune = training_config.get("autotune") or {}
+        YOLOTrainer(
+            data_config_path=dataset_config["wotr_config_path"],
+            epochs=training_config["epochs"],
+            imgsz=training_config["imgsz"],
+            batch_size=training_config["batch_size"],
+            device=training_config["device"],
+            model_name=training_config["model_name"],
+            output_dir=training_config["training_output_dir"],
+            weights_path=training_config["weights_path"],
+            mlflow_tracking_uri=mlflow_config["tracking_uri"],
+            mlflow_experiment_name=mlflow_config["experiment_name"],
+            image_cache_dir=image_cache_dir,
+            workers=training_config.get("workers"),
+            num_threads=training_config.get("num_threads"),
+            cache=training_config.get("cache"),
+            autotune=autotune if autotune.get("enabled", False) else None,
+        ).train()
+        # Publish the weights where export, evaluate and benchmark read them
+        if not os.path.exists(trained_model_path):
+            raise FileNotFoundError(f"Training did not produce {trained_model_path}")
+        os.makedirs(models_dir, exist_ok=True)
+        shutil.copy2(trained_model_path, best_model_path)
+
+    def evaluate():
+        from src.evaluation.evaluator import evaluate_yolo_model
+
+        evaluate_yolo_model(
+            model_path=best_model_path,
+            model_name=training_config["model_name"],
+            data_config_path=dataset_config["wotr_config_path"],
+            output_dir=evaluation_config.get("output_dir", os.path.join(config["output_dir_path"], "evaluation")),
+            device=evaluation_config.get("device", "cpu"),
+            imgsz=training_config["imgsz"],
+            batch_size=evaluation_config.get("batch_size", 8),
+            workers=evaluation_config.get("workers", 1),
+            cache_dir=evaluation_config.get("cache_dir"),
+        )
+
+    def export():
+        from src.models.calibration import CalibrationSet
+        from src.models.model_converter import ModelConverter
+
+        calibration = None
+        if calibration_config.get("enabled", False):
+            calibration = CalibrationSet(
+                annotation_index=annotation_index(),
+                processed_root=processed_data_path,
+                data_config_path=dataset_config["wotr_config_path"],
+                cache_dir=calibration_config.get("cache_dir", os.path.join(models_dir, ".calibration")),
+                imgsz=training_config["imgsz"],
+                size=calibration_config.get("size", 300),
+            )
+        model_converter = ModelConverter(
+            model_path=best_model_path,
+            device=training_config["device"],
+            data_config_path=dataset_config["wotr_config_path"],
+            output_dir=models_dir,
+            img_size=training_config["imgsz"],
+            cache_dir=deployment_config.get("export_cache_dir"),
+            workers=deployment_config.get("export_workers", 2),
+            calibration=calibration,
+        )
+        model_converter.convert_all()
+        if calibration is not None and calibration_config.get("profile", True):
+            model_converter.profile_quantization(subset_size=calibration_config.get("profile_subset_size", 200))
+
+    def benchmark():
+        from src.evaluation.benchmark import build_benchmark
+
+        build_benchmark(config).run()
+
+    weights_path = training_config.get("weights_path")
+    exports = [os.path.join(models_dir, "onnx", "best_model.onnx"), os.path.join(models_dir, "tflite", "best_model_int8.tflite")]
+    if calibration_config.get("enabled", False):
+        exports.append(os.path.join(models_dir, "onnx", "best_model_int8.onnx"))
+
+    stages = [
+        Stage(
+            "download", download,
+            outputs=[raw_data_path],
+            config_keys=["dataset.file_id", "dataset.source", "dataset.sha256", "dataset.output_file",
+                         "dataset.extract_dir", "dataset.extract_folder"],
+        ),
+        Stage(
+            "index", index, deps=["download"],
+            inputs=[annotations_dir],
+            outputs=[annotation_index_dir],
+            config_keys=["dataset.classes", "dataset.annotation_index_dir"],
+        ),
+        Stage(
+            "explore", explore, deps=["index"],
+            inputs=[annotations_dir],
+            outputs=[os.path.join(config["output_dir_path"], name) for name in (
+                "class_distribution.png", "objects_per_image_distribution.png",
+                "image_dimensions_distribution.png", "tile_config.json")],
+            config_keys=["dataset.classes", "training.imgsz"],
+        ),
+    ]
+    process_deps = ["index"]
+    process_inputs = [annotations_dir, os.path.join(raw_data_path, "JPEGImages"), os.path.join(raw_data_path, "ImageSets")]
+    if dedup_config.get("enabled", False):
+        stages.append(Stage(
+            "dedup", dedup, deps=["index"],
+            inputs=[os.path.join(raw_data_path, "JPEGImages"), os.path.join(raw_data_path, "ImageSets")],
+            outputs=[os.path.join(dedup_dir, "dedup_report.json"), os.path.join(dedup_dir, "ImageSets")],
+            config_keys=["dataset.dedup.threshold"],
+        ))
+        if split_dir:
+            process_deps.append("dedup")
+            process_inputs.append(split_dir)
+    stages.append(Stage(
+        "process", process, deps=process_deps,
+        inputs=process_inputs,
+        outputs=processed_outputs,
+        config_keys=["dataset.classes", "dataset.materialization", "dataset.dedup.apply"],
+    ))
+    train_deps = ["process"]
+    if image_cache_dir:
+        stages.append(Stage(
+            "image_cache", image_cache, deps=["process"],
+            inputs=processed_outputs,
+            outputs=[image_cache_dir],
+            config_keys=["training.imgsz"],
+        ))
+        train_deps.append("image_cache")
+    stages += [
+        Stage(
+            "train", train, deps=train_deps,
+            # Weights Ultralytics downloads on first use are covered by the config key only
+            inputs=[dataset_config["wotr_config_path"]] + processed_outputs
+            + ([weights_path] if weights_path and os.path.exists(weights_path) else []),
+            outputs=[trained_model_path, best_model_path],
+            config_keys=["training", "mlflow"],
+        ),
+        Stage(
+            "export", export, deps=["train"],
+            inputs=[best_model_path, dataset_config["wotr_config_path"]],
+            outputs=exports,
+            config_keys=["training.imgsz", "deployment"],
+        ),
+    ]
+    if evaluation_config.get("enabled", False):
+        stages.append(Stage(
+            "evaluate", evaluate, deps=["train"],
+            inputs=[best_model_path, dataset_config["wotr_config_path"]],
+            outputs=[evaluation_config.get("output_dir", os.path.join(config["output_dir_path"], "evaluation"))],
+            config_keys=["training.imgsz", "evaluation"],
+        ))
+    if config.get("benchmark", {}).get("enabled", False):
+        stages.append(Stage(
+            "benchmark", benchmark, deps=["export"],
+            inputs=[best_model_path] + exports,
+            outputs=[config["benchmark"].get("output_dir", os.path.join(config["output_dir_path"], "benchmark"))],
+            config_keys=["training.imgsz", "benchmark"],
+        ))
+    pipeline_config = config.get("pipeline", {})
+    return Pipeline(
+        config,
+        stages,
+        state_dir=pipeline_config.get("state_dir", ".pipeline"),
+        report_path=pipeline_config.get("report_path", os.path.join(config["output_dir_path"], "pipeline_report.json")),
+        workers=workers,
+        ignore=("*.cache",),
+    )
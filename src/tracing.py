@@ -0,0 +1,281 @@
+import json
+import os
+import re
+import threading
+import time
+from functools import wraps
+
+_tracer = None
+
+
+class NullSpan:
+    """What span() returns while tracing is disabled: entering and leaving it does nothing."""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def set(self, **args):
+        pass
+
+
+NULL_SPAN = NullSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "args", "start")
+
+    def __init__(self, tracer, name, args):
+        self.tracer = tracer
+        self.name = name
+        self.args = args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.tracer.record(self.name, self.start, time.perf_counter_ns(), self.args)
+        return False
+
+    def set(self, **args):
+        """Attach arguments known only inside the span, e.g. a batch size."""
+        self.args.update(args)
+
+
+class Tracer:
+    def __init__(self, max_events=1_000_000):
+        """
+        Collects spans and counters of this process.
+
+        Every span updates its aggregate (calls, total, min, max); the individual events for the
+        Chrome trace are kept up to max_events, after which only the aggregates grow.
+
+        Args:
+            max_events (int): Span events kept for the trace export.
+        """
+        self.max_events = max_events
+        self.lock = threading.Lock()
+        self.events = []
+        self.dropped = 0
+        self.stats = {}
+        self.counters = {}
+
+    def record(self, name, start_ns, end_ns, args, pid=None, tid=None):
+        duration = end_ns - start_ns
+        with self.lock:
+            if len(self.events) < self.max_events:
+                self.events.append((name, start_ns, duration, pid or os.getpid(), tid or threading.get_ident(),
+                                    args or None))
+            else:
+                self.dropped += 1
+            stats = self.stats.get(name)
+            if stats is None:
+                self.stats[name] = [1, duration, duration, duration]
+            else:
+                stats[0] += 1
+                stats[1] += duration
+                stats[2] = min(stats[2], duration)
+                stats[3] = max(stats[3], duration)
+
+    def count(self, name, value, labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+
+def enable(max_events=1_000_000):
+    """Start collecting spans and counters in this process."""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(max_events)
+    return _tracer
+
+
+def disable():
+    global _tracer
+    _tracer = None
+
+
+def enabled():
+    return _tracer is not None
+
+
+def span(name, **args):
+    """
+    Time a block: 'with tracing.span("process.convert", images=n): ...'.
+
+    While tracing is disabled this returns a shared no-op object, so a disabled span costs one
+    function call and a global lookup.
+    """
+    if _tracer is None:
+        return NULL_SPAN
+    return Span(_tracer, name, args)
+
+
+def count(name, value=1, **labels):
+    """Add value to a counter, e.g. tracing.count("download.bytes", len(chunk))."""
+    if _tracer is not None:
+        _tracer.count(name, value, labels)
+
+
+def traced(name=None):
+    """Decorator timing every call of a function as a span."""
+
+    def decorator(function):
+        span_name = name or function.__qualname__
+
+        @wraps(function)
+        def wrapper(*args, **kwargs):
+            if _tracer is None:
+                return function(*args, **kwargs)
+            with Span(_tracer, span_name, {}):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def start_worker(trace):
+    """
+    Set up tracing at the start of a worker process task.
+
+    A fresh tracer when the parent traces (a forked worker would otherwise inherit and send back
+    the parent's events), none otherwise. The worker returns drain() to the parent, which merges it.
+    """
+    disable()
+    if trace:
+        enable()
+
+
+def drain():
+    """
+    Return and clear what this process collected, for a worker process to hand back to its parent.
+
+    Returns:
+        dict or None: Picklable events and counters, None while tracing is disabled.
+    """
+    if _tracer is None:
+        return None
+    with _tracer.lock:
+        data = {"events": _tracer.events, "counters": _tracer.counters}
+        _tracer.events, _tracer.counters, _tracer.stats = [], {}, {}
+    return data
+
+
+def merge(data):
+    """Add the drained events and counters of a worker process to this process' tracer."""
+    if _tracer is None or not data:
+        return
+    for name, start_ns, duration, pid, tid, args in data["events"]:
+        _tracer.record(name, start_ns, start_ns + duration, args, pid, tid)
+    for (name, labels), value in data["counters"].items():
+        _tracer.count(name, value, dict(labels))
+
+
+def summary():
+    """Aggregates: per span calls and total/mean/min/max seconds, and every counter."""
+    if _tracer is None:
+        return {"spans": {}, "counters": {}}
+    with _tracer.lock:
+        spans = {
+            name: {
+                "calls": calls,
+                "total_s": total / 1e9,
+                "mean_s": total / calls / 1e9,
+                "min_s": low / 1e9,
+                "max_s": high / 1e9,
+            }
+            for name, (calls, total, low, high) in sorted(_tracer.stats.items())
+        }
+        counters = {
+            name + ("{" + ",".join(f"{k}={v}" for k, v in labels) + "}" if labels else ""): value
+            for (name, labels), value in sorted(_tracer.counters.items())
+        }
+    return {"spans": spans, "counters": counters, "dropped_events": _tracer.dropped}
+
+
+def chrome_trace():
+    """Spans as Chrome trace events, viewable in chrome://tracing or Perfetto."""
+    if _tracer is None:
+        return {"traceEvents": []}
+    with _tracer.lock:
+        events = list(_tracer.events)
+    trace_events = [
+        {"name": name, "cat": name.split(".", 1)[0], "ph": "X", "ts": start_ns / 1000, "dur": duration / 1000,
+         "pid": pid, "tid": tid, **({"args": args} if args else {})}
+        for name, start_ns, duration, pid, tid, args in events
+    ]
+    return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+
+def metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+def prometheus_text(namespace="wotr"):
+    """Aggregates in the Prometheus text exposition format."""
+    data = summary()
+    lines = [
+        f"# HELP {namespace}_span_seconds_total Time spent in each span.",
+        f"# TYPE {namespace}_span_seconds_total counter",
+    ]
+    lines += [f'{namespace}_span_seconds_total{{span="{name}"}} {stats["total_s"]:.9f}'
+              for name, stats in data["spans"].items()]
+    lines += [f"# HELP {namespace}_span_calls_total Calls of each span.", f"# TYPE {namespace}_span_calls_total counter"]
+    lines += [f'{namespace}_span_calls_total{{span="{name}"}} {stats["calls"]}' for name, stats in data["spans"].items()]
+    lines += [f"# HELP {namespace}_span_max_seconds Longest call of each span.", f"# TYPE {namespace}_span_max_seconds gauge"]
+    lines += [f'{namespace}_span_max_seconds{{span="{name}"}} {stats["max_s"]:.9f}' for name, stats in data["spans"].items()]
+    if _tracer is not None:
+        with _tracer.lock:
+            counters = sorted(_tracer.counters.items())
+        declared = set()
+        for (name, labels), value in counters:
+            metric = f"{namespace}_{metric_name(name)}_total"
+            if metric not in declared:
+                declared.add(metric)
+                lines.append(f"# TYPE {metric} counter")
+            label_text = ",".join(f'{metric_name(k)}="{v}"' for k, v in labels)
+            lines.append(f"{metric}{{{label_text}}} {value}" if label_text else f"{metric} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def export(output_dir):
+    """
+    Write trace.json (Chrome trace events), metrics.prom (Prometheus text) and summary.json.
+
+    Returns:
+        dict: The summary.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    with open(os.path.join(output_dir, "trace.json"), "w") as f:
+        json.dump(chrome_trace(), f)
+    with open(os.path.join(output_dir, "metrics.prom"), "w") as f:
+        f.write(prometheus_text())
+    data = summary()
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump(data, f, indent=2)
+    print(f"Trace of {sum(s['calls'] for s in data['spans'].values())} spans written to {output_dir}")
+    return data
+
+
+def log_to_mlflow(artifact_path="trace"):
+    """Attach the aggregates to the active MLflow run: span totals as metrics, summary and exports as artifacts."""
+    if _tracer is None:
+        return
+    import mlflow
+
+    data = summary()
+    metrics = {f"trace/{name}_s": stats["total_s"] for name, stats in data["spans"].items()}
+    metrics.update({f"trace/{metric_name(name)}": value for name, value in data["counters"].items()})
+    if metrics:
+        mlflow.log_metrics(metrics)
+    mlflow.log_dict(data, f"{artifact_path}/summary.json")
+    mlflow.log_text(prometheus_text(), f"{artifact_path}/metrics.prom")
+    mlflow.log_dict(chrome_trace(), f"{artifact_path}/trace.json")
@@ -0,0 +1,188 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from src.training.training_monitor import without_mlflow
+from src.utils import peak_rss_mb, tree_rss_mb
+
+
+class ProbeFinished(Exception):
+    """Raised from a batch callback to stop a probe once enough steps are timed."""
+
+
+class MemorySampler:
+    def __init__(self, interval=0.1):
+        """
+        Track the peak summed RSS of this process and its live children from a background thread,
+        so sampling stays out of the timed training steps.
+
+        Args:
+            interval (float): Seconds between samples.
+        """
+        self.interval = interval
+        self.peak_mb = 0.0
+        self.error = None
+        self.stop_event = threading.Event()
+        self.thread = threading.Thread(target=self.run, name="memory-sampler", daemon=True)
+
+    def run(self):
+        while True:
+            try:
+                self.peak_mb = max(self.peak_mb, tree_rss_mb())
+            except Exception as e:
+                self.error = e
+                return
+            if self.stop_event.wait(self.interval):
+                return
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self.stop_event.set()
+        self.thread.join()
+        return False
+
+
+def probe_training(weights_path, data_config_path, imgsz, batch, workers, threads, cache, image_cache_dir, project,
+                   steps=20, warmup_steps=5):
+    """
+    Time a few real training steps of one configuration; runs in a fresh spawned process.
+
+    The full Ultralytics loop runs (dataloader, forward, backward, optimizer step) and is stopped
+    after warmup_steps + steps batches.
+
+    Returns:
+        dict: The configuration with images_per_s and peak_mb: the largest summed RSS of the probe
+        process and its live dataloader workers, sampled by a background thread (shared pages are
+        counted once per worker, so an upper bound).
+    """
+    import torch
+    from ultralytics import YOLO
+    from src.training.cached_dataset import cached_trainer
+
+    if threads:
+        torch.set_num_threads(threads)
+    timestamps = []
+
+    def on_train_batch_end(trainer):
+        timestamps.append(time.perf_counter())
+        if len(timestamps) > warmup_steps + steps:
+            raise ProbeFinished()
+
+    model = YOLO(weights_path)
+    model.add_callback("on_pretrain_routine_start", without_mlflow)
+    model.add_callback("on_train_batch_end", on_train_batch_end)
+    sampler = MemorySampler()
+    try:
+        with sampler:
+            model.train(
+                data=data_config_path,
+                epochs=1,
+                imgsz=imgsz,
+                batch=batch,
+                workers=workers,
+                device="cpu",
+                cache=cache if cache in ("ram", "disk") else False,
+                project=project,
+                name="probe",
+                exist_ok=True,
+                val=False,
+                plots=False,
+                verbose=False,
+                trainer=cached_trainer(image_cache_dir) if cache == "mmap" else None,
+            )
+    except ProbeFinished:
+        pass
+    measured = timestamps[warmup_steps:]
+    if len(measured) < 2:
+        raise RuntimeError(f"Probe ran only {len(timestamps)} batches, the train split is too small for {steps} steps")
+    if sampler.error is not None:
+        print(f"Could not measure dataloader worker memory ({sampler.error}), peak_mb covers the probe process only.")
+    peak_mb = max(sampler.peak_mb, peak_rss_mb())
+    return {
+        "batch": batch,
+        "workers": workers,
+        "threads": threads or torch.get_num_threads(),
+        "cache": cache or "none",
+        "images_per_s": round(batch * (len(measured) - 1) / (measured[-1] - measured[0]), 2),
+        "peak_mb": round(peak_mb, 1),
+    }
+
+
+class TrainingAutotuner:
+    def __init__(self, weights_path, data_config_path, imgsz, output_dir, image_cache_dir=None, steps=20,
+                 warmup_steps=5):
+        """
+        Initialize the TrainingAutotuner.
+
+        Args:
+            weights_path (str): Weights the probes train from.
+            data_config_path (str): Dataset YAML.
+            imgsz (int): Training image size.
+            output_dir (str): Scratch directory of the probe runs.
+            image_cache_dir (str, optional): Memory-mapped image cache; enables the 'mmap' cache mode.
+            steps (int): Timed batches per probe.
+            warmup_steps (int): Batches run before timing starts.
+        """
+        self.weights_path = weights_path
+        self.data_config_path = data_config_path
+        self.imgsz = imgsz
+        self.output_dir = output_dir
+        self.image_cache_dir = image_cache_dir
+        self.steps = steps
+        self.warmup_steps = warmup_steps
+        self.table = []
+
+    def probe(self, batch, workers, threads, cache):
+        for row in self.table:
+            if (row["batch"], row["workers"], row["requested_threads"], row["cache"]) == (batch, workers, threads, cache or "none"):
+                return row
+        print(f"Probing batch={batch} workers={workers} threads={threads} cache={cache}...")
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+            try:
+                row = executor.submit(
+                    probe_training, self.weights_path, self.data_config_path, self.imgsz, batch, workers, threads,
+                    cache, self.image_cache_dir, os.path.abspath(self.output_dir), self.steps, self.warmup_steps,
+                ).result()
+            except Exception as e:
+                print(f"Probe failed: {e}")
+                row = {"batch": batch, "workers": workers, "threads": threads, "cache": cache or "none",
+                       "images_per_s": 0.0, "peak_mb": None, "error": str(e)}
+        row["requested_threads"] = threads
+        self.table.append(row)
+        print(f"  {row['images_per_s']} images/s, peak {row['peak_mb']} MB")
+        return row
+
+    def tune(self, batch_sizes, workers, threads, caches, memory_budget_mb=None):
+        """
+        Pick the fastest configuration that fits in the memory budget.
+
+        The knobs are tuned one at a time (threads, workers, batch size, then cache mode), each
+        sweep starting from the best configuration so far, so the number of probes is the sum
+        of the option counts rather than their product.
+
+        Returns:
+            tuple: (best probe row, list of all probe rows).
+        """
+        caches = [c for c in caches if c != "mmap" or self.image_cache_dir]
+        best = {"batch": batch_sizes[0], "workers": workers[0], "threads": threads[0], "cache": caches[0]}
+
+        def fits(row):
+            return "error" not in row and (memory_budget_mb is None or row["peak_mb"] <= memory_budget_mb)
+
+        for knob, options in (("threads", threads), ("workers", workers), ("batch", batch_sizes), ("cache", caches)):
+            rows = []
+            for option in options:
+                config = dict(best, **{knob: option})
+                rows.append((config, self.probe(config["batch"], config["workers"], config["threads"], config["cache"])))
+            candidates = [(config, row) for config, row in rows if fits(row)]
+            if candidates:
+                best = max(candidates, key=lambda item: item[1]["images_per_s"])[0]
+        best_row = self.probe(best["batch"], best["workers"], best["threads"], best["cache"])
+        if not fits(best_row):
+            raise RuntimeError(f"No probed configuration fits in the memory budget of {memory_budget_mb} MB")
+        return best_row, self.table
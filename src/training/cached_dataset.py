@@ -0,0 +1,102 @@
+import os
+import cv2
+from ultralytics.data.dataset import YOLODataset
+from ultralytics.data.utils import img2label_paths
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+from src.data_processing.image_cache import ImageCache
+
+
+class CachedYOLODataset(YOLODataset):
+    def __init__(self, *args, image_cache=None, **kwargs):
+        """
+        YOLODataset that reads pre-resized images and packed labels from an ImageCache.
+
+        Images missing from the cache are decoded from disk as usual.
+
+        Args:
+            image_cache (ImageCache): Loaded cache of the split.
+        """
+        self.image_cache = image_cache
+        self.rows = None
+        super().__init__(*args, **kwargs)
+
+    def get_labels(self):
+        """Build the label dicts from the packed labels instead of scanning the label files."""
+        self.label_files = img2label_paths(self.im_files)
+        self.rows = [self.image_cache.row(im_file) for im_file in self.im_files]
+        if any(row is None for row in self.rows):
+            missing = sum(row is None for row in self.rows)
+            print(f"{missing} images are not in the image cache, reading labels from disk.")
+            self.rows = [None] * len(self.im_files)
+            return super().get_labels()
+        original_shapes = self.image_cache.index["original_shapes"]
+        labels = []
+        for im_file, row in zip(self.im_files, self.rows):
+            packed = self.image_cache.labels(row)
+            labels.append({
+                "im_file": im_file,
+                "shape": tuple(int(v) for v in original_shapes[row]),
+                "cls": packed[:, 0:1].copy(),
+                "bboxes": packed[:, 1:].copy(),
+                "segments": [],
+                "keypoints": None,
+                "normalized": True,
+                "bbox_format": "xywh",
+            })
+        print(f"Loaded {len(labels)} labels from the image cache {self.image_cache.images_path}")
+        return labels
+
+    def load_image(self, i, rect_mode=True):
+        """Return (image, (h0, w0), (h, w)) from the shard; a copy, since augmentations write in place."""
+        row = self.rows[i] if self.rows is not None else None
+        if row is None:
+            return super().load_image(i, rect_mode)
+        image, original_shape, resized_shape = self.image_cache.image(row)
+        image = image.copy()
+        if not rect_mode:
+            image = cv2.resize(image, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+            resized_shape = image.shape[:2]
+        if self.augment:
+            # Mosaic draws its extra images from this buffer
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                self.buffer.pop(0)
+        return image, original_shape, resized_shape
+
+
+class CachedDetectionTrainer(DetectionTrainer):
+    image_cache_dir = None
+
+    def build_dataset(self, img_path, mode="train", batch=None):
+        """Use the ImageCache of the split when one was built for the training imgsz."""
+        split = os.path.basename(os.path.normpath(img_path))
+        image_cache = ImageCache(self.image_cache_dir, split, self.args.imgsz).load() if self.image_cache_dir else None
+        if image_cache is None:
+            print(f"No image cache for '{split}' at imgsz {self.args.imgsz}, decoding images from disk.")
+            return super().build_dataset(img_path, mode, batch)
+        model = getattr(self.model, "module", self.model)
+        stride = max(int(model.stride.max() if model else 0), 32)
+        return CachedYOLODataset(
+            img_path=img_path,
+            imgsz=self.args.imgsz,
+            batch_size=batch,
+            augment=mode == "train",
+            hyp=self.args,
+            rect=self.args.rect or mode == "val",
+            cache=False,
+            single_cls=self.args.single_cls or False,
+            stride=stride,
+            pad=0.0 if mode == "train" else 0.5,
+            prefix=colorstr(f"{mode}: "),
+            task=self.args.task,
+            classes=self.args.classes,
+            data=self.data,
+            fraction=self.args.fraction if mode == "train" else 1.0,
+            image_cache=image_cache,
+        )
+
+
+def cached_trainer(image_cache_dir):
+    """Return a DetectionTrainer class reading images from image_cache_dir, for YOLO.train(trainer=...)."""
+    return type("CachedDetectionTrainer", (CachedDetectionTrainer,), {"image_cache_dir": image_cache_dir})
@@ -0,0 +1,96 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+from mlflow.entities import Metric
+from mlflow.tracking import MlflowClient
+from src.utils import sha256_of
+
+
+class AsyncMlflowLogger:
+    def __init__(self, run_id, uploaded=None, on_upload=None, max_queue_size=1000):
+        """
+        Log metrics and checkpoints to an MLflow run from a background thread.
+
+        The training loop only snapshots changed checkpoints and enqueues; hashing and uploads
+        happen on the thread. Checkpoints whose content hash was already uploaded to the run are skipped.
+
+        Args:
+            run_id (str): MLflow run to log to.
+            uploaded (dict, optional): sha256 -> artifact path of checkpoints already uploaded,
+                e.g. restored from the state of an interrupted run.
+            on_upload (callable, optional): Called with the uploaded dict after every upload.
+            max_queue_size (int): Pending items before log calls block.
+        """
+        self.run_id = run_id
+        self.client = MlflowClient()
+        self.uploaded = dict(uploaded or {})
+        self.on_upload = on_upload
+        self.staging_dir = tempfile.mkdtemp(prefix="mlflow_checkpoints_")
+        self.queue = queue.Queue(maxsize=max_queue_size)
+        self.sequence = 0
+        self.snapshotted = {}
+        self.thread = threading.Thread(target=self.worker, name="mlflow-logger", daemon=True)
+        self.thread.start()
+
+    def log_metrics(self, metrics, step):
+        self.queue.put(("metrics", metrics, step, int(time.time() * 1000)))
+
+    def log_checkpoint(self, path, artifact_path="checkpoints"):
+        """
+        Snapshot a checkpoint and queue its upload.
+
+        The copy is needed because Ultralytics rewrites last.pt in place every epoch, so it runs
+        in the caller (the training thread) before the file can change again. A file whose size and mtime did not change since its last snapshot (best.pt in an epoch
+        that did not improve) is skipped.
+        """
+        stat = os.stat(path)
+        if self.snapshotted.get(path) == (stat.st_size, stat.st_mtime_ns):
+            return
+        self.snapshotted[path] = (stat.st_size, stat.st_mtime_ns)
+        self.sequence += 1
+        snapshot_dir = os.path.join(self.staging_dir, str(self.sequence))
+        os.makedirs(snapshot_dir)
+        snapshot = os.path.join(snapshot_dir, os.path.basename(path))
+        shutil.copyfile(path, snapshot)
+        self.queue.put(("checkpoint", snapshot, artifact_path))
+
+    def worker(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if item[0] == "metrics":
+                    self.write_metrics(*item[1:])
+                else:
+                    self.upload(*item[1:])
+            except Exception as e:
+                print(f"MLflow logging failed: {e}")
+            finally:
+                self.queue.task_done()
+
+    def write_metrics(self, metrics, step, timestamp):
+        self.client.log_batch(self.run_id, metrics=[
+            Metric(key, float(value), timestamp, step) for key, value in metrics.items()
+        ])
+
+    def upload(self, snapshot, artifact_path):
+        try:
+            sha256 = sha256_of(snapshot)
+            if sha256 in self.uploaded:
+                return
+            self.client.log_artifact(self.run_id, snapshot, artifact_path)
+            self.uploaded[sha256] = f"{artifact_path}/{os.path.basename(snapshot)}"
+            if self.on_upload is not None:
+                self.on_upload(dict(self.uploaded))
+        finally:
+            shutil.rmtree(os.path.dirname(snapshot), ignore_errors=True)
+
+    def close(self):
+        """Flush everything queued and stop the thread."""
+        self.queue.put(None)
+        self.thread.join()
+        shutil.rmtree(self.staging_dir, ignore_errors=True)
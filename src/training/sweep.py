@@ -0,0 +1,312 @@
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import queue
+import random
+import time
+import numpy as np
+import yaml
+
+METRIC = "metrics/mAP50-95(B)"
+TRAINER_PARAMS = ("imgsz", "epochs", "batch_size", "weights_path", "workers", "cache")
+
+
+class ASHA:
+    def __init__(self, max_epochs, min_epochs=1, reduction_factor=3):
+        """
+        Asynchronous successive halving on per-epoch validation mAP.
+
+        Rungs sit at min_epochs * reduction_factor**k epochs. A trial reaching a rung is stopped
+        when its score is below the (1 - 1/reduction_factor) quantile of all scores recorded at
+        that rung so far, so roughly one trial in reduction_factor continues to the next rung.
+
+        Args:
+            max_epochs (int): Epochs of a trial that is never stopped.
+            min_epochs (int): First rung.
+            reduction_factor (int): Fraction of trials promoted at every rung is 1 / reduction_factor.
+        """
+        self.reduction_factor = reduction_factor
+        self.rungs = []
+        rung = min_epochs
+        while rung < max_epochs:
+            self.rungs.append(rung)
+            rung *= reduction_factor
+        self.recorded = {rung: [] for rung in self.rungs}
+
+    def report(self, epoch, score):
+        """Record a score after epoch (1-based); return False if the trial should stop."""
+        if epoch not in self.recorded:
+            return True
+        scores = self.recorded[epoch]
+        scores.append(score)
+        cutoff = np.percentile(scores, (1 - 1 / self.reduction_factor) * 100)
+        return bool(score >= cutoff)
+
+
+def sample_space(space, n_trials=None, seed=0):
+    """
+    Expand a search space into trial parameter sets.
+
+    Each entry is a list of choices or a {low, high, log} range. Without n_trials and with only
+    lists, the full grid is returned; otherwise n_trials random samples.
+    """
+    rng = random.Random(seed)
+    if n_trials is None and all(isinstance(values, list) for values in space.values()):
+        keys = list(space)
+        return [dict(zip(keys, combination)) for combination in itertools.product(*(space[k] for k in keys))]
+
+    def draw(values):
+        if isinstance(values, list):
+            return rng.choice(values)
+        low, high = float(values["low"]), float(values["high"])
+        if values.get("log"):
+            return float(np.exp(rng.uniform(np.log(low), np.log(high))))
+        return rng.uniform(low, high)
+
+    return [{name: draw(values) for name, values in space.items()} for _ in range(n_trials or 1)]
+
+
+def run_trial(trial_id, params, trainer_kwargs, cpus, parent_run_id, reports, decisions):
+    """
+    Train one trial in its own process, pinned to its CPU set.
+
+    After every epoch the val mAP is sent to the orchestrator, which answers whether to go on.
+    """
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+    from src.training.yolo_trainer import YOLOTrainer
+
+    best = {"score": 0.0}
+
+    def on_fit_epoch_end(trainer):
+        score = float((trainer.metrics or {}).get(METRIC, 0.0))
+        best["score"] = max(best["score"], score)
+        reports.put(("epoch", trial_id, trainer.epoch + 1, score))
+        if not decisions.get():
+            print(f"Trial {trial_id} stopped by ASHA after epoch {trainer.epoch + 1}")
+            trainer.stop = True
+
+    kwargs = dict(trainer_kwargs)
+    kwargs.update({name: value for name, value in params.items() if name in TRAINER_PARAMS})
+    kwargs["extra_args"] = {name: value for name, value in params.items() if name not in TRAINER_PARAMS}
+    kwargs["model_name"] = f"{trainer_kwargs['model_name']}-trial{trial_id}"
+    kwargs["output_dir"] = os.path.join(trainer_kwargs["output_dir"], f"trial{trial_id}")
+    kwargs["num_threads"] = len(cpus) if cpus else None
+    kwargs["parent_run_id"] = parent_run_id
+    kwargs["callbacks"] = {"on_fit_epoch_end": on_fit_epoch_end}
+    try:
+        YOLOTrainer(**kwargs).train()
+        reports.put(("done", trial_id, best["score"], None))
+    except Exception as e:
+        reports.put(("done", trial_id, best["score"], str(e)))
+
+
+class Sweep:
+    def __init__(self, trainer_kwargs, space, output_dir, n_trials=None, max_parallel=2, cpus_per_trial=None,
+                 min_epochs=1, reduction_factor=3, seed=0, data_processor=None):
+        """
+        Initialize the Sweep.
+
+        Args:
+            trainer_kwargs (dict): YOLOTrainer arguments shared by every trial; 'epochs' is the
+                maximum number of epochs of a trial.
+            space (dict): Search space, see sample_space. YOLOTrainer arguments (imgsz, epochs,
+                batch_size, weights_path, workers, cache) are set on the trainer, anything else
+                is passed to Ultralytics as a train argument.
+            output_dir (str): Where sweep_results.json is written.
+            n_trials (int, optional): Random trials to sample; the full grid if None.
+            max_parallel (int): Trials running at once.
+            cpus_per_trial (int, optional): CPUs pinned to each trial; defaults to an even split.
+            min_epochs (int): First ASHA rung.
+            reduction_factor (int): ASHA reduction factor.
+            seed (int): Sampling seed.
+            data_processor (DataProcessor, optional): Builds the shared image cache of every
+                imgsz in the space before trials start.
+        """
+        self.trainer_kwargs = trainer_kwargs
+        self.space = space
+        self.output_dir = output_dir
+        self.trials = sample_space(space, n_trials, seed)
+        self.max_parallel = max(1, min(max_parallel, len(self.trials)))
+        available = sorted(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else list(range(os.cpu_count() or 1))
+        per_trial = cpus_per_trial or max(1, len(available) // self.max_parallel)
+        self.cpu_sets = [available[i * per_trial:(i + 1) * per_trial] for i in range(self.max_parallel)]
+        self.cpu_sets = [cpus or available for cpus in self.cpu_sets]
+        self.asha = ASHA(trainer_kwargs["epochs"], min_epochs, reduction_factor)
+        self.data_processor = data_processor
+        self.results = {}
+
+    def prepare_data(self):
+        """Build the image cache once per imgsz so all trials read the same preprocessed shards."""
+        if self.data_processor is None or not self.trainer_kwargs.get("image_cache_dir"):
+            return
+        for imgsz in sorted({trial.get("imgsz", self.trainer_kwargs["imgsz"]) for trial in self.trials}):
+            self.data_processor.build_image_cache(imgsz=imgsz, cache_dir=self.trainer_kwargs["image_cache_dir"])
+
+    def run(self):
+        """
+        Run every trial, at most max_parallel at a time, and stop poor ones early.
+
+        Returns:
+            list: Trial results sorted by best val mAP50-95.
+        """
+        import mlflow
+
+        self.prepare_data()
+        mlflow.set_tracking_uri(self.trainer_kwargs["mlflow_tracking_uri"])
+        mlflow.set_experiment(self.trainer_kwargs["mlflow_experiment_name"])
+        context = multiprocessing.get_context("spawn")
+        reports = context.Queue()
+        with mlflow.start_run(run_name=f"{self.trainer_kwargs['model_name']}-sweep") as parent:
+            mlflow.log_dict({"space": self.space, "trials": self.trials}, "sweep/space.json")
+            mlflow.log_params({"trials": len(self.trials), "max_parallel": self.max_parallel,
+                               "asha_rungs": str(self.asha.rungs), "asha_reduction_factor": self.asha.reduction_factor})
+            pending = list(enumerate(self.trials))
+            running = {}
+            free_slots = list(range(self.max_parallel))
+            start = time.perf_counter()
+            while pending or running:
+                while pending and free_slots:
+                    trial_id, params = pending.pop(0)
+                    slot = free_slots.pop(0)
+                    decisions = context.Queue()
+                    process = context.Process(
+                        target=run_trial,
+                        args=(trial_id, params, self.trainer_kwargs, self.cpu_sets[slot], parent.info.run_id, reports,
+                              decisions),
+                    )
+                    process.start()
+                    running[trial_id] = (process, slot, decisions)
+                    self.results[trial_id] = {"trial": trial_id, "params": params, "cpus": self.cpu_sets[slot],
+                                              "epochs": 0, "score": 0.0, "status": "running"}
+                    print(f"Started trial {trial_id} on CPUs {self.cpu_sets[slot]}: {params}")
+                try:
+                    self.handle(reports.get(timeout=5), running, free_slots)
+                except queue.Empty:
+                    # A trial may exit right after its last report: read what is queued before reaping
+                    while True:
+                        try:
+                            self.handle(reports.get_nowait(), running, free_slots)
+                        except queue.Empty:
+                            break
+                    for trial_id, (process, slot, _) in list(running.items()):
+                        if not process.is_alive():
+                            self.finish(trial_id, running, free_slots, f"process exited with code {process.exitcode}")
+
+            ranked = sorted(self.results.values(), key=lambda result: result["score"], reverse=True)
+            os.makedirs(self.output_dir, exist_ok=True)
+            with open(os.path.join(self.output_dir, "sweep_results.json"), "w") as f:
+                json.dump(ranked, f, indent=2)
+            mlflow.log_dict({"results": ranked}, "sweep/results.json")
+            if ranked:
+                mlflow.log_metric("best_map50_95", ranked[0]["score"])
+                mlflow.log_dict(ranked[0]["params"], "sweep/best_params.json")
+            print(f"Sweep of {len(ranked)} trials finished in {time.perf_counter() - start:.0f}s; "
+                  f"best: trial {ranked[0]['trial']} mAP50-95 {ranked[0]['score']:.4f} {ranked[0]['params']}")
+        return ranked
+
+    def handle(self, message, running, free_slots):
+        """Apply an "epoch" or "done" report of a trial."""
+        kind, trial_id, *payload = message
+        result = self.results[trial_id]
+        if kind == "epoch":
+            if trial_id not in running:
+                # Late report of a trial that was already reaped
+                return
+            epoch, score = payload
+            result["epochs"], result["score"] = epoch, max(result["score"], score)
+            keep_going = self.asha.report(epoch, score)
+            if not keep_going:
+                result["status"] = "stopped"
+            running[trial_id][2].put(keep_going)
+            return
+        score, error = payload
+        result["score"] = max(result["score"], score)
+        if trial_id in running:
+            self.finish(trial_id, running, free_slots, error)
+        elif not error and "error" in result:
+            # The trial finished cleanly but was reaped before its report was read
+            del result["error"]
+            if result["status"] == "failed":
+                result["status"] = "completed"
+
+    def finish(self, trial_id, running, free_slots, error=None):
+        process, slot, _ = running.pop(trial_id)
+        process.join()
+        free_slots.append(slot)
+        result = self.results[trial_id]
+        if error:
+            result["error"] = error
+            if result["status"] == "running":
+                result["status"] = "failed"
+            print(f"Trial {trial_id} failed: {error}")
+        elif result["status"] == "running":
+            result["status"] = "completed"
+
+
+def build_sweep(config):
+    """Create a Sweep from the 'sweep' section of config.yaml."""
+    from src.data_processing.annotation_index import AnnotationIndex
+    from src.data_processing.data_processor import DataProcessor
+
+    dataset_config = config["dataset"]
+    training_config = config["training"]
+    sweep_config = config["sweep"]
+    image_cache_config = dataset_config.get("image_cache", {})
+    image_cache_dir = None
+    data_processor = None
+    if image_cache_config.get("enabled", False):
+        image_cache_dir = image_cache_config.get("dir", os.path.join(dataset_config["processed_data_path"], "image_cache"))
+        data_processor = DataProcessor(
+            dataset_root=dataset_config["raw_data_path"],
+            output_root=dataset_config["processed_data_path"],
+            classes_names=dataset_config["classes"],
+            annotation_index=AnnotationIndex(
+                os.path.join(dataset_config["raw_data_path"], "Annotations"),
+                dataset_config["classes"],
+                cache_dir=dataset_config.get("annotation_index_dir"),
+            ),
+            workers=dataset_config.get("conversion_workers", 1),
+            materialization=dataset_config.get("materialization", "auto"),
+        )
+    trainer_kwargs = {
+        "data_config_path": dataset_config["wotr_config_path"],
+        "epochs": sweep_config.get("max_epochs", training_config["epochs"]),
+        "imgsz": training_config["imgsz"],
+        "batch_size": training_config["batch_size"],
+        "device": "cpu",
+        "model_name": training_config["model_name"],
+        "output_dir": os.path.join(sweep_config.get("output_dir", "outputs/sweep"), "runs"),
+        "weights_path": training_config["weights_path"],
+        "mlflow_tracking_uri": config["mlflow"]["tracking_uri"],
+        "mlflow_experiment_name": config["mlflow"]["experiment_name"],
+        "image_cache_dir": image_cache_dir,
+        "workers": sweep_config.get("workers_per_trial", 2),
+    }
+    return Sweep(
+        trainer_kwargs,
+        sweep_config["space"],
+        sweep_config.get("output_dir", "outputs/sweep"),
+        n_trials=sweep_config.get("n_trials"),
+        max_parallel=sweep_config.get("max_parallel", 2),
+        cpus_per_trial=sweep_config.get("cpus_per_trial"),
+        min_epochs=sweep_config.get("min_epochs", 1),
+        reduction_factor=sweep_config.get("reduction_factor", 3),
+        seed=sweep_config.get("seed", 0),
+        data_processor=data_processor,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep with parallel trials and ASHA early stopping")
+    parser.add_argument("--config", default="config/config.yaml")
+    args = parser.parse_args()
+    with open(args.config) as f:
+        config = yaml.safe_load(f)
+    build_sweep(config).run()
+
+
+if __name__ == "__main__":
+    main()
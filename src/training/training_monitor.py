@@ -0,0 +1,77 @@
+import os
+import time
+
+
+def without_mlflow(trainer):
+    """Drop the Ultralytics MLflow integration; runs are logged by the caller instead."""
+    for event, callbacks in trainer.callbacks.items():
+        trainer.callbacks[event] = [c for c in callbacks if "mlflow" not in getattr(c, "__module__", "")]
+
+
+def sanitize_metrics(metrics):
+    """MLflow keys cannot contain parentheses, e.g. 'metrics/mAP50(B)'."""
+    return {key.replace("(", "").replace(")", ""): float(value) for key, value in metrics.items()}
+
+
+class TrainingMonitor:
+    def __init__(self, logger, upload_checkpoints=True):
+        """
+        Ultralytics callbacks that time every epoch and hand metrics and checkpoints to a logger.
+
+        The time between the end of one batch and the start of the next is dataloader wait,
+        the time between start and end of a batch is compute (forward, backward, optimizer).
+
+        Args:
+            logger (AsyncMlflowLogger): Background logger.
+            upload_checkpoints (bool): Upload last.pt/best.pt after every save.
+        """
+        self.logger = logger
+        self.upload_checkpoints = upload_checkpoints
+        self.epoch_start = None
+        self.batch_start = None
+        self.last_batch_end = None
+        self.data_wait = 0.0
+        self.compute = 0.0
+        self.batches = 0
+
+    def attach(self, model):
+        for event in ("on_pretrain_routine_start", "on_train_epoch_start", "on_train_batch_start",
+                      "on_train_batch_end", "on_fit_epoch_end", "on_model_save"):
+            model.add_callback(event, getattr(self, event))
+
+    def on_pretrain_routine_start(self, trainer):
+        without_mlflow(trainer)
+
+    def on_train_epoch_start(self, trainer):
+        self.epoch_start = self.last_batch_end = time.perf_counter()
+        self.data_wait, self.compute, self.batches = 0.0, 0.0, 0
+
+    def on_train_batch_start(self, trainer):
+        self.batch_start = time.perf_counter()
+        self.data_wait += self.batch_start - self.last_batch_end
+
+    def on_train_batch_end(self, trainer):
+        self.last_batch_end = time.perf_counter()
+        self.compute += self.last_batch_end - self.batch_start
+        self.batches += 1
+
+    def on_fit_epoch_end(self, trainer):
+        metrics = dict(trainer.metrics or {})
+        metrics.update(trainer.label_loss_items(trainer.tloss, prefix="train"))
+        metrics.update(trainer.lr)
+        train_time = self.data_wait + self.compute
+        metrics.update({
+            "time/epoch_s": time.perf_counter() - self.epoch_start,
+            "time/data_wait_s": self.data_wait,
+            "time/compute_s": self.compute,
+            "time/data_wait_fraction": self.data_wait / train_time if train_time else 0.0,
+            "time/batches": self.batches,
+        })
+        self.logger.log_metrics(sanitize_metrics(metrics), step=trainer.epoch)
+
+    def on_model_save(self, trainer):
+        if not self.upload_checkpoints:
+            return
+        for path in (trainer.last, trainer.best):
+            if os.path.exists(path):
+                self.logger.log_checkpoint(str(path))
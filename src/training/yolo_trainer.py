@@ -1,11 +1,23 @@
+import hashlib
+import json
 import os
 import shutil
-from ultralytics import YOLO, settings
+import torch
+from ultralytics import YOLO
 import mlflow
 import mlflow.pytorch
+from mlflow.exceptions import MlflowException
+from src import tracing
+from src.training.autotune import TrainingAutotuner
+from src.training.cached_dataset import cached_trainer
+from src.training.mlflow_logger import AsyncMlflowLogger
+from src.training.training_monitor import TrainingMonitor
+from src.utils import sha256_of
 
 class YOLOTrainer:
-    def __init__(self, data_config_path, epochs, imgsz, batch_size, device, model_name, output_dir, mlflow_tracking_uri,  mlflow_experiment_name, weights_path=None):
+    def __init__(self, data_config_path, epochs, imgsz, batch_size, device, model_name, output_dir, mlflow_tracking_uri,  mlflow_experiment_name, weights_path=None, image_cache_dir=None,
+                 workers=None, num_threads=None, cache=None, autotune=None, extra_args=None, parent_run_id=None,
+                 callbacks=None):
         """
         Initialize the YOLOv11Trainer with training parameters.
 
@@ -18,6 +30,17 @@ class YOLOTrainer:
             model_name (str): Name of the model for MLflow run.
             output_dir (str): Directory to save training outputs.
             weights_path (str, optional): Path to pre-trained weights. If None, uses default 'yolo11m.pt'.
+            image_cache_dir (str, optional): Memory-mapped image cache built by DataProcessor.build_image_cache;
+                splits found there are read from it instead of decoding JPEGs every epoch.
+            workers (int, optional): Dataloader workers; Ultralytics' default if None.
+            num_threads (int, optional): Torch intra-op threads.
+            cache (str, optional): Image caching: 'mmap' (image_cache_dir), 'ram', 'disk' or 'none'.
+                Defaults to 'mmap' when image_cache_dir is set.
+            autotune (dict, optional): Options of autotune(); when given and training on CPU, a short
+                probe picks batch size, workers, threads and cache mode before training.
+            extra_args (dict, optional): Additional Ultralytics train arguments (lr0, momentum, ...).
+            parent_run_id (str, optional): MLflow run the training run is nested under.
+            callbacks (dict, optional): Ultralytics event -> callback added to the model before training.
         """
         self.data_config_path = data_config_path
         self.epochs = epochs
@@ -30,6 +53,62 @@ class YOLOTrainer:
         self.model = None
         self.mlflow_tracking_uri = mlflow_tracking_uri
         self. mlflow_experiment_name =  mlflow_experiment_name
+        self.image_cache_dir = image_cache_dir
+        self.workers = workers
+        self.num_threads = num_threads
+        self.cache = cache or ("mmap" if image_cache_dir else "none")
+        self.autotune_config = autotune
+        self.extra_args = extra_args or {}
+        self.parent_run_id = parent_run_id
+        self.callbacks = callbacks or {}
+        self.run_name = None
+
+    def config_hash(self):
+        """Hash everything that defines a training run, so a restart only resumes an identical run."""
+        with open(self.data_config_path, "rb") as f:
+            data_hash = hashlib.sha256(f.read()).hexdigest()
+        weights = self.weights_path or "yolo11n.pt"
+        config = {
+            "data": data_hash,
+            "epochs": self.epochs,
+            "imgsz": self.imgsz,
+            "weights": sha256_of(weights) if os.path.exists(weights) else weights,
+            "model_name": self.model_name,
+            "extra_args": self.extra_args,
+        }
+        return hashlib.sha256(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+    @property
+    def run_dir(self):
+        return os.path.join(self.output_dir, self.run_name)
+
+    @property
+    def state_path(self):
+        return os.path.join(self.run_dir, "train_state.json")
+
+    def load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path) as f:
+            return json.load(f)
+
+    def save_state(self, state):
+        os.makedirs(self.run_dir, exist_ok=True)
+        tmp_path = f"{self.state_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_path, self.state_path)
+
+    def resume_checkpoint(self, state):
+        """Return last.pt of an unfinished run with the same config hash, or None."""
+        last = os.path.join(self.run_dir, "weights", "last.pt")
+        if not state or state.get("finished") or not os.path.exists(last):
+            return None
+        # Ultralytics sets epoch to -1 when training completes; such a checkpoint cannot be resumed
+        if torch.load(last, map_location="cpu", weights_only=False).get("epoch", -1) == -1:
+            print(f"{last} is from a completed training, starting a new run.")
+            return None
+        return last
 
     def log_parameters(self):
         """Log training hyperparameters to MLflow."""
@@ -38,26 +117,79 @@ class YOLOTrainer:
         mlflow.log_param("batch_size", self.batch_size)
         mlflow.log_param("device", self.device)
         mlflow.log_param("data_config", self.data_config_path)
+        mlflow.log_param("cache", self.cache)
+        mlflow.log_param("workers", self.workers)
+        mlflow.log_param("num_threads", self.num_threads)
+        if self.extra_args:
+            mlflow.log_params(self.extra_args)
 
-    def load_model(self):
-        """Load the YOLO model, either from provided weights or default."""
-        if self.weights_path:
+    def load_model(self, checkpoint=None):
+        """Load the YOLO model, either from a checkpoint to resume, provided weights or default."""
+        if checkpoint:
+            self.model = YOLO(checkpoint)
+        elif self.weights_path:
             #if not os.path.exists(self.weights_path):
             #    raise FileNotFoundError(f"Weights file not found: {self.weights_path}")
             self.model = YOLO(self.weights_path)
         else:
             self.model = YOLO("yolo11n.pt")
 
-    def train_model(self):
-        """Train the YOLO model and return the results."""
+    def autotune(self, batch_sizes=(8, 16, 32), workers=(2, 4, 8), threads=(None,), caches=("none", "ram", "mmap"),
+                 memory_budget_gb=None, steps=20, warmup_steps=5):
+        """
+        Run short timed training probes and adopt the fastest configuration within the memory budget.
+
+        Args:
+            batch_sizes (tuple): Batch sizes to probe.
+            workers (tuple): Dataloader worker counts to probe.
+            threads (tuple): Torch intra-op thread counts to probe (None keeps torch's default).
+            caches (tuple): Cache modes to probe; 'mmap' is skipped without image_cache_dir.
+            memory_budget_gb (float, optional): Peak memory allowed for training and its workers.
+            steps (int): Timed batches per probe.
+            warmup_steps (int): Untimed batches before each measurement.
+
+        Returns:
+            dict: The chosen probe row.
+        """
+        tuner = TrainingAutotuner(
+            self.weights_path or "yolo11n.pt",
+            self.data_config_path,
+            self.imgsz,
+            os.path.join(self.output_dir, "autotune"),
+            image_cache_dir=self.image_cache_dir,
+            steps=steps,
+            warmup_steps=warmup_steps,
+        )
+        best, table = tuner.tune(list(batch_sizes), list(workers), list(threads), list(caches),
+                                 memory_budget_gb * 1024 if memory_budget_gb else None)
+        self.batch_size, self.workers, self.num_threads, self.cache = best["batch"], best["workers"], best["threads"], best["cache"]
+        print(f"Autotune picked batch={self.batch_size} workers={self.workers} threads={self.num_threads} "
+              f"cache={self.cache} ({best['images_per_s']} images/s, peak {best['peak_mb']} MB)")
+        mlflow.log_params({f"autotune_{key}": best[key] for key in ("batch", "workers", "threads", "cache")})
+        mlflow.log_metric("autotune_images_per_s", best["images_per_s"])
+        mlflow.log_dict({"probes": table, "best": best}, "autotune/probes.json")
+        return best
+
+    def train_model(self, resume=False):
+        """Train the YOLO model (or resume it from its loaded last.pt) and return the results."""
+        if self.num_threads:
+            torch.set_num_threads(self.num_threads)
+        extra = dict(self.extra_args)
+        if self.workers is not None:
+            extra["workers"] = self.workers
         results = self.model.train(
             data=self.data_config_path,
             epochs=self.epochs,
             imgsz=self.imgsz,
             batch=self.batch_size,
             device=self.device,
-            name=self.model_name,
-            project=self.output_dir
+            name=self.run_name or self.model_name,
+            project=self.output_dir,
+            exist_ok=True,
+            resume=resume,
+            cache=self.cache if self.cache in ("ram", "disk") else False,
+            trainer=cached_trainer(self.image_cache_dir) if self.cache == "mmap" and self.image_cache_dir else None,
+            **extra
         )
         return results
 
@@ -78,16 +210,69 @@ class YOLOTrainer:
         else:
             print("Best model not found at expected path.")
 
+    def start_run(self, state):
+        """Reopen the MLflow run of an interrupted training, or start a new one."""
+        run_id = state.get("mlflow_run_id")
+        if run_id:
+            try:
+                return mlflow.start_run(run_id=run_id), True
+            except MlflowException as e:
+                print(f"Could not reopen MLflow run {run_id}, starting a new one: {e}")
+        tags = {"mlflow.parentRunId": self.parent_run_id} if self.parent_run_id else None
+        return mlflow.start_run(run_name=self.model_name, tags=tags), False
+
     def train(self):
-        """Execute the training process with MLflow tracking."""
-        settings.update({"mlflow": True})
-        mlflow.set_tracking_uri(self.mlflow_tracking_uri)
+        """
+        Execute the training process with MLflow tracking.
 
+        A run with the same name and config hash that did not finish is resumed from its last.pt
+        and keeps logging to its MLflow run. Per-epoch metrics, timing and deduplicated checkpoints
+        are logged from a background thread while training runs.
+        """
+        mlflow.set_tracking_uri(self.mlflow_tracking_uri)
         mlflow.set_experiment(self.mlflow_experiment_name)
-        with mlflow.start_run(run_name=self.model_name):
-            self.log_parameters()
-            self.load_model()
-            results = self.train_model()
+
+        self.run_name = f"{self.model_name}-{self.config_hash()}"
+        state = self.load_state()
+        checkpoint = self.resume_checkpoint(state)
+        if not checkpoint:
+            state = {}
+        run, reopened = self.start_run(state)
+        with run:
+            state.update({"run_name": self.run_name, "mlflow_run_id": run.info.run_id, "finished": False})
+            state.setdefault("uploaded", {})
+            self.save_state(state)
+            if checkpoint:
+                print(f"Resuming training from {checkpoint}")
+                mlflow.set_tag("resumed_from", checkpoint)
+            else:
+                if self.autotune_config and str(self.device) == "cpu":
+                    self.autotune(**{key: value for key, value in self.autotune_config.items() if key != "enabled"})
+                elif self.autotune_config:
+                    print(f"Autotune only probes CPU training, skipping it on device '{self.device}'.")
+            if not reopened:
+                self.log_parameters()
+                mlflow.set_tag("config_hash", self.run_name.rsplit("-", 1)[1])
+
+            def persist_uploads(uploaded):
+                state["uploaded"] = uploaded
+                self.save_state(state)
+
+            self.load_model(checkpoint)
+            logger = AsyncMlflowLogger(run.info.run_id, uploaded=state["uploaded"], on_upload=persist_uploads)
+            TrainingMonitor(logger).attach(self.model)
+            for event, callback in self.callbacks.items():
+                self.model.add_callback(event, callback)
+            try:
+                with tracing.span("train.fit", epochs=self.epochs):
+                    results = self.train_model(resume=bool(checkpoint))
+            finally:
+                logger.close()
+            # Marked before the MLflow calls below, which may fail, so a rerun does not try to resume
+            state["finished"] = True
+            self.save_state(state)
             self.log_metrics(results)
+            # Spans of the steps before training (download, conversion, caching) end up on the run too
+            tracing.log_to_mlflow()
             self.save_best_model()
-            return self.model
\ No newline at end of file
+            return self.model
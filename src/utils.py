@@ -0,0 +1,88 @@
+import hashlib
+import os
+import resource
+import sys
+
+CHUNK_SIZE = 1 << 20
+
+
+def sha256_of(path):
+    """SHA-256 hex digest of a file, read in 1 MiB blocks."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(CHUNK_SIZE), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def peak_rss_mb(who=resource.RUSAGE_SELF):
+    """
+    Peak resident set size of the current process, or of its largest terminated child with
+    RUSAGE_CHILDREN (ru_maxrss is KiB on Linux, bytes on macOS).
+    """
+    peak = resource.getrusage(who).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb(pid):
+    """Current resident set size of a process from /proc/<pid>/status; 0 once it has exited."""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except (FileNotFoundError, ProcessLookupError):
+        pass
+    return 0.0
+
+
+def descendant_pids(pid=None):
+    """Live descendants of a process (default: this one), found through the parent pids in /proc."""
+    pid = pid or os.getpid()
+    children = {}
+    for entry in os.listdir("/proc") if os.path.isdir("/proc") else []:
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                # The command name may contain spaces, the fields after its closing parenthesis do not
+                ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (FileNotFoundError, ProcessLookupError, IndexError, ValueError):
+            continue
+        children.setdefault(ppid, []).append(int(entry))
+    descendants, pending = [], list(children.get(pid, []))
+    while pending:
+        child = pending.pop()
+        descendants.append(child)
+        pending.extend(children.get(child, []))
+    return descendants
+
+
+def tree_rss_mb(pid=None):
+    """
+    Current resident set size of a process and all its live descendants, summed.
+
+    Pages shared between them (e.g. copy-on-write after fork) are counted once per process,
+    so this is an upper bound. Uses psutil (installed with Ultralytics) where available, which
+    also works on macOS, and /proc otherwise.
+
+    Raises:
+        RuntimeError: If neither psutil nor /proc is available to see the descendants.
+    """
+    pid = pid or os.getpid()
+    try:
+        import psutil
+    except ImportError:
+        psutil = None
+    if psutil is not None:
+        process = psutil.Process(pid)
+        total = process.memory_info().rss
+        for child in process.children(recursive=True):
+            try:
+                total += child.memory_info().rss
+            except psutil.NoSuchProcess:
+                pass
+        return total / (1024 * 1024)
+    if not os.path.isdir("/proc"):
+        raise RuntimeError("Measuring child process memory needs psutil or /proc")
+    return rss_mb(pid) + sum(rss_mb(child) for child in descendant_pids(pid))
@@ -0,0 +1,22 @@
+import json
+import os
+import subprocess
+import sys
+import pytest
+from src.cli import IMPORT_BUDGET_MODULES
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FORBIDDEN_MODULES = ("torch", "ultralytics", "mlflow")
+
+
+@pytest.mark.parametrize("command", ["process", "explore"])
+def test_light_command_does_not_import_training_stack(command):
+    """The process and explore code paths must start without loading torch, ultralytics or mlflow."""
+    code = (
+        "import json, sys\n"
+        + "".join(f"import {module}\n" for module in IMPORT_BUDGET_MODULES[command])
+        + f"print(json.dumps([m for m in {FORBIDDEN_MODULES!r} if m in sys.modules]))\n"
+    )
+    result = subprocess.run([sys.executable, "-c", code], capture_output=True, text=True, cwd=REPO_ROOT)
+    assert result.returncode == 0, result.stderr
+    assert json.loads(result.stdout.strip().splitlines()[-1]) == []